@@ -0,0 +1,92 @@
+"""Benchmarks the question centrality backends used by `select_questions`.
+
+For every number of questions n, reports the time of each backend and, where the
+exact backend is run, how much the "tfidf" ranking agrees with the "exact" one
+(Spearman correlation of the scores and overlap of the top-k questions).
+
+    python benchmarks/question_centrality.py --sizes 50 100 200 500 1000 5000
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+from scipy.stats import spearmanr
+
+from treqa.scorers.treqa_scorer import question_centrality
+
+WH_WORDS = ["Who", "What", "When", "Where", "Why", "How many", "Which"]
+VERBS = ["wrote", "sent", "built", "founded", "visited", "described", "announced"]
+OBJECTS = [
+    "the letter",
+    "the company",
+    "the bridge",
+    "the report",
+    "the city",
+    "the new law",
+    "the festival",
+    "the museum",
+    "the agreement",
+    "the first album",
+]
+MODIFIERS = ["", " in 1998", " last year", " in Lisbon", " after the war", " again"]
+
+
+def make_questions(n: int, seed: int = 0) -> list[str]:
+    """Synthetic questions with the lexical overlap of generated question sets."""
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(WH_WORDS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}{rng.choice(MODIFIERS)}?"
+        for _ in range(n)
+    ]
+
+
+def time_backend(questions: list[str], backend: str) -> tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    scores = question_centrality(questions, backend=backend)
+    return scores, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[50, 100, 200, 500, 1000, 2000, 5000],
+        help="Numbers of questions to benchmark.",
+    )
+    parser.add_argument(
+        "--max-exact-size",
+        type=int,
+        default=500,
+        help="Largest number of questions for which the (quadratic) exact backend is run.",
+    )
+    parser.add_argument(
+        "--top-k", type=int, default=10, help="Size of the top-k overlap."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print("n\ttfidf (s)\texact (s)\tspeedup\tspearman\ttop-k overlap")
+    for n in args.sizes:
+        questions = make_questions(n, seed=args.seed)
+        tfidf_scores, tfidf_time = time_backend(questions, "tfidf")
+        if n > args.max_exact_size:
+            print(f"{n}\t{tfidf_time:.4f}\t-\t-\t-\t-")
+            continue
+        exact_scores, exact_time = time_backend(questions, "exact")
+        top_k = min(args.top_k, n)
+        overlap = len(
+            set(np.argsort(-tfidf_scores)[:top_k])
+            & set(np.argsort(-exact_scores)[:top_k])
+        )
+        print(
+            f"{n}\t{tfidf_time:.4f}\t{exact_time:.4f}\t{exact_time / tfidf_time:.0f}x"
+            f"\t{spearmanr(tfidf_scores, exact_scores)[0]:.3f}\t{overlap}/{top_k}"
+        )
+
+
+if __name__ == "__main__":
+    main()
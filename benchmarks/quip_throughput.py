@@ -0,0 +1,102 @@
+"""Benchmarks the batching of `QuipAM` on a synthetic answer-matching workload.
+
+Compares, in examples/sec, padding every input to `max_length` in input order (as
+`QuipAM` did before dynamic padding) against the length-sorted, dynamically padded
+batches of `QuipAM._score`, and checks that both give the same scores.
+
+    python benchmarks/quip_throughput.py --num-examples 256 --device cpu
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+import torch
+
+from treqa.answer_matching.quip_am import QuipAM
+
+WORDS = (
+    "the a of in to and was is for on with by at from city river bridge museum "
+    "letter report company war year people family school music festival law "
+    "built wrote moved opened founded visited announced described attended"
+).split()
+
+
+def make_workload(num_examples: int, min_words: int, max_words: int, seed: int = 0):
+    """Synthetic (question, reference, prediction, context) rows; contexts of
+    uniformly random lengths."""
+    rng = random.Random(seed)
+
+    def _text(num_words):
+        return " ".join(rng.choice(WORDS) for _ in range(num_words))
+
+    questions = [_text(rng.randint(5, 12)) + "?" for _ in range(num_examples)]
+    references = [_text(rng.randint(1, 5)) for _ in range(num_examples)]
+    predictions = [_text(rng.randint(1, 5)) for _ in range(num_examples)]
+    contexts = [_text(rng.randint(min_words, max_words)) for _ in range(num_examples)]
+    return questions, references, predictions, contexts
+
+
+def score_padded_to_max_length(am: QuipAM, input_strings: list[str]) -> list:
+    """The previous batching: every input padded to `max_length`, in input order."""
+    results = []
+    with torch.inference_mode():
+        for start in range(0, len(input_strings), am.batch_size):
+            batch = am.tokenizer(
+                input_strings[start : start + am.batch_size],
+                padding="max_length",
+                truncation=True,
+                max_length=am.max_length,
+                return_tensors="np",
+            )
+            results.extend(am._predict_batch(dict(batch)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--num-examples", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--min-context-words", type=int, default=20)
+    parser.add_argument("--max-context-words", type=int, default=150)
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    am = QuipAM(batch_size=args.batch_size, device=args.device)
+    questions, references, predictions, contexts = make_workload(
+        args.num_examples, args.min_context_words, args.max_context_words, args.seed
+    )
+    # the same input format as `QuipAM.evaluate_answers`
+    input_strings = [
+        f"{question} <q> {reference} <r> {prediction} <c> {context}"
+        for question, reference, prediction, context in zip(
+            questions, references, predictions, contexts
+        )
+    ]
+    lengths = [len(ids) for ids in am.tokenizer(input_strings)["input_ids"]]
+    print(
+        f"{args.num_examples} examples, {np.mean(lengths):.0f} tokens on average "
+        f"(max {max(lengths)}), max_length {am.max_length}"
+    )
+
+    timings = {}
+    start = time.perf_counter()
+    padded_scores = score_padded_to_max_length(am, input_strings)
+    timings["padded to max_length"] = time.perf_counter() - start
+    start = time.perf_counter()
+    dynamic_scores = am._score(input_strings)
+    timings["dynamic padding"] = time.perf_counter() - start
+
+    for name, elapsed in timings.items():
+        print(f"{name}: {args.num_examples / elapsed:.1f} examples/sec")
+    print(
+        f"speedup: {timings['padded to max_length'] / timings['dynamic padding']:.1f}x, "
+        f"max absolute score difference: "
+        f"{np.max(np.abs(np.array(padded_scores) - np.array(dynamic_scores))):.2e}"
+    )
+
+
+if __name__ == "__main__":
+    main()
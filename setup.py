@@ -19,6 +19,9 @@ setup(
         'bert-score',
         'keybert',
     ],
+    extras_require={
+        'onnx': ['onnx', 'onnxruntime'],
+    },
     entry_points={
         'console_scripts': [
             'treqa-generate=treqa.generate_qa:main',
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import litellm
+import pytest
+
+from treqa import async_litellm
+from treqa.async_litellm import AsyncLiteLLMClient, TokenBucket, is_retryable
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def make_response(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))]
+    )
+
+
+class FakeCompletion:
+    """Stands in for `litellm.acompletion`, answering each chat with its content."""
+
+    def __init__(self, failures=None, delay=lambda content: 0.0):
+        # errors to raise (in order) for a chat before answering it
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, model, messages, **kwargs):
+        content = messages[-1]["content"]
+        self.calls.append(content)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay(content))
+            errors = self.failures.get(content)
+            if errors:
+                self.failures[content] = errors[1:]
+                raise errors[0]
+            return make_response(content.upper())
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_completion(monkeypatch):
+    def _patch(**kwargs):
+        fake = FakeCompletion(**kwargs)
+        monkeypatch.setattr(litellm, "acompletion", fake)
+        return fake
+
+    return _patch
+
+
+def make_chats(contents):
+    return [[{"role": "user", "content": content}] for content in contents]
+
+
+def make_client(**kwargs):
+    return AsyncLiteLLMClient("openai/stub", base_url="http://localhost:0", **kwargs)
+
+
+def test_results_in_input_order(fake_completion):
+    contents = [f"q{i}" for i in range(20)]
+    # later chats finish first
+    fake_completion(delay=lambda content: 0.001 * (20 - int(content[1:])))
+    assert make_client().generate(make_chats(contents)) == [
+        content.upper() for content in contents
+    ]
+
+
+def test_retries_with_backoff(fake_completion, monkeypatch):
+    fake = fake_completion(failures={"a": [StatusError(429), StatusError(503)]})
+    client = make_client(max_retries=3)
+    attempts = []
+    monkeypatch.setattr(
+        client, "_backoff", lambda attempt: attempts.append(attempt) or 0.0
+    )
+    assert client.generate(make_chats(["a", "b"])) == ["A", "B"]
+    assert fake.calls.count("a") == 3
+    assert attempts == [0, 1]
+
+
+def test_backoff_is_bounded():
+    client = make_client(initial_backoff=1.0, max_backoff=5.0)
+    for attempt in range(10):
+        assert 0.0 <= client._backoff(attempt) <= min(5.0, 2.0**attempt)
+
+
+def test_non_retryable_errors_are_raised(fake_completion, monkeypatch):
+    fake = fake_completion(failures={"a": [StatusError(400)]})
+    client = make_client()
+    monkeypatch.setattr(client, "_backoff", lambda attempt: 0.0)
+    with pytest.raises(StatusError):
+        client.generate(make_chats(["a"]))
+    assert fake.calls == ["a"]
+
+
+def test_retries_are_bounded(fake_completion, monkeypatch):
+    fake = fake_completion(failures={"a": [StatusError(500)] * 5})
+    client = make_client(max_retries=2)
+    monkeypatch.setattr(client, "_backoff", lambda attempt: 0.0)
+    with pytest.raises(StatusError):
+        client.generate(make_chats(["a"]))
+    assert fake.calls == ["a"] * 3
+
+
+def test_is_retryable():
+    assert is_retryable(StatusError(429))
+    assert is_retryable(StatusError(502))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(StatusError(400))
+    assert not is_retryable(ValueError("bad request"))
+
+
+def test_concurrency_cap(fake_completion):
+    fake = fake_completion(delay=lambda content: 0.01)
+    make_client(max_concurrency=3).generate(make_chats([str(i) for i in range(12)]))
+    assert fake.max_in_flight == 3
+
+
+def test_rate_limiters_are_acquired(fake_completion, monkeypatch):
+    fake_completion()
+    acquired = []
+
+    class RecordingBucket(TokenBucket):
+        async def acquire(self, amount=1.0):
+            acquired.append((self.capacity, amount))
+            await super().acquire(amount)
+
+    monkeypatch.setattr(async_litellm, "TokenBucket", RecordingBucket)
+    client = make_client(
+        requests_per_minute=1000,
+        tokens_per_minute=10_000,
+        completion_kwargs={"max_tokens": 10},
+    )
+    client.generate(make_chats(["x" * 40, "y" * 40]))
+    # one request and 40 / 4 + 10 tokens per chat
+    assert sorted(acquired) == [(1000, 1), (1000, 1), (10_000, 20), (10_000, 20)]
+
+
+def test_token_bucket_rate():
+    async def _acquire_all():
+        bucket = TokenBucket(rate_per_minute=600, capacity=2)
+        start = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # 2 tokens are available at once, the other 3 are refilled at 10 per second
+    assert asyncio.run(_acquire_all()) >= 0.29
+
+
+def test_on_result_called_for_each_item(fake_completion):
+    fake_completion(delay=lambda content: 0.001 * (5 - int(content)))
+    persisted = {}
+    outputs = make_client().generate(
+        make_chats([str(i) for i in range(5)]),
+        on_result=lambda i, output: persisted.__setitem__(i, output),
+    )
+    assert persisted == dict(enumerate(outputs))
+
+
+def test_on_result_persists_completed_items_before_failure(fake_completion):
+    fake_completion(
+        failures={"bad": [StatusError(400)]},
+        delay=lambda content: 0.05 if content == "bad" else 0.0,
+    )
+    persisted = {}
+    with pytest.raises(StatusError):
+        make_client().generate(
+            make_chats(["a", "bad", "b"]),
+            on_result=lambda i, output: persisted.__setitem__(i, output),
+        )
+    assert persisted == {0: "A", 2: "B"}
+
+
+@pytest.fixture
+def stub_server():
+    """A local OpenAI-compatible chat completion server that answers each chat with
+    its content in upper case, after rate limiting the first two "busy" requests."""
+    requests = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            content = body["messages"][-1]["content"]
+            requests[content] += 1
+            if content == "busy" and requests[content] <= 2:
+                self._send(429, {"error": {"message": "slow down"}})
+                return
+            self._send(
+                200,
+                {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {
+                                "role": "assistant",
+                                "content": content.upper(),
+                            },
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 1,
+                        "completion_tokens": 1,
+                        "total_tokens": 2,
+                    },
+                },
+            )
+
+        def _send(self, status, payload):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", requests
+    server.shutdown()
+    thread.join()
+
+
+def test_stub_server(stub_server):
+    base_url, requests = stub_server
+    client = AsyncLiteLLMClient(
+        "openai/stub",
+        api_key="sk-stub",
+        base_url=base_url,
+        initial_backoff=0.01,
+        # retries are left to the client rather than to the OpenAI SDK
+        completion_kwargs={"max_retries": 0},
+    )
+    persisted = {}
+    outputs = client.generate(
+        make_chats(["busy", "a", "b"]),
+        on_result=lambda i, output: persisted.__setitem__(i, output),
+    )
+    assert outputs == ["BUSY", "A", "B"]
+    assert persisted == {0: "BUSY", 1: "A", 2: "B"}
+    assert requests == {"busy": 3, "a": 1, "b": 1}
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+bert_score = pytest.importorskip("bert_score")
+pytest.importorskip("vllm")
+
+from transformers import BertConfig, BertModel, BertTokenizerFast  # noqa: E402
+
+from treqa.answer_matching.bertscore_am import BertScoreAM  # noqa: E402
+
+# answers of different lengths in the same batch, and repeated pairs
+PREDICTED = [
+    "the cat",
+    "a small dog sat on the old mat near the door",
+    "paris",
+    "the cat",
+    "the dog",
+    "in 1998 after the war",
+]
+REFERENCES = [
+    "a cat",
+    "the dog sat",
+    "paris france",
+    "a cat",
+    "a cat",
+    "1998",
+]
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    """A tiny randomly initialized BERT, so that the test runs offline."""
+    path = tmp_path_factory.mktemp("tiny-bert")
+    words = sorted({word for text in PREDICTED + REFERENCES for word in text.split()})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words
+    (path / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizerFast(str(path / "vocab.txt"), model_max_length=128)
+    tokenizer.save_pretrained(path)
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+    )
+    BertModel(config).save_pretrained(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("idf", [False, True])
+def test_parity_with_bert_score(model_path, idf):
+    model = BertScoreAM(model_type=model_path, num_layers=2, idf=idf, device="cpu")
+    scores = model.evaluate_answers(
+        PREDICTED, reference_answers=REFERENCES, batch_size=4
+    )
+    _, _, expected = bert_score.score(
+        PREDICTED,
+        REFERENCES,
+        model_type=model_path,
+        num_layers=2,
+        idf=idf,
+        device="cpu",
+    )
+    np.testing.assert_allclose(scores, expected.numpy(), atol=1e-5)
+
+    # a second call is served from the embedding cache
+    cached_scores = model.evaluate_answers(
+        PREDICTED, reference_answers=REFERENCES, batch_size=4
+    )
+    np.testing.assert_allclose(cached_scores, scores)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("comet")
+# the scorers package imports the prompt models and the answer extractors
+pytest.importorskip("vllm")
+pytest.importorskip("spacy")
+pytest.importorskip("keybert")
+
+import torch  # noqa: E402
+
+from treqa.cache import MemmapEmbeddingCache  # noqa: E402
+from treqa.scorers.comet_scorer import CometScorer, build_embeddings  # noqa: E402
+
+HIDDEN_SIZE = 4
+
+
+class FakeCometModel(torch.nn.Module):
+    """Embeds each text as its length, through the COMET sentence embedding API."""
+
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.ones(1))
+        self.encoder = SimpleNamespace(
+            output_units=HIDDEN_SIZE,
+            prepare_sample=lambda texts: {
+                "input_ids": torch.tensor([[len(text)] for text in texts]),
+                "attention_mask": torch.ones(len(texts), 1),
+            },
+        )
+
+    @property
+    def device(self):
+        return self.weight.device
+
+    def get_sentence_embedding(self, input_ids, attention_mask):
+        return input_ids.float().expand(-1, HIDDEN_SIZE)
+
+    def estimate(self, src, mt, ref):
+        return SimpleNamespace(score=(src + mt + ref)[:, 0])
+
+
+def make_scorer(embedding_cache_dir=None):
+    scorer = CometScorer.__new__(CometScorer)
+    scorer.model = FakeCometModel()
+    scorer.batch_size = 2
+    scorer.use_embeddings = True
+    scorer.embedding_cache = (
+        MemmapEmbeddingCache(embedding_cache_dir) if embedding_cache_dir else None
+    )
+    return scorer
+
+
+def test_build_embeddings_keeps_input_order():
+    embeddings = build_embeddings(["ab", "a", "abcd"], FakeCometModel(), batch_size=2)
+    assert embeddings[:, 0].tolist() == [2.0, 1.0, 4.0]
+
+
+def test_build_embeddings_of_no_texts():
+    embeddings = build_embeddings([], FakeCometModel(), batch_size=2)
+    assert embeddings.shape == (0, HIDDEN_SIZE)
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_scores_of_no_segments(cached, tmp_path):
+    scorer = make_scorer(str(tmp_path) if cached else None)
+    assert scorer.get_scores_multi([[], []], sources=[], references=[]) == [[], []]
+
+
+def test_scores_of_several_systems(tmp_path):
+    scorer = make_scorer(str(tmp_path))
+    assert scorer.get_scores_multi(
+        [["a", "bb"], ["ccc", ""]], sources=["x", "yy"], references=["z", "zz"]
+    ) == [[3.0, 6.0], [5.0, 4.0]]
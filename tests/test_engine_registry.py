@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from treqa import engine_registry
+
+
+def test_release_twice_is_noop():
+    released = []
+    engine_registry.register_engine_factory(
+        "dummy", lambda model_name: ("llm", "tokenizer"), released.append
+    )
+    first = engine_registry.acquire_engine("dummy", "model")
+    second = engine_registry.acquire_engine("dummy", "model")
+    assert first is second
+    assert first.ref_count == 2
+
+    assert not engine_registry.release_engine(first)
+    assert engine_registry.release_engine(first)
+    assert released == ["llm"]
+
+    # the engine is gone, so releasing it again does nothing
+    assert not engine_registry.release_engine(first)
+    assert first.ref_count == 0
+    assert released == ["llm"]
+    assert first not in engine_registry.loaded_engines()
+
+
+def test_prompt_models_share_one_engine(monkeypatch):
+    pytest.importorskip("vllm")
+    from treqa.prompt_model import PromptModel
+
+    class ChatModel(PromptModel):
+        def prepare_chat(self, text):
+            return [{"role": "user", "content": text}]
+
+    loaded, released = [], []
+
+    def load(model_name, **engine_args):
+        loaded.append((model_name, engine_args))
+        return f"llm-{len(loaded)}", SimpleNamespace(name_or_path=model_name)
+
+    monkeypatch.setitem(
+        engine_registry._ENGINE_FACTORIES, "vllm", (load, released.append)
+    )
+    qa_model = ChatModel(provider="vllm", model_name="model", temperature=0.0)
+    am_model = ChatModel(
+        provider="vllm",
+        model_name="model",
+        temperature=0.7,
+        # resource arguments do not change the engine
+        gpu_memory_utilization=0.5,
+    )
+    other_model = ChatModel(provider="vllm", model_name="model", max_model_len=512)
+    assert len(loaded) == 2
+    assert qa_model.engine is am_model.engine
+    assert qa_model.llm is am_model.llm
+    assert other_model.engine is not qa_model.engine
+    assert qa_model.engine.ref_count == 2
+
+    engine = qa_model.engine
+    qa_model.cleanup_model()
+    # cleaning up twice does not drop the AM model's reference
+    qa_model.cleanup_model()
+    assert released == []
+    assert engine in engine_registry.loaded_engines()
+    am_model.cleanup_model()
+    assert released == ["llm-1"]
+    assert engine not in engine_registry.loaded_engines()
+    other_model.cleanup_model()
+    assert released == ["llm-1", "llm-2"]
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("vllm")
+# the scorers package imports the answer extractors
+pytest.importorskip("spacy")
+
+from treqa.scorers.gemba_scorer import (  # noqa: E402
+    TEMPLATE_GEMBA_MQM_JSON,
+    mqm_score,
+    parse_mqm_errors,
+)
+
+FREE_TEXT_ANSWER = """Critical:
+no-error
+Major:
+accuracy/mistranslation - "involvement"
+Minor:
+fluency/grammar - "wäre"
+"""
+
+
+def test_free_text_answer():
+    errors = parse_mqm_errors(FREE_TEXT_ANSWER)
+    assert errors == {
+        "critical": [],
+        "major": [{"category": "accuracy/mistranslation", "span": "involvement"}],
+        "minor": [{"category": "fluency/grammar", "span": "wäre"}],
+    }
+    assert mqm_score(errors) == -6
+
+
+def test_free_text_span_is_not_read_as_json():
+    errors = parse_mqm_errors('Major:\naccuracy/mistranslation - "{}"')
+    assert errors["major"] == [{"category": "accuracy/mistranslation", "span": "{}"}]
+    assert mqm_score(errors) == -5
+
+
+def test_structured_answer():
+    answer = '```json\n{"critical": [], "major": [{"category": "Non-translation", "span": "x"}], "minor": [{"category": "no-error", "span": ""}]}\n```'
+    errors = parse_mqm_errors(answer, structured=True)
+    # non-translations are always critical
+    assert errors == {
+        "critical": [{"category": "non-translation", "span": "x"}],
+        "major": [],
+        "minor": [],
+    }
+    # answers that ignore the schema fall back to the free-text format
+    assert parse_mqm_errors(FREE_TEXT_ANSWER, structured=True) == parse_mqm_errors(
+        FREE_TEXT_ANSWER
+    )
+
+
+def test_structured_few_shot_answers_are_valid():
+    for turn in TEMPLATE_GEMBA_MQM_JSON:
+        if turn["role"] == "assistant":
+            assert parse_mqm_errors(turn["content"], structured=True) is not None
@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+# the scorers package imports the prompt models and the answer extractors
+pytest.importorskip("vllm")
+pytest.importorskip("spacy")
+
+from treqa.scorers.keyphrase_scorer import ae_config_id, compare_keyphrases  # noqa: E402
+
+
+class FakeAE:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+def make_parent(model_name, provider="vllm", temperature=0.0):
+    return SimpleNamespace(
+        provider=provider,
+        model_name=model_name,
+        temperature=temperature,
+        top_p=1.0,
+        max_tokens=1024,
+    )
+
+
+def make_child_ae(parent, **attributes):
+    # the child's own model name is its (unused) default
+    return FakeAE(
+        provider="parent_prompt_model",
+        model_name="meta-llama/Meta-Llama-3.1-8B-Instruct",
+        parent_prompt_model=parent,
+        **attributes,
+    )
+
+
+def test_config_id_depends_on_the_parent_model():
+    ae_qwen = make_child_ae(make_parent("Qwen/Qwen2.5-7B-Instruct"))
+    ae_llama = make_child_ae(make_parent("meta-llama/Meta-Llama-3.1-8B-Instruct"))
+    assert ae_config_id(ae_qwen) != ae_config_id(ae_llama)
+    assert ae_config_id(ae_qwen) == ae_config_id(
+        make_child_ae(make_parent("Qwen/Qwen2.5-7B-Instruct"))
+    )
+    # sampling settings of the parent also change the output
+    assert ae_config_id(ae_qwen) != ae_config_id(
+        make_child_ae(make_parent("Qwen/Qwen2.5-7B-Instruct", temperature=0.7))
+    )
+
+
+def test_config_id_follows_nested_parents():
+    def _grandchild(model_name):
+        return make_child_ae(make_child_ae(make_parent(model_name)))
+
+    assert ae_config_id(_grandchild("a")) != ae_config_id(_grandchild("b"))
+
+
+def test_config_id_ignores_runtime_settings():
+    assert ae_config_id(FakeAE(model_name="m", batch_size=8)) == ae_config_id(
+        FakeAE(model_name="m", batch_size=64)
+    )
+    assert ae_config_id(FakeAE(model_name="m", top_k=5)) != ae_config_id(
+        FakeAE(model_name="m", top_k=10)
+    )
+
+
+def test_compare_keyphrases():
+    scores = compare_keyphrases(
+        [["a", "b"], ["a"], [], ["x", "x"]],
+        [["b", "c"], ["a"], ["a"], ["x"]],
+    )
+    assert scores == pytest.approx([1 / 3, 1.0, 0.0, 1.0])
@@ -0,0 +1,55 @@
+import pytest
+
+# the question generation package imports the prompt models
+pytest.importorskip("vllm")
+
+from treqa.question_generation.near_duplicates import (  # noqa: E402
+    MinHashLSH,
+    cluster_near_duplicates,
+    collapse_near_duplicates,
+)
+
+
+def test_paraphrase_merged():
+    qa_pairs = [
+        ("What is the capital city of France?", "Paris"),
+        ("Who founded Microsoft?", "Bill Gates"),
+        ("What is the capital of France?", "paris."),
+        ("Who founded Microsoft ?", "Bill Gates"),
+    ]
+    collapsed, stats = collapse_near_duplicates([qa_pairs])
+    assert collapsed == [[qa_pairs[0], qa_pairs[1]]]
+    assert stats["num_questions_before"] == 4
+    assert stats["num_questions_after"] == 2
+    assert stats["collapse_ratio"] == 0.5
+
+
+def test_entity_swap_kept():
+    qa_pairs = [
+        ("What is the capital of France?", "Paris"),
+        ("What is the capital of Germany?", "Berlin"),
+        ("How many people live in Lisbon?", "545,000"),
+        ("How many people work in Lisbon?", "300,000"),
+    ]
+    collapsed, stats = collapse_near_duplicates([qa_pairs], threshold=0.5)
+    assert collapsed == [qa_pairs]
+    assert stats["collapse_ratio"] == 0.0
+
+
+def test_clusters_do_not_chain():
+    # the second question is similar to both others, which are not similar enough
+    questions = [
+        "What is the capital city of France?",
+        "What is the capital of France?",
+        "What was the capital of France?",
+    ]
+    clusters = cluster_near_duplicates(questions, ["Paris"] * 3, MinHashLSH())
+    assert clusters == [0, 0, 2]
+
+
+def test_few_questions():
+    assert cluster_near_duplicates([], [], MinHashLSH()) == []
+    assert cluster_near_duplicates(["Who?"], ["Me"], MinHashLSH()) == [0]
+    collapsed, stats = collapse_near_duplicates([[], [("Who?", "Me")]])
+    assert collapsed == [[], [("Who?", "Me")]]
+    assert stats["collapse_ratio"] == 0.0
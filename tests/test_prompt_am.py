@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("vllm")
+
+from treqa.answer_matching.prompt_am import PromptAM  # noqa: E402
+
+
+def make_prompt_am(expected_scores):
+    # skip PromptModel.__init__, which loads an engine
+    model = PromptAM.__new__(PromptAM)
+    model.minimum_val = 0.0
+    model.maximum_val = 5.0
+    model.normalize_scores = False
+    model.num_runs = 1
+    model.expected_scores = expected_scores
+    model.logprobs = None
+    model.generate_logprobs = lambda chats, num_logprobs: [
+        {"5": math.log(0.75), "3": math.log(0.25)} for _ in chats
+    ]
+    return model
+
+
+def test_return_distribution():
+    model = make_prompt_am(expected_scores=True)
+    scores, distributions = model.evaluate_answers(
+        ["an answer"], questions=["a question"], contexts=["a context"],
+        return_distribution=True,
+    )
+    assert scores == [pytest.approx(4.5)]
+    assert distributions == [pytest.approx([0.0, 0.0, 0.25, 0.0, 0.75])]
+
+    scores = model.evaluate_answers(
+        ["an answer"], questions=["a question"], contexts=["a context"]
+    )
+    assert scores == [pytest.approx(4.5)]
+
+
+def test_return_distribution_requires_expected_scores():
+    model = make_prompt_am(expected_scores=False)
+    with pytest.raises(ValueError):
+        model.evaluate_answers(
+            ["an answer"], questions=["a question"], contexts=["a context"],
+            return_distribution=True,
+        )
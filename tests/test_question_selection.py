@@ -0,0 +1,73 @@
+from difflib import SequenceMatcher
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sklearn")
+pytest.importorskip("vllm")
+pytest.importorskip("spacy")
+
+from treqa.scorers.treqa_scorer import question_centrality, select_questions  # noqa: E402
+
+
+@pytest.mark.parametrize("backend", ["tfidf", "exact"])
+def test_centrality_of_few_or_empty_questions(backend):
+    assert len(question_centrality([], backend=backend)) == 0
+    assert question_centrality(["What is it?"], backend=backend).tolist() == [0.0]
+    # identical empty questions are equally central
+    scores = question_centrality(["", ""], backend=backend)
+    assert np.isfinite(scores).all()
+    assert scores[0] == scores[1]
+
+
+@pytest.mark.parametrize("backend", ["tfidf", "exact"])
+def test_similarity_selection_of_empty_chunks(backend):
+    assert select_questions(
+        [[], []],
+        1,
+        2,
+        num_questions=2,
+        select_strategy="similarity",
+        similarity_backend=backend,
+    ) == [[], []]
+
+
+@pytest.mark.parametrize("backend", ["tfidf", "exact"])
+def test_similarity_selection_picks_central_questions(backend):
+    questions = [
+        ["Who wrote the letter?", "Who wrote the letters?"],
+        ["Where is Lisbon?", "Who wrote the letter to her?"],
+    ]
+    selected = select_questions(
+        questions,
+        1,
+        2,
+        num_questions=2,
+        select_strategy="similarity",
+        similarity_backend=backend,
+    )
+    assert "Where is Lisbon?" not in selected[0]
+    assert selected[0] == selected[1]
+
+
+def test_default_backend_keeps_the_pairwise_ranking():
+    questions = [
+        ["Who wrote the letter?", "When was it sent?", "Who wrote it?"],
+        ["Where was the letter sent?", "Who sent the letter?", "What is it?"],
+    ]
+    all_questions = [q for chunk in questions for q in chunk]
+    # the original scoring: summed SequenceMatcher ratios over all ordered pairs
+    expected_scores = [
+        sum(
+            SequenceMatcher(None, q1, q2).ratio()
+            for j, q2 in enumerate(all_questions)
+            if i != j
+        )
+        for i, q1 in enumerate(all_questions)
+    ]
+    expected = [all_questions[i] for i in np.argsort(-np.array(expected_scores))[:3]]
+    selected = select_questions(
+        questions, 1, 2, num_questions=3, select_strategy="similarity"
+    )
+    assert selected == [expected, expected]
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("vllm")
+
+from treqa.answer_matching import quip_am  # noqa: E402
+from treqa.answer_matching.quip_am import (  # noqa: E402
+    QUIP_MODEL_NAME,
+    QuipAM,
+    available_cpus,
+)
+
+QUESTIONS = [
+    "Who wrote the letter?",
+    "When was the bridge built?",
+    "Where did she move to?",
+    "How many people attended?",
+]
+REFERENCE_ANSWERS = ["Maria", "in 1966", "Lisbon", "about 300 people"]
+PREDICTED_ANSWERS = ["Maria", "in 1866", "to Porto", "300"]
+CONTEXTS = [
+    "Maria wrote the letter to her brother.",
+    "The bridge over the Tagus was built in 1966.",
+    "After the war, she moved to Lisbon with her family.",
+    "About 300 people attended the opening of the museum.",
+]
+
+
+def test_available_cpus_without_affinity(monkeypatch):
+    assert available_cpus() >= 1
+    # e.g. on macOS and Windows
+    monkeypatch.delattr(os, "sched_getaffinity", raising=False)
+    assert available_cpus() == (os.cpu_count() or 1)
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory):
+    """A tiny randomly initialized BERT classifier, so that the test runs offline.
+
+    BERT also takes `token_type_ids`, which `forward` expects after the attention
+    mask, unlike the tokenizer's input names.
+    """
+    from transformers import (
+        BertConfig,
+        BertForSequenceClassification,
+        BertTokenizerFast,
+    )
+
+    path = tmp_path_factory.mktemp("tiny-quip")
+    texts = QUESTIONS + REFERENCE_ANSWERS + PREDICTED_ANSWERS + CONTEXTS
+    words = sorted({word.strip(".?") for text in texts for word in text.split()})
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "<", ">"] + words
+    (path / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizerFast(str(path / "vocab.txt"), model_max_length=512)
+    tokenizer.save_pretrained(path)
+    config = BertConfig(
+        vocab_size=len(vocab),
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+        num_labels=1,
+    )
+    BertForSequenceClassification(config).save_pretrained(path)
+    return str(path)
+
+
+@pytest.mark.parametrize("quantize, tolerance", [(False, 1e-5), (True, 0.05)])
+def test_onnx_parity_with_torch_on_tiny_model(
+    tiny_model_path, tmp_path, monkeypatch, quantize, tolerance
+):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    monkeypatch.setattr(quip_am, "QUIP_MODEL_NAME", tiny_model_path)
+    am = QuipAM(
+        backend="onnx", onnx_cache_dir=str(tmp_path), quantize=quantize, batch_size=2
+    )
+    max_diff = am.check_parity(
+        PREDICTED_ANSWERS,
+        QUESTIONS,
+        REFERENCE_ANSWERS,
+        CONTEXTS,
+        tolerance=tolerance,
+    )
+    assert max_diff <= tolerance
+
+
+@pytest.fixture(scope="module")
+def onnx_cache_dir(tmp_path_factory):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from transformers import AutoConfig
+
+    try:
+        AutoConfig.from_pretrained(QUIP_MODEL_NAME)
+    except OSError:
+        pytest.skip(f"{QUIP_MODEL_NAME} is not available")
+    return str(tmp_path_factory.mktemp("onnx"))
+
+
+@pytest.mark.parametrize("quantize, tolerance", [(False, 1e-3), (True, 0.1)])
+def test_onnx_parity_with_torch(onnx_cache_dir, quantize, tolerance):
+    # with the QuIP checkpoint itself
+    am = QuipAM(
+        backend="onnx", onnx_cache_dir=onnx_cache_dir, quantize=quantize, batch_size=2
+    )
+    max_diff = am.check_parity(
+        PREDICTED_ANSWERS,
+        QUESTIONS,
+        REFERENCE_ANSWERS,
+        CONTEXTS,
+        tolerance=tolerance,
+    )
+    assert max_diff <= tolerance
+
+
+def test_scores_are_restored_to_input_order(tiny_model_path):
+    from transformers import AutoTokenizer
+
+    # skip __init__, which loads the model; the model is stubbed by `_predict_batch`
+    am = QuipAM.__new__(QuipAM)
+    am.tokenizer = AutoTokenizer.from_pretrained(tiny_model_path)
+    am.batch_size = 2
+    am.max_length = 48
+    am.backend = "torch"
+    am.dedup_stats = quip_am.DedupStats("quip_am")
+
+    def _predict_batch(batch):
+        # a "score" that identifies the (truncated) input: its length and token ids
+        mask = batch["attention_mask"].astype(bool)
+        return [
+            [row_mask.sum(), input_ids[row_mask].sum()]
+            for input_ids, row_mask in zip(batch["input_ids"], mask)
+        ]
+
+    am._predict_batch = _predict_batch
+
+    # inputs of very different lengths (some truncated), with repeated rows
+    order = [3, 0, 2, 1, 3, 0, 1]
+    questions = [QUESTIONS[i] for i in order]
+    references = [REFERENCE_ANSWERS[i] for i in order]
+    predictions = [PREDICTED_ANSWERS[i] for i in order]
+    contexts = [CONTEXTS[i] * (1 + i) for i in order]
+    scores = am.evaluate_answers(predictions, questions, references, contexts)
+
+    for score, question, reference, prediction, context in zip(
+        scores, questions, references, predictions, contexts
+    ):
+        input_ids = am.tokenizer(
+            f"{question} <q> {reference} <r> {prediction} <c> {context}",
+            truncation=True,
+            max_length=am.max_length,
+        )["input_ids"]
+        np.testing.assert_array_equal(score, [len(input_ids), sum(input_ids)])
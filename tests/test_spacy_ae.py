@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("spacy")
+# the answer extraction package imports the prompt models and KeyBERT
+pytest.importorskip("vllm")
+pytest.importorskip("keybert")
+
+import spacy  # noqa: E402
+from spacy.tokens import Doc, Span  # noqa: E402
+
+from treqa.answer_extraction.spacy_ae import (  # noqa: E402
+    ALL_STRATEGY,
+    NER_STRATEGY,
+    NP_CHUNKS_STRATEGY,
+    TEXTRANK_STRATEGY,
+    SpacyAE,
+)
+
+
+@pytest.fixture
+def doc():
+    """A parsed "Marie Curie won the Nobel Prize. She lived in Paris." (built by
+    hand, so that no pipeline needs to be downloaded)."""
+    vocab = spacy.blank("en").vocab
+    doc = Doc(
+        vocab,
+        words="Marie Curie won the Nobel Prize . She lived in Paris .".split(),
+        pos="PROPN PROPN VERB DET PROPN PROPN PUNCT PRON VERB ADP PROPN PUNCT".split(),
+        heads=[1, 2, 2, 5, 5, 2, 2, 8, 8, 8, 9, 8],
+        deps="compound nsubj ROOT det compound dobj punct nsubj ROOT prep pobj punct".split(),
+        sent_starts=[True] + [False] * 6 + [True] + [False] * 4,
+    )
+    doc.ents = [
+        Span(doc, 0, 2, label="PERSON"),
+        Span(doc, 3, 6, label="WORK_OF_ART"),
+        Span(doc, 10, 11, label="GPE"),
+    ]
+    return doc
+
+
+def make_ae(strategy, monkeypatch, textrank_phrases=()):
+    # without `lp`, no pipeline is loaded upfront
+    ae = SpacyAE(strategy=strategy)
+    monkeypatch.setattr(ae, "_get_tr_answers", lambda doc: list(textrank_phrases))
+    return ae
+
+
+def test_all_strategy_combines_every_strategy(doc, monkeypatch):
+    ae = make_ae(
+        ALL_STRATEGY, monkeypatch, textrank_phrases=["Nobel Prize", "Marie Curie"]
+    )
+    assert ae._extract_answers_from_doc(doc, None) == [
+        "Nobel Prize",
+        "Marie Curie",
+        "the Nobel Prize",
+        "She",
+        "Paris",
+    ]
+
+
+def test_all_strategy_without_textrank_phrases(doc, monkeypatch):
+    answers = make_ae(ALL_STRATEGY, monkeypatch)._extract_answers_from_doc(doc, None)
+    assert set(answers) >= {"Marie Curie", "the Nobel Prize", "Paris"}
+    assert len(answers) == len(set(answers))
+
+
+def test_single_strategies(doc, monkeypatch):
+    assert make_ae(NP_CHUNKS_STRATEGY, monkeypatch)._extract_answers_from_doc(
+        doc, None
+    ) == ["Marie Curie", "the Nobel Prize", "She", "Paris"]
+    assert make_ae(NER_STRATEGY, monkeypatch)._extract_answers_from_doc(doc, None) == [
+        "Marie Curie",
+        "the Nobel Prize",
+        "Paris",
+    ]
+    assert make_ae(
+        TEXTRANK_STRATEGY, monkeypatch, textrank_phrases=["Nobel Prize"]
+    )._extract_answers_from_doc(doc, None) == ["Nobel Prize"]
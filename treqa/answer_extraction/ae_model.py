@@ -7,6 +7,7 @@ class BaseAEModel(ABC):
         self,
         passages: list[str],
         num_answers: int | None = None,
+        langs: list[str] | None = None,
     ) -> list[list[str]]:
         """
         Extracts answers from the given sources and targets.
@@ -14,6 +15,7 @@ class BaseAEModel(ABC):
         Args:
             texts (List[str]): List of texts to extract text from.
             num_answers (int | None): Number of answers to generate per target.
+            langs (List[str] | None): Language of each text, for language-specific models.
 
         Returns:
             List[List[str]]: List of lists of answer spans.
@@ -1,7 +1,66 @@
+import os
+
+import numpy as np
 from keybert import KeyBERT
+from sklearn.feature_extraction.text import CountVectorizer
+from tqdm import tqdm
 
+from ..cache import EmbeddingCache
 from .ae_model import BaseAEModel
 
+DEFAULT_TOP_N = 5
+DEFAULT_EMBEDDING_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "treqa", "embeddings"
+)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def select_mmr(
+    doc_similarities: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    mask: np.ndarray,
+    top_n: int,
+    diversity: float,
+) -> np.ndarray:
+    """Maximal Marginal Relevance over a batch of documents, as in KeyBERT.
+
+    Args:
+        doc_similarities: (docs, candidates) similarity of each candidate to its document.
+        candidate_embeddings: (docs, candidates, dim) normalized candidate embeddings.
+        mask: (docs, candidates) whether each candidate slot is used.
+
+    Returns:
+        (docs, top_n) indices of the selected candidates, in selection order (-1 if a
+        document has fewer candidates).
+    """
+    num_docs, num_candidates = doc_similarities.shape
+    doc_range = np.arange(num_docs)
+    selected = np.full((num_docs, top_n), -1)
+    available = mask.copy()
+    # similarity of every candidate to its closest selected candidate
+    max_similarities = np.full((num_docs, num_candidates), -np.inf)
+    for step in range(min(top_n, num_candidates)):
+        if step == 0:
+            scores = doc_similarities
+        else:
+            scores = (1 - diversity) * doc_similarities - diversity * max_similarities
+        scores = np.where(available, scores, -np.inf)
+        best = scores.argmax(axis=1)
+        valid = available[doc_range, best]
+        selected[:, step] = np.where(valid, best, -1)
+        available[doc_range, best] = False
+
+        best_embeddings = candidate_embeddings[doc_range, best]
+        max_similarities = np.maximum(
+            max_similarities,
+            np.einsum("dce,de->dc", candidate_embeddings, best_embeddings),
+        )
+    return selected
+
 
 class KeyBertAE(BaseAEModel):
     def __init__(
@@ -12,31 +71,123 @@ class KeyBertAE(BaseAEModel):
         diversity: float = 0.7,
         model: str = "all-MiniLM-L6-v2",
         nr_candidates: int = 20,
+        stop_words: str | None = "english",
+        # candidate embeddings of a batch take docs x candidates x dim floats
+        batch_size: int = 64,
+        embedding_cache_dir: str | None = DEFAULT_EMBEDDING_CACHE_DIR,
     ):
         """Task-specific question generation models."""
         self.kw_model = KeyBERT(model=model)
+        self.model_name = model
         self.keyphrase_ngram_range = keyphrase_ngram_range
         self.use_maxsum = use_maxsum
         self.use_mmr = use_mmr
         self.diversity = diversity
         self.nr_candidates = nr_candidates
+        self.stop_words = stop_words
+        self.batch_size = batch_size
+
+        # n-gram (and document) embeddings are reused across batches and runs
+        self.embedding_cache = None
+        if embedding_cache_dir is not None:
+            self.embedding_cache = EmbeddingCache(
+                os.path.join(embedding_cache_dir, f"{model.replace('/', '--')}.sqlite")
+            )
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        """Returns normalized embeddings for (unique) texts, computing only cache misses."""
+        cached = (
+            self.embedding_cache.get_many(texts)
+            if self.embedding_cache is not None
+            else [None] * len(texts)
+        )
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        if missing:
+            new_embeddings = self.kw_model.model.embed([texts[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                cached[i] = np.asarray(embedding, dtype=np.float32)
+            if self.embedding_cache is not None:
+                self.embedding_cache.put_many([(texts[i], cached[i]) for i in missing])
+        return _normalize(np.stack(cached))
+
+    def _extract_batch(self, passages: list[str], top_n: int) -> list[list[str]]:
+        try:
+            vectorizer = CountVectorizer(
+                ngram_range=self.keyphrase_ngram_range, stop_words=self.stop_words
+            )
+            counts = vectorizer.fit_transform(passages)
+        except ValueError:
+            # no candidate keyphrases in the whole batch
+            return [[] for _ in passages]
+        words = vectorizer.get_feature_names_out()
+
+        # embed documents and all candidate n-grams of the batch at once
+        doc_embeddings = self._embed(passages)
+        word_embeddings = self._embed(list(words))
+
+        candidates = [counts[i].indices for i in range(len(passages))]
+        max_candidates = max(len(c) for c in candidates)
+        if max_candidates == 0:
+            return [[] for _ in passages]
+
+        # pad candidates to (docs, max_candidates)
+        candidate_ids = np.zeros((len(passages), max_candidates), dtype=int)
+        mask = np.zeros((len(passages), max_candidates), dtype=bool)
+        for i, c in enumerate(candidates):
+            candidate_ids[i, : len(c)] = c
+            mask[i, : len(c)] = True
+        candidate_embeddings = word_embeddings[candidate_ids]
+        doc_similarities = np.einsum(
+            "dce,de->dc", candidate_embeddings, doc_embeddings
+        )
+
+        if self.use_mmr:
+            selected = select_mmr(
+                doc_similarities, candidate_embeddings, mask, top_n, self.diversity
+            )
+        elif self.use_maxsum:
+            from keybert._maxsum import max_sum_distance
+
+            # the combinatorial search does not vectorize, so it runs per document
+            keywords = []
+            for i, c in enumerate(candidates):
+                if len(c) == 0:
+                    keywords.append([])
+                    continue
+                extracted_kws = max_sum_distance(
+                    doc_embeddings[i : i + 1],
+                    word_embeddings[c],
+                    list(words[c]),
+                    top_n,
+                    self.nr_candidates,
+                )
+                keywords.append([x[0] for x in extracted_kws])
+            return keywords
+        else:
+            scores = np.where(mask, doc_similarities, -np.inf)
+            selected = np.argsort(-scores, axis=1)[:, :top_n]
+            selected = np.where(
+                np.take_along_axis(mask, selected, axis=1), selected, -1
+            )
+
+        return [
+            [words[candidate_ids[i, j]] for j in selected[i] if j >= 0]
+            for i in range(len(passages))
+        ]
 
     def extract_answers(
         self,
         passages: list[str],
         num_answers: int | None = None,
+        langs: list[str] | None = None,  # not used by this model
     ) -> list[list[str]]:
+        top_n = num_answers or DEFAULT_TOP_N
 
         keywords = []
-        for text in passages:
-            extracted_kws = self.kw_model.extract_keywords(
-                text,
-                keyphrase_ngram_range=self.keyphrase_ngram_range,
-                use_mmr=self.use_mmr,
-                use_maxsum=self.use_maxsum,
-                diversity=self.diversity,
-                top_n=num_answers,
-                nr_candidates=self.nr_candidates,
+        for start in tqdm(range(0, len(passages), self.batch_size)):
+            keywords.extend(
+                self._extract_batch(passages[start : start + self.batch_size], top_n)
             )
-            keywords.append([x[0] for x in extracted_kws])
+        if self.embedding_cache is not None:
+            self.embedding_cache.report("keybert embeddings")
         return keywords
@@ -49,31 +49,19 @@ class PromptAE(PromptModel, BaseAEModel):
         self,
         provider="vllm",
         model_name="meta-llama/Meta-Llama-3.1-8B-Instruct",
-        max_tokens=1024,
-        max_model_len=None,
-        temperature=0.0,
         top_p=0.9,
-        tensor_parallel_size=1,
-        base_url="https://cmu.litellm.ai",
-        api_key=None,
-        template="standard",
-        parent_prompt_model=None,
         gpu_memory_utilization=0.7,
+        template="standard",
         system_template="standard",
         extract_from="target",
+        **prompt_model_kwargs,
     ):
         super().__init__(
             provider=provider,
             model_name=model_name,
-            max_tokens=max_tokens,
-            max_model_len=max_model_len,
-            temperature=temperature,
             top_p=top_p,
-            tensor_parallel_size=tensor_parallel_size,
-            base_url=base_url,
-            api_key=api_key,
-            parent_prompt_model=parent_prompt_model,
             gpu_memory_utilization=gpu_memory_utilization,
+            **prompt_model_kwargs,
         )
         self.template = template_dict[template]
         self.system_prompt = system_prompt_dict[system_template]
@@ -115,6 +103,7 @@ class PromptAE(PromptModel, BaseAEModel):
         self,
         passages: list[str],
         num_answers: int | None = None,
+        langs: list[str] | None = None,  # not used by this model
     ) -> list[list[str]]:
         if not num_answers:
             num_answers = NUM_ANSWERS_DEFAULT
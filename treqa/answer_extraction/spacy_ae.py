@@ -1,7 +1,9 @@
 """Modified from https://github.com/danieldeutsch/qaeval/blob/master/qaeval/answer_selection.py"""
 
+import gc
 import spacy
 import random
+from collections import OrderedDict
 from spacy.tokens import Span, Doc
 from tqdm import tqdm
 
@@ -22,6 +24,17 @@ STRATEGIES = [
     ALL_STRATEGY,
 ]
 
+# components each strategy needs; all other components are disabled
+# (None keeps the full pipeline)
+PARSER_COMPONENTS = {"tok2vec", "tagger", "morphologizer", "attribute_ruler", "parser"}
+REQUIRED_COMPONENTS = {
+    NP_CHUNKS_STRATEGY: PARSER_COMPONENTS,
+    MAX_NP_STRATEGY: PARSER_COMPONENTS,
+    NER_STRATEGY: {"tok2vec", "ner"},
+    TEXTRANK_STRATEGY: None,
+    ALL_STRATEGY: None,
+}
+
 MODELS = {
     "en": "en_core_web_sm",
     "ja": "ja_core_news_sm",
@@ -35,24 +48,98 @@ MODELS = {
 }
 
 
+class SpacyModelPool:
+    """Loads spaCy pipelines lazily, one per language, keeping at most `max_models`
+    of them in memory and dropping the least recently used one first.
+
+    Models are counted rather than measured: the `*_sm` pipelines in `SPACY_MODELS`
+    are of similar size (tens of MB each), so the number of loaded models bounds
+    the memory used. Lower `max_models` when using larger pipelines.
+    """
+
+    def __init__(self, load_fn, max_models: int = 2):
+        assert max_models > 0, "Must keep at least one model loaded"
+        self.load_fn = load_fn
+        self.max_models = max_models
+        self.models = OrderedDict()
+
+    def get(self, lang: str):
+        if lang in self.models:
+            self.models.move_to_end(lang)
+            return self.models[lang]
+        while len(self.models) >= self.max_models:
+            self.models.popitem(last=False)
+            gc.collect()
+        self.models[lang] = self.load_fn(lang)
+        return self.models[lang]
+
+
 class SpacyAE(BaseAEModel):
-    def __init__(self, lp: str, strategy: str = "all", extract_from="target"):
-        """Task-specific question generation models."""
+    def __init__(
+        self,
+        lp: str | None = None,
+        strategy: str = "all",
+        extract_from="target",
+        batch_size: int = 256,
+        n_process: int = 1,
+        max_loaded_models: int = 2,
+    ):
+        """Task-specific question generation models.
+
+        `lp` is the default language (or language pair, e.g. "en-de"), used for
+        passages without a language of their own (see `extract_answers`).
+        `max_loaded_models` is the number of spaCy pipelines kept loaded at once
+        (see `SpacyModelPool`).
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy: {strategy}")
         self.strategy = strategy
-        self.nlp = spacy.load(MODELS[lp])
+        self.batch_size = batch_size
+        self.n_process = n_process
         if extract_from not in ["target", "source"]:
             raise ValueError(
                 "Please specify from where the keyphrases should be extracted: 'source' or 'target'."
             )
         else:
             self.extract_from = extract_from
+
+        self.lp = lp
+        self.pool = SpacyModelPool(self._load_nlp, max_models=max_loaded_models)
+        if lp is not None:
+            # load the default model upfront, to fail early
+            self.pool.get(self._model_lang(lp))
+
+    @property
+    def nlp(self):
+        return self.pool.get(self._model_lang(self.lp))
+
+    def _model_lang(self, lp: str) -> str:
+        # for language pairs, use the side we extract from
+        if "-" in lp:
+            src_lang, tgt_lang = lp.split("-")
+            return tgt_lang if self.extract_from == "target" else src_lang
+        return lp
+
+    def _load_nlp(self, lang: str):
+        if lang not in MODELS:
+            raise ValueError(f"No spaCy model for language: {lang}")
+        nlp = spacy.load(MODELS[lang])
+        if REQUIRED_COMPONENTS[self.strategy] is not None:
+            nlp.select_pipes(
+                disable=[
+                    name
+                    for name in nlp.pipe_names
+                    if name not in REQUIRED_COMPONENTS[self.strategy]
+                ]
+            )
         if (
             self.strategy == "all" or self.strategy == "textrank"
         ):  # ['textrank', 'biasedtextrank', 'positionrank']
-            # Is this used?
+            # "all" adds the textrank phrases to the other strategies' answers
             import pytextrank  # noqa
 
-            self.nlp.add_pipe("textrank")
+            nlp.add_pipe("textrank")
+        return nlp
 
     def _get_np_chunks_answers(self, sentence: Span) -> list[str]:
         chunks = []
@@ -69,18 +156,12 @@ class SpacyAE(BaseAEModel):
             node = nodes.pop()
 
             # If the node is a noun, collect all of the tokens
-            # which are descendants of this node
+            # which are descendants of this node (its subtree, which spaCy
+            # already tracks through the left and right edges)
             recurse = True
             if node.pos_ in ["NOUN", "PROPN"]:
-                min_index = node.i
-                max_index = node.i
-                stack = [node]
-                while len(stack) > 0:
-                    current = stack.pop()
-                    min_index = min(min_index, current.i)
-                    max_index = max(max_index, current.i)
-                    for child in current.children:
-                        stack.append(child)
+                min_index = node.left_edge.i
+                max_index = node.right_edge.i
 
                 sent_start_index = sentence[0].i
 
@@ -100,7 +181,7 @@ class SpacyAE(BaseAEModel):
 
         return nps
 
-    def _get_ner_answers(self, sentence: Span) -> list[str]:
+    def _get_ner_answers(self, sentence: Span | Doc) -> list[str]:
         ners = []
         for entity in sentence.ents:
             if entity.label_ in [
@@ -123,31 +204,40 @@ class SpacyAE(BaseAEModel):
         return keyphrases
 
     def _get_all_answers(self, sentence: Span) -> list[str]:
-        answers = set()
-        answers |= set(self._get_np_chunks_answers(sentence))
-        answers |= set(self._get_max_np_answers(sentence))
-        answers |= set(self._get_ner_answers(sentence))
-        return list(answers)
+        # unique answers, in a deterministic order
+        return list(
+            dict.fromkeys(
+                self._get_np_chunks_answers(sentence)
+                + self._get_max_np_answers(sentence)
+                + self._get_ner_answers(sentence)
+            )
+        )
 
-    def _extract_answer_text(self, text: str, num_answers: int | None) -> list[str]:
+    def _extract_answers_from_doc(
+        self, doc: Doc, num_answers: int | None
+    ) -> list[str]:
         """
-        Selects a list of noun phrases from the input `text.
+        Selects a list of noun phrases from the parsed `doc`.
         """
-        doc = self.nlp(text)
         answers = []
 
-        if self.strategy == TEXTRANK_STRATEGY or self.strategy == ALL_STRATEGY:
+        if self.strategy == TEXTRANK_STRATEGY:
+            answers.extend(self._get_tr_answers(doc))
+        elif self.strategy == NER_STRATEGY:
+            # entities do not need sentence boundaries (and so the parser)
+            answers.extend(self._get_ner_answers(doc))
+        elif self.strategy == ALL_STRATEGY:
+            # textrank phrases, and the noun phrases and entities of every sentence
             answers.extend(self._get_tr_answers(doc))
+            for sent in doc.sents:
+                answers.extend(self._get_all_answers(sent))
+            answers = list(dict.fromkeys(answers))
         else:
             for sent in doc.sents:
                 if self.strategy == NP_CHUNKS_STRATEGY:
                     answers.extend(self._get_np_chunks_answers(sent))
                 elif self.strategy == MAX_NP_STRATEGY:
                     answers.extend(self._get_max_np_answers(sent))
-                elif self.strategy == NER_STRATEGY:
-                    answers.extend(self._get_ner_answers(sent))
-                elif self.strategy == ALL_STRATEGY:
-                    answers.extend(self._get_all_answers(sent))
                 else:
                     raise Exception(f"Unknown strategy: {self.strategy}")
         if num_answers:
@@ -159,5 +249,28 @@ class SpacyAE(BaseAEModel):
         self,
         passages: list[str],
         num_answers: int | None = None,
+        langs: list[str] | None = None,
     ) -> list[list[str]]:
-        return [self._extract_answer_text(text, num_answers) for text in tqdm(passages)]
+        if langs is None:
+            assert self.lp is not None, "Must provide either lp or per-passage langs"
+            langs = [self.lp] * len(passages)
+        assert len(langs) == len(passages), "Must provide one language per passage"
+
+        # group passages by language, so that each model is loaded once and
+        # processes its passages in batches
+        indices_per_lang = OrderedDict()
+        for idx, lp in enumerate(langs):
+            indices_per_lang.setdefault(self._model_lang(lp), []).append(idx)
+
+        answers = [None] * len(passages)
+        with tqdm(total=len(passages)) as pbar:
+            for lang, indices in indices_per_lang.items():
+                docs = self.pool.get(lang).pipe(
+                    (passages[i] for i in indices),
+                    batch_size=self.batch_size,
+                    n_process=self.n_process,
+                )
+                for idx, doc in zip(indices, docs):
+                    answers[idx] = self._extract_answers_from_doc(doc, num_answers)
+                    pbar.update(1)
+        return answers
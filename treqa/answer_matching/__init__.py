@@ -4,6 +4,7 @@ from .exactmatch_am import ExactmatchAM
 from .quip_am import QuipAM
 from .prompt_am import PromptAM
 from .bertscore_am import BertScoreAM
+from .cascade_am import CascadeAM
 
 AM_MODELS_REGISTRY = {
     "chrf": ChrfAM,
@@ -11,4 +12,5 @@ AM_MODELS_REGISTRY = {
     "quip": QuipAM,
     "prompt_am": PromptAM,
     "bertscore_am": BertScoreAM,
+    "cascade_am": CascadeAM,
 }
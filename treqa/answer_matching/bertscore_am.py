@@ -1,14 +1,142 @@
-from bert_score import score
+import os
+import sys
+from collections import OrderedDict, defaultdict
 
+import numpy as np
+import torch
+from torch.nn.utils.rnn import pad_sequence
+from bert_score import BERTScorer
+from bert_score.utils import (
+    get_bert_embedding,
+    get_idf_dict,
+    greedy_cos_idf,
+    sent_encode,
+)
+
+from ..cache import EmbeddingCache
+from ..dedup import DedupStats, run_deduplicated
 from .am_model import BaseAMModel
 
+# strings encoded per call to the model, to bound the size of the padded outputs
+ENCODE_CHUNK_SIZE = 1024
+
 
 class BertScoreAM(BaseAMModel):
+    """BERTScore F1 between predicted and reference answers.
+
+    The model stays loaded between calls, and the token embeddings of every string are
+    kept in an LRU cache of at most `max_cached_tokens` tokens, so answers shared by
+    several systems or questions (e.g. reference answers) are only encoded once. With
+    `embedding_cache_dir`, embeddings are also written to disk and reused across runs.
+    """
 
-    def __init__(self, lang="en"):
+    def __init__(
+        self,
+        lang="en",
+        model_type: str | None = None,
+        num_layers: int | None = None,
+        idf: bool = False,
+        device: str | None = None,
+        max_cached_tokens: int = 250_000,
+        embedding_cache_dir: str | None = None,
+    ):
         self.maximum_val = 100.0
         self.minimum_val = 0.0
         self.lang = lang
+        self.idf = idf
+        self.dedup_stats = DedupStats("bertscore_am")
+
+        self.scorer = BERTScorer(
+            lang=lang, model_type=model_type, num_layers=num_layers, device=device
+        )
+        self.hidden_size = self.scorer._model.config.hidden_size
+
+        self.max_cached_tokens = max_cached_tokens
+        self._embeddings = OrderedDict()
+        self._cached_tokens = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.disk_cache = None
+        if embedding_cache_dir is not None:
+            self.disk_cache = EmbeddingCache(
+                os.path.join(
+                    embedding_cache_dir,
+                    f"{self.scorer.model_type.replace('/', '--')}-L{self.scorer.num_layers}.sqlite",
+                )
+            )
+
+    def _remember(self, text: str, embedding: torch.Tensor):
+        self._embeddings[text] = embedding
+        self._cached_tokens += len(embedding)
+        while self._cached_tokens > self.max_cached_tokens and len(self._embeddings) > 1:
+            _, evicted = self._embeddings.popitem(last=False)
+            self._cached_tokens -= len(evicted)
+
+    def _embed(self, texts: list[str], batch_size: int) -> dict[str, torch.Tensor]:
+        """Returns the (unpadded, CPU) token embeddings of every unique text."""
+        embeddings = {}
+        for text in texts:
+            if text in self._embeddings:
+                self._embeddings.move_to_end(text)
+                embeddings[text] = self._embeddings[text]
+
+        missing = [text for text in texts if text not in embeddings]
+        if missing and self.disk_cache is not None:
+            for text, value in zip(missing, self.disk_cache.get_many(missing)):
+                if value is not None:
+                    embeddings[text] = torch.from_numpy(
+                        value.reshape(-1, self.hidden_size).copy()
+                    )
+                    self._remember(text, embeddings[text])
+            missing = [text for text in missing if text not in embeddings]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        # idf weights are applied when scoring, so the embeddings do not depend on them
+        uniform_idf = defaultdict(lambda: 1.0)
+        for start in range(0, len(missing), ENCODE_CHUNK_SIZE):
+            chunk = missing[start : start + ENCODE_CHUNK_SIZE]
+            chunk_embeddings, masks, _ = get_bert_embedding(
+                chunk,
+                self.scorer._model,
+                self.scorer._tokenizer,
+                uniform_idf,
+                batch_size=batch_size,
+                device=self.scorer.device,
+            )
+            for text, embedding, mask in zip(chunk, chunk_embeddings, masks):
+                embeddings[text] = embedding[: int(mask.sum())].float().cpu()
+                self._remember(text, embeddings[text])
+            if self.disk_cache is not None:
+                self.disk_cache.put_many(
+                    [(text, embeddings[text].numpy()) for text in chunk]
+                )
+        return embeddings
+
+    def _pad(self, texts, embeddings, idf_dict):
+        # as in bert_score, padding is 2.0 rather than 0.0: greedy_cos_idf normalizes
+        # the embeddings in place, and zero rows would become NaNs
+        padded = pad_sequence(
+            [embeddings[text] for text in texts], batch_first=True, padding_value=2.0
+        )
+        lengths = torch.tensor([len(embeddings[text]) for text in texts])
+        mask = torch.arange(padded.size(1)).expand(len(texts), -1) < lengths.unsqueeze(1)
+        idf = pad_sequence(
+            [
+                torch.tensor(
+                    [
+                        idf_dict[idx]
+                        for idx in sent_encode(self.scorer._tokenizer, text)[:length]
+                    ],
+                    dtype=torch.float,
+                )
+                for text, length in zip(texts, lengths.tolist())
+            ],
+            batch_first=True,
+        )
+        device = self.scorer.device
+        return padded.to(device), mask.to(device), idf.to(device)
 
     def evaluate_answers(
         self,
@@ -20,12 +148,48 @@ class BertScoreAM(BaseAMModel):
     ) -> list[float]:
         assert reference_answers is not None, "must provide reference answers"
 
-        _, _, F1 = score(
-            predicted_answers,
-            reference_answers,
-            lang=self.lang,
-            verbose=True,
-            batch_size=batch_size,
+        tokenizer = self.scorer._tokenizer
+        if self.idf:
+            # over all the references (with repetitions), as `bert_score.score` does
+            idf_dict = get_idf_dict(reference_answers, tokenizer)
+        else:
+            idf_dict = defaultdict(lambda: 1.0)
+            idf_dict[tokenizer.sep_token_id] = 0
+            idf_dict[tokenizer.cls_token_id] = 0
+
+        def _score(predicted_answers, reference_answers):
+            embeddings = self._embed(
+                list(dict.fromkeys(predicted_answers + reference_answers)), batch_size
+            )
+            F1 = []
+            with torch.no_grad():
+                for start in range(0, len(predicted_answers), batch_size):
+                    _, _, batch_f1 = greedy_cos_idf(
+                        *self._pad(
+                            reference_answers[start : start + batch_size],
+                            embeddings,
+                            idf_dict,
+                        ),
+                        *self._pad(
+                            predicted_answers[start : start + batch_size],
+                            embeddings,
+                            idf_dict,
+                        ),
+                    )
+                    F1.append(batch_f1.cpu())
+            self.report()
+            return torch.cat(F1).numpy() if F1 else np.zeros(0)
+
+        return np.array(
+            run_deduplicated(
+                _score, predicted_answers, reference_answers, stats=self.dedup_stats
+            )
         )
 
-        return F1.numpy()
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(
+            f"[bertscore_am] embedding hits: {self.hits}, misses: {self.misses} (hit rate: {rate:.1%})",
+            file=sys.stderr,
+        )
@@ -0,0 +1,109 @@
+import sys
+
+import numpy as np
+
+from .am_model import BaseAMModel
+
+DEFAULT_STAGES = [
+    # identical answers are resolved as correct
+    {"model": "exact_match", "high": 1.0},
+    # clearly wrong or clearly right answers are resolved by chrF
+    {"model": "chrf", "low": 0.05, "high": 0.95},
+    {"model": "quip"},
+]
+
+
+def _scalar(score) -> float:
+    # some models return one score per output head (e.g. quip returns [score])
+    return float(np.asarray(score).reshape(-1)[0])
+
+
+class CascadeAM(BaseAMModel):
+    """Runs a chain of answer matchers, where each stage only sees the pairs that the
+    previous stages were not confident about.
+
+    Each stage is a dictionary with the `model` name (from `AM_MODELS_REGISTRY`), its
+    `args`, and `low`/`high` thresholds: a pair is resolved by the stage if its score is
+    at most `low` or at least `high`. Scores of all stages are normalized to [0, 1]
+    using each model's minimum and maximum values, and so are the thresholds. The last
+    stage resolves all the remaining pairs.
+    """
+
+    def __init__(self, stages: list[dict] | None = None):
+        # imported here since the registry imports this module
+        from . import AM_MODELS_REGISTRY
+
+        self.stages = stages if stages is not None else DEFAULT_STAGES
+        assert len(self.stages) > 0, "Must provide at least one stage"
+        self.models = [
+            AM_MODELS_REGISTRY[stage["model"]](**stage.get("args", {}))
+            for stage in self.stages
+        ]
+        self.maximum_val = 1.0
+        self.minimum_val = 0.0
+        # number of pairs resolved by each stage in the last call
+        self.resolved_counts = [0] * len(self.stages)
+
+    def _normalize(self, model, scores) -> np.ndarray:
+        scores = np.array([_scalar(score) for score in scores], dtype=float)
+        scores = (scores - model.minimum_val) / (model.maximum_val - model.minimum_val)
+        return np.clip(scores, 0.0, 1.0)
+
+    def evaluate_answers(
+        self,
+        predicted_answers: list[str],
+        questions: list[str] | None = None,
+        reference_answers: list[str] | None = None,
+        contexts: list[str] | None = None,
+    ) -> list[float]:
+        scores = np.zeros(len(predicted_answers))
+        remaining = np.arange(len(predicted_answers))
+        self.resolved_counts = [0] * len(self.stages)
+
+        for stage_idx, (stage, model) in enumerate(zip(self.stages, self.models)):
+            if len(remaining) == 0:
+                break
+
+            def _select(items):
+                return [items[i] for i in remaining] if items is not None else None
+
+            stage_scores = self._normalize(
+                model,
+                model.evaluate_answers(
+                    _select(predicted_answers),
+                    questions=_select(questions),
+                    reference_answers=_select(reference_answers),
+                    contexts=_select(contexts),
+                ),
+            )
+
+            if stage_idx == len(self.stages) - 1:
+                resolved = np.ones(len(remaining), dtype=bool)
+            else:
+                resolved = np.zeros(len(remaining), dtype=bool)
+                if stage.get("low") is not None:
+                    resolved |= stage_scores <= stage["low"]
+                if stage.get("high") is not None:
+                    resolved |= stage_scores >= stage["high"]
+
+            scores[remaining[resolved]] = stage_scores[resolved]
+            self.resolved_counts[stage_idx] = int(resolved.sum())
+            remaining = remaining[~resolved]
+
+        self.report()
+        return scores.tolist()
+
+    def report(self):
+        total = sum(self.resolved_counts)
+        for stage, count in zip(self.stages, self.resolved_counts):
+            rate = count / total if total else 0.0
+            print(
+                f"[cascade_am] {stage['model']}: resolved {count}/{total} ({rate:.1%})",
+                file=sys.stderr,
+            )
+
+    def close(self):
+        # e.g. the chrF stage may hold a pool of worker processes
+        for model in self.models:
+            if hasattr(model, "close"):
+                model.close()
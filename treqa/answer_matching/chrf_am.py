@@ -1,13 +1,16 @@
-import sacrebleu
-
+from ..chrf import ChrfEngine
+from ..dedup import DedupStats, run_deduplicated
 from .am_model import BaseAMModel
 
 
 class ChrfAM(BaseAMModel):
 
-    def __init__(self):
+    def __init__(self, num_workers: int = 1):
         self.maximum_val = 100.0
         self.minimum_val = 0.0
+        self.dedup_stats = DedupStats("chrf_am")
+        # reference answers are shared across systems, so their n-grams are cached
+        self.engine = ChrfEngine(num_workers=num_workers)
 
     def evaluate_answers(
         self,
@@ -17,11 +20,18 @@ class ChrfAM(BaseAMModel):
         contexts: list[str] | None = None,
     ) -> list[float]:
         assert reference_answers is not None, "must provide reference answers"
-        scores = []
-        for predicted_answer, reference_answer in zip(
-            predicted_answers, reference_answers
-        ):
-            scores.append(
-                sacrebleu.sentence_chrf(predicted_answer, [reference_answer]).score
-            )
-        return scores
+        return run_deduplicated(
+            self._score, predicted_answers, reference_answers, stats=self.dedup_stats
+        )
+
+    def _score(self, predicted_answers, reference_answers):
+        return self.engine.score(predicted_answers, reference_answers)
+
+    def close(self):
+        self.engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -33,43 +33,30 @@ Answer:
 ###
 Score:"""
 
+SCORE_TOKENS = ["1", "2", "3", "4", "5"]
+DEFAULT_NUM_LOGPROBS = 20
+
 
 class PromptAM(PromptModel, BaseAMModel):
     def __init__(
         self,
         normalize_scores=False,
         num_runs=20,
+        expected_scores=False,
         provider="vllm",
         model_name="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=1024,
-        max_model_len=None,
-        temperature=0.0,
-        top_p=1.0,
-        tensor_parallel_size=1,
-        base_url="https://cmu.litellm.ai",
-        parent_prompt_model=None,
-        api_key=None,
-        gpu_memory_utilization=0.9,
-        logprobs=None,
+        **prompt_model_kwargs,
     ):
         super().__init__(
             provider=provider,
             model_name=model_name,
-            max_tokens=max_tokens,
-            max_model_len=max_model_len,
-            temperature=temperature,
-            top_p=top_p,
-            tensor_parallel_size=tensor_parallel_size,
-            base_url=base_url,
-            parent_prompt_model=parent_prompt_model,
-            api_key=api_key,
-            gpu_memory_utilization=gpu_memory_utilization,
-            logprobs=logprobs,
+            **prompt_model_kwargs,
         )
         self.maximum_val = 5.0
         self.minimum_val = 0.0
         self.normalize_scores = normalize_scores
         self.num_runs = num_runs
+        self.expected_scores = expected_scores
 
     def prepare_chat(
         self,
@@ -96,21 +83,53 @@ class PromptAM(PromptModel, BaseAMModel):
                 scores.append(float(match.group()))
         return scores
 
+    def expected_score(self, top_logprobs: dict[str, float]):
+        """Probability-weighted score over the score tokens, and their distribution."""
+        probs = np.zeros(len(SCORE_TOKENS))
+        for token, logprob in top_logprobs.items():
+            token = token.strip()
+            if token in SCORE_TOKENS:
+                probs[SCORE_TOKENS.index(token)] += np.exp(logprob)
+
+        if probs.sum() == 0:
+            print("No score token in the top logprobs, using the minimum score.")
+            return self.minimum_val, probs.tolist()
+
+        probs = probs / probs.sum()
+        score = float(np.dot(probs, [float(token) for token in SCORE_TOKENS]))
+        return score, probs.tolist()
+
     def evaluate_answers(
         self,
         predicted_answers: list[str],
         questions: list[str] | None = None,
         reference_answers: list[str] | None = None,
         contexts: list[str] | None = None,
-    ) -> list[float]:
+        return_distribution: bool = False,
+    ) -> list[float] | tuple[list[float], list[list[float]]]:
         assert questions is not None, "Must provide questions"
         assert contexts is not None, "Must provide contexts"
+        if return_distribution and not self.expected_scores:
+            raise ValueError(
+                "return_distribution requires logprob scoring (expected_scores=True)"
+            )
 
         all_chats = []
         for context, question, answer in zip(contexts, questions, predicted_answers):
             all_chats.append(self.prepare_chat(context, question, answer))
 
-        if self.normalize_scores:
+        distributions = None
+        if self.expected_scores:
+            # a single prefill per chat, reading the distribution over the score tokens
+            all_top_logprobs = self.generate_logprobs(
+                all_chats, num_logprobs=self.logprobs or DEFAULT_NUM_LOGPROBS
+            )
+            scores, distributions = [], []
+            for top_logprobs in all_top_logprobs:
+                score, distribution = self.expected_score(top_logprobs)
+                scores.append(score)
+                distributions.append(distribution)
+        elif self.normalize_scores:
             repeated_chats = []
             for x in all_chats:
                 repeated_chats.extend([x] * self.num_runs)
@@ -125,4 +144,6 @@ class PromptAM(PromptModel, BaseAMModel):
 
         assert len(scores) == len(all_chats)
 
+        if return_distribution:
+            return scores, distributions
         return scores
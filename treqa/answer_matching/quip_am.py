@@ -1,59 +1,168 @@
+import inspect
+import os
+import sys
+import time
+
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 import torch
-from torch.utils.data import Dataset, DataLoader
 from tqdm import tqdm
 
 
+from ..dedup import DedupStats, run_deduplicated
 from .am_model import BaseAMModel
 
 torch.set_float32_matmul_precision("high")
 
+QUIP_MODEL_NAME = "alirezamsh/quip-512-mocha"
+DEFAULT_ONNX_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "treqa", "onnx"
+)
 
-class TokenizedDataset(Dataset):
-    def __init__(self, input_strings, tokenizer, max_length=512):
-        self.tokenizer = tokenizer
-        self.input_strings = input_strings
-        self.max_length = max_length
-
-    def __len__(self):
-        return len(self.input_strings)
 
-    def __getitem__(self, idx):
-        return self.tokenizer(
-            self.input_strings[idx],
-            padding="max_length",
-            truncation=True,
-            max_length=self.max_length,
-            return_tensors="pt",
-        )
+def available_cpus() -> int:
+    # the affinity mask (e.g. set by a job scheduler) is only exposed on Linux
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
 
 class QuipAM(BaseAMModel):
-    def __init__(self, batch_size=256, use_sdpa=True, compile=False):
+    def __init__(
+        self,
+        batch_size=256,
+        use_sdpa=True,
+        compile=False,
+        max_length=512,
+        backend="torch",
+        onnx_cache_dir=DEFAULT_ONNX_CACHE_DIR,
+        quantize=True,
+        num_threads=None,
+        device=None,
+    ):
         super().__init__()
+        assert backend in ["torch", "onnx"], f"Unknown backend: {backend}"
         self.batch_size = batch_size
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.max_length = max_length
+        self.backend = backend
+        self.use_sdpa = use_sdpa
+        self.tokenizer = AutoTokenizer.from_pretrained(QUIP_MODEL_NAME)
+        self.maximum_val = 5.0
+        self.minimum_val = 0.0
+        self.dedup_stats = DedupStats("quip_am")
+
+        if backend == "torch":
+            if device is None:
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+            self.device = torch.device(device)
+            self.model = self._load_torch_model(self.device, use_sdpa, compile)
+        else:
+            # ONNX Runtime is meant for CPU-only hosts
+            self.device = torch.device("cpu")
+            self.session = self._load_onnx_session(onnx_cache_dir, quantize, num_threads)
 
-        # Load model and tokenizer
-        self.model = AutoModelForSequenceClassification.from_pretrained(
-            "alirezamsh/quip-512-mocha",
+    def _load_torch_model(self, device, use_sdpa=True, compile=False):
+        # Load model
+        model = AutoModelForSequenceClassification.from_pretrained(
+            QUIP_MODEL_NAME,
             _attn_implementation="sdpa" if use_sdpa else "eager",
-        ).to(self.device)
+        ).to(device)
 
         # Use half precision if CUDA is available
-        if torch.cuda.is_available():
-            self.model = self.model.bfloat16()
+        if device.type == "cuda":
+            model = model.bfloat16()
 
         # Support multi-GPU if available
-        if torch.cuda.device_count() > 1:
-            self.model = torch.nn.DataParallel(self.model)
+        if device.type == "cuda" and torch.cuda.device_count() > 1:
+            model = torch.nn.DataParallel(model)
 
         if compile:
-            self.model = torch.compile(self.model, dynamic=False)
-        self.model.eval()
-        self.tokenizer = AutoTokenizer.from_pretrained("alirezamsh/quip-512-mocha")
-        self.maximum_val = 5.0
-        self.minimum_val = 0.0
+            # batches are padded to their longest input, so shapes vary between batches
+            model = torch.compile(model, dynamic=None)
+        model.eval()
+        return model
+
+    def _export_onnx(self, onnx_path: str):
+        model = AutoModelForSequenceClassification.from_pretrained(
+            QUIP_MODEL_NAME, _attn_implementation="eager"
+        )
+        model.eval()
+        model.config.return_dict = False
+        # inputs are passed positionally, so they follow the order of `forward`
+        forward_params = list(inspect.signature(model.forward).parameters)
+        input_names = sorted(self.tokenizer.model_input_names, key=forward_params.index)
+        dummy_inputs = self.tokenizer(
+            ["question <q> answer <r> answer <c> context"], return_tensors="pt"
+        )
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["logits"] = {0: "batch"}
+        export_kwargs = {}
+        # newer PyTorch versions default to the dynamo-based exporter, which does not
+        # take `dynamic_axes`
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False
+        with torch.inference_mode():
+            torch.onnx.export(
+                model,
+                tuple(dummy_inputs[name] for name in input_names),
+                onnx_path,
+                input_names=input_names,
+                output_names=["logits"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                **export_kwargs,
+            )
+
+    def _load_onnx_session(self, onnx_cache_dir, quantize=True, num_threads=None):
+        try:
+            import onnxruntime as ort
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError:
+            raise ImportError(
+                "The onnx backend requires onnx and onnxruntime: pip install onnx onnxruntime"
+            )
+
+        # the exported (and quantized) model is cached, so it is only built once
+        os.makedirs(onnx_cache_dir, exist_ok=True)
+        model_id = QUIP_MODEL_NAME.replace("/", "--")
+        onnx_path = os.path.join(onnx_cache_dir, f"{model_id}.onnx")
+        if not os.path.exists(onnx_path):
+            print(f"Exporting {QUIP_MODEL_NAME} to {onnx_path}", file=sys.stderr)
+            self._export_onnx(f"{onnx_path}.tmp")
+            os.replace(f"{onnx_path}.tmp", onnx_path)
+        if quantize:
+            quantized_path = os.path.join(onnx_cache_dir, f"{model_id}.int8.onnx")
+            if not os.path.exists(quantized_path):
+                print(f"Quantizing {onnx_path} to int8", file=sys.stderr)
+                quantize_dynamic(
+                    onnx_path, f"{quantized_path}.tmp", weight_type=QuantType.QInt8
+                )
+                os.replace(f"{quantized_path}.tmp", quantized_path)
+            onnx_path = quantized_path
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # one intra-op thread per available core; inter-op parallelism does not
+        # help a single sequential graph
+        options.intra_op_num_threads = num_threads or available_cpus()
+        options.inter_op_num_threads = 1
+        return ort.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def _predict_batch(self, batch: dict) -> list:
+        if self.backend == "onnx":
+            inputs = {
+                input.name: batch[input.name].astype("int64")
+                for input in self.session.get_inputs()
+            }
+            return self.session.run(["logits"], inputs)[0].tolist()
+
+        batch = {
+            key: torch.from_numpy(val).to(self.device, non_blocking=True)
+            for key, val in batch.items()
+        }
+        output = self.model(**batch)
+        return output.logits.float().cpu().tolist()
 
     def evaluate_answers(
         self,
@@ -73,33 +182,82 @@ class QuipAM(BaseAMModel):
                 questions, reference_answers, predicted_answers, contexts
             )
         ]
+        # repeated (question, answers, context) rows are only scored once
+        return run_deduplicated(self._score, input_strings, stats=self.dedup_stats)
 
-        # Create dataset and dataloader
-        dataset = TokenizedDataset(input_strings, self.tokenizer, max_length=512)
-        data_loader = DataLoader(
-            dataset,
-            batch_size=self.batch_size,
-            shuffle=False,
-            num_workers=min(4, torch.get_num_threads()),
-            collate_fn=self._collate_fn,
-            pin_memory=torch.cuda.is_available(),
+    def _score(self, input_strings: list[str]) -> list:
+        # Tokenize everything at once without padding, then sort by length so that
+        # each batch only pads up to its own longest input
+        encodings = self.tokenizer(
+            input_strings, truncation=True, max_length=self.max_length
         )
+        lengths = [len(input_ids) for input_ids in encodings["input_ids"]]
+        # longest first, so that running out of memory happens on the first batch
+        order = sorted(range(len(input_strings)), key=lambda i: -lengths[i])
 
         # Perform inference
-        results = []
+        results = [None] * len(input_strings)
+        start_time = time.perf_counter()
         with torch.inference_mode():
-            for batch in tqdm(data_loader):
-                batch = {
-                    key: val.squeeze(1).to(self.device) for key, val in batch.items()
-                }
-                output = self.model(**batch)
-                results.extend(output.logits.cpu().tolist())
+            for start in tqdm(range(0, len(order), self.batch_size)):
+                batch_indices = order[start : start + self.batch_size]
+                batch = self.tokenizer.pad(
+                    {
+                        key: [values[i] for i in batch_indices]
+                        for key, values in encodings.items()
+                    },
+                    pad_to_multiple_of=8,
+                    return_tensors="np",
+                )
+                for i, logits in zip(batch_indices, self._predict_batch(batch)):
+                    results[i] = logits
 
+        elapsed = time.perf_counter() - start_time
+        if elapsed > 0:
+            print(
+                f"QuipAM ({self.backend}): {len(input_strings) / elapsed:.1f} examples/sec",
+                file=sys.stderr,
+            )
         return results
 
-    def _collate_fn(self, batch):
-        # Batch individual tokenized outputs into a single dictionary
-        collated_batch = {}
-        for key in batch[0]:
-            collated_batch[key] = torch.cat([example[key] for example in batch], dim=0)
-        return collated_batch
+    def check_parity(
+        self,
+        predicted_answers: list[str],
+        questions: list[str],
+        reference_answers: list[str],
+        contexts: list[str],
+        tolerance: float = 0.1,
+    ) -> float:
+        """Compares the scores of this model against the (fp32) PyTorch backend.
+
+        Returns the maximum absolute score difference and warns if it exceeds `tolerance`.
+        """
+        scores = self.evaluate_answers(
+            predicted_answers, questions, reference_answers, contexts
+        )
+        torch_am = QuipAM(
+            batch_size=self.batch_size,
+            use_sdpa=self.use_sdpa,
+            max_length=self.max_length,
+            # fp32 on CPU is the reference implementation
+            device="cpu",
+        )
+        torch_scores = torch_am.evaluate_answers(
+            predicted_answers, questions, reference_answers, contexts
+        )
+
+        max_diff = max(
+            abs(score - torch_score)
+            for score_list, torch_score_list in zip(scores, torch_scores)
+            for score, torch_score in zip(score_list, torch_score_list)
+        )
+        print(
+            f"QuipAM ({self.backend}) vs torch: max absolute difference {max_diff:.4f}",
+            file=sys.stderr,
+        )
+        if max_diff > tolerance:
+            print(
+                f"WARNING: QuipAM ({self.backend}) scores differ from torch by more than {tolerance}",
+                file=sys.stderr,
+            )
+        return max_diff
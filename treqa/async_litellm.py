@@ -0,0 +1,161 @@
+"""Asynchronous LiteLLM client with bounded concurrency, rate limiting and retries."""
+
+import asyncio
+import random
+import time
+
+import litellm
+from tqdm import tqdm
+
+# status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token-bucket rate limiter refilled continuously at `rate_per_minute`."""
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    async def acquire(self, amount: float = 1.0):
+        # requests larger than the bucket would never be served otherwise
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def _status_code(exc: Exception) -> int | None:
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    return status_code
+
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (asyncio.TimeoutError, litellm.Timeout, litellm.APIConnectionError)):
+        return True
+    return _status_code(exc) in RETRYABLE_STATUS_CODES
+
+
+def _message_content(response) -> str:
+    return response.choices[0].message.content
+
+
+class AsyncLiteLLMClient:
+    def __init__(
+        self,
+        model_name: str,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        max_concurrency: int = 16,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 10,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        completion_kwargs: dict | None = None,
+    ):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.completion_kwargs = completion_kwargs or {}
+
+    def _estimate_tokens(self, chat: list[dict[str, str]]) -> int:
+        # rough estimate (~4 characters per token) plus the completion budget
+        num_chars = sum(len(turn["content"]) for turn in chat)
+        return num_chars // 4 + self.completion_kwargs.get("max_tokens", 0)
+
+    def _backoff(self, attempt: int) -> float:
+        # exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.initial_backoff * 2**attempt))
+
+    async def _complete(
+        self, chat, semaphore, request_bucket, token_bucket, response_fn, kwargs
+    ):
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                if request_bucket is not None:
+                    await request_bucket.acquire(1)
+                if token_bucket is not None:
+                    await token_bucket.acquire(self._estimate_tokens(chat))
+                try:
+                    response = await litellm.acompletion(
+                        model=self.model_name,
+                        messages=chat,
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        **kwargs,
+                    )
+                    return response_fn(response)
+                except Exception as e:
+                    if attempt == self.max_retries or not is_retryable(e):
+                        raise
+                    await asyncio.sleep(self._backoff(attempt))
+
+    async def _generate_all(self, chats, on_result, response_fn, kwargs) -> list:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        request_bucket = (
+            TokenBucket(self.requests_per_minute)
+            if self.requests_per_minute
+            else None
+        )
+        token_bucket = (
+            TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+        )
+
+        async def _indexed(i, chat):
+            return i, await self._complete(
+                chat, semaphore, request_bucket, token_bucket, response_fn, kwargs
+            )
+
+        tasks = [asyncio.create_task(_indexed(i, chat)) for i, chat in enumerate(chats)]
+        outputs = [None] * len(chats)
+        try:
+            for future in tqdm(asyncio.as_completed(tasks), total=len(tasks)):
+                i, output = await future
+                outputs[i] = output
+                # results are handed back as soon as they finish, e.g. to persist them
+                if on_result is not None:
+                    on_result(i, output)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return outputs
+
+    def generate(
+        self, chats, on_result=None, response_fn=None, **completion_kwargs
+    ) -> list:
+        """Completes all chats and returns the outputs in input order.
+
+        `on_result(index, output)` is called as soon as each completion finishes.
+        `response_fn` extracts the output from each response (by default, the message
+        content), and `completion_kwargs` override the client's completion arguments.
+        """
+        if response_fn is None:
+            response_fn = _message_content
+        kwargs = {**self.completion_kwargs, **completion_kwargs}
+        return asyncio.run(
+            self._generate_all(chats, on_result, response_fn, kwargs)
+        )
@@ -0,0 +1,280 @@
+"""Persistent, content-addressed key/value cache backed by SQLite."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+def make_cache_key(*parts) -> str:
+    """Hashes any JSON-serializable parts into a stable cache key."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """On-disk cache with a size budget and LRU eviction.
+
+    Values are stored as strings. Every lookup counts as a hit or a miss so that
+    callers can report how much work was saved.
+    """
+
+    def __init__(self, path: str, max_size_mb: float | None = 1024.0):
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.max_size = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, last_access REAL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access)"
+        )
+        self._conn.commit()
+        self._total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache"
+        ).fetchone()[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        values = {}
+        with self._lock:
+            # sqlite limits the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                values.update(rows)
+            if values:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE cache SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in values],
+                )
+                self._conn.commit()
+
+        results = [values.get(key) for key in keys]
+        num_hits = sum(value is not None for value in results)
+        self.hits += num_hits
+        self.misses += len(keys) - num_hits
+        return results
+
+    def get(self, key: str) -> str | None:
+        return self.get_many([key])[0]
+
+    def put_many(self, items: list[tuple[str, str]]):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            for key, value in items:
+                size = len(key) + len(value.encode("utf-8"))
+                old = self._conn.execute(
+                    "SELECT size FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if old is not None:
+                    self._total_size -= old[0]
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, value, size, now),
+                )
+                self._total_size += size
+            self._evict()
+            self._conn.commit()
+
+    def put(self, key: str, value: str):
+        self.put_many([(key, value)])
+
+    def _evict(self):
+        # drop least recently used entries until we are back under budget
+        if self.max_size is None:
+            return
+        while self._total_size > self.max_size:
+            rows = self._conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_access ASC LIMIT 256"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._total_size -= size
+                if self._total_size <= self.max_size:
+                    break
+
+    def report(self, name: str = "cache"):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(
+            f"[{name}] hits: {self.hits}, misses: {self.misses} (hit rate: {rate:.1%})",
+            file=sys.stderr,
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """On-disk cache of float32 embeddings keyed by text, one file per embedding model."""
+
+    def __init__(self, path: str):
+        dirname = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dirname, exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, value BLOB)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        values = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                values.update(rows)
+
+        results = [
+            np.frombuffer(values[key], dtype=np.float32) if key in values else None
+            for key in keys
+        ]
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        return results
+
+    def put_many(self, items: list[tuple[str, np.ndarray]]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, value) VALUES (?, ?)",
+                [
+                    (key, np.asarray(value, dtype=np.float32).tobytes())
+                    for key, value in items
+                ],
+            )
+            self._conn.commit()
+
+    def report(self, name: str = "embedding cache"):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(
+            f"[{name}] hits: {self.hits}, misses: {self.misses} (hit rate: {rate:.1%})",
+            file=sys.stderr,
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class MemmapEmbeddingCache:
+    """Append-only on-disk store of fixed-size float32 embeddings keyed by text.
+
+    Embeddings live in a single memory-mapped array (`embeddings.f32`), so lookups do
+    not load the whole store in memory; `index.json` maps text hashes to rows.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, "embeddings.f32")
+        self.index_path = os.path.join(directory, "index.json")
+        self.hits = 0
+        self.misses = 0
+
+        self.dim = None
+        self.rows = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self.dim = index["dim"]
+            self.rows = index["rows"]
+        self._array = None
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _mmap(self) -> np.ndarray:
+        if self._array is None and self.rows:
+            self._array = np.memmap(
+                self.data_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim)
+            )
+        return self._array
+
+    def missing(self, texts: list[str]) -> list[int]:
+        """Returns the indices of the (first occurrence of) texts that are not cached."""
+        missing, seen = [], set()
+        for idx, text in enumerate(texts):
+            key = self._key(text)
+            if key not in self.rows and key not in seen:
+                missing.append(idx)
+                seen.add(key)
+        self.misses += len(missing)
+        self.hits += len(texts) - len(missing)
+        return missing
+
+    def add(self, texts: list[str], embeddings: np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+        assert embeddings.shape[1] == self.dim, "Embedding size does not match the cache"
+
+        new_rows = {}
+        for text, embedding in zip(texts, embeddings):
+            key = self._key(text)
+            if key not in self.rows and key not in new_rows:
+                new_rows[key] = (len(self.rows) + len(new_rows), embedding)
+        if not new_rows:
+            return
+
+        mode = "r+b" if os.path.exists(self.data_path) else "wb"
+        with open(self.data_path, mode) as f:
+            # drop rows left over by an interrupted write, which the index never saw
+            f.seek(len(self.rows) * self.dim * np.dtype(np.float32).itemsize)
+            f.truncate()
+            for _, embedding in new_rows.values():
+                f.write(embedding.tobytes())
+        self.rows.update({key: row for key, (row, _) in new_rows.items()})
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"dim": self.dim, "rows": self.rows}, f)
+        os.replace(tmp_path, self.index_path)
+        # the array grew, so it has to be mapped again
+        self._array = None
+
+    def get(self, texts: list[str]) -> np.ndarray:
+        array = self._mmap()
+        return np.stack([array[self.rows[self._key(text)]] for text in texts])
+
+    def report(self, name: str = "embedding cache"):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(
+            f"[{name}] hits: {self.hits}, misses: {self.misses} (hit rate: {rate:.1%})",
+            file=sys.stderr,
+        )
@@ -0,0 +1,101 @@
+"""Batched chat-template rendering and tokenization."""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from transformers import AutoTokenizer
+
+# tokenizer loaded once per worker process
+_worker_tokenizer = None
+
+
+def _init_worker(model_name: str):
+    global _worker_tokenizer
+    _worker_tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+
+def _tokenize_in_worker(chats: list[list[dict[str, str]]]) -> list[list[int]]:
+    return tokenize_chats(_worker_tokenizer, chats)
+
+
+def _adds_bos_token(tokenizer) -> bool:
+    if tokenizer.bos_token_id is None:
+        return False
+    return tokenizer("a").input_ids[:1] == [tokenizer.bos_token_id]
+
+
+def tokenize_chats(tokenizer, chats: list[list[dict[str, str]]]) -> list[list[int]]:
+    """Renders a batch of chats with the chat template and returns their token ids.
+
+    The ids match what the engine would get by tokenizing the rendered prompt string
+    after stripping the BOS token from it: exactly one BOS token, if the tokenizer uses one.
+    """
+    if len(chats) == 0:
+        return []
+    token_ids = tokenizer.apply_chat_template(
+        chats, tokenize=True, add_generation_prompt=True, return_dict=False
+    )
+    if _adds_bos_token(tokenizer):
+        bos_token_id = tokenizer.bos_token_id
+        token_ids = [
+            ids if ids[:1] == [bos_token_id] else [bos_token_id] + ids
+            for ids in token_ids
+        ]
+    return token_ids
+
+
+class ChatTokenizer:
+    """Tokenizes chats in batches, optionally spread over a pool of processes.
+
+    Keeps a cache of the number of tokens of every chat it has seen, which can be
+    reused for batching and truncation decisions without re-tokenizing.
+    """
+
+    def __init__(self, tokenizer, batch_size: int = 1024, num_workers: int = 0):
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.token_counts: dict[str, int] = {}
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            # spawn (rather than fork) since the parent usually holds a CUDA context
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.tokenizer.name_or_path,),
+            )
+        return self._pool
+
+    def tokenize(
+        self, chats: list[list[dict[str, str]]], keys: list[str] | None = None
+    ) -> list[list[int]]:
+        batches = [
+            chats[i : i + self.batch_size]
+            for i in range(0, len(chats), self.batch_size)
+        ]
+        if self.num_workers > 0 and len(batches) > 1:
+            results = self._get_pool().map(_tokenize_in_worker, batches)
+        else:
+            results = (tokenize_chats(self.tokenizer, batch) for batch in batches)
+        token_ids = [ids for batch_ids in results for ids in batch_ids]
+
+        if keys is not None:
+            for key, ids in zip(keys, token_ids):
+                self.token_counts[key] = len(ids)
+        return token_ids
+
+    def count_tokens(
+        self, chats: list[list[dict[str, str]]], keys: list[str]
+    ) -> list[int]:
+        missing = [i for i, key in enumerate(keys) if key not in self.token_counts]
+        if missing:
+            self.tokenize([chats[i] for i in missing], [keys[i] for i in missing])
+        return [self.token_counts[key] for key in keys]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,113 @@
+"""Sentence-level chrF with cached reference n-grams, identical to `sacrebleu.sentence_chrf`."""
+
+import multiprocessing
+from collections import OrderedDict
+
+from sacrebleu.metrics.chrf import CHRF
+
+# worker-local engine, created by `_init_worker` in each pool process
+_worker_engine = None
+
+
+def _init_worker(max_cached_references: int):
+    global _worker_engine
+    _worker_engine = ChrfEngine(max_cached_references=max_cached_references)
+
+
+def _score_chunk(chunk: tuple[list[str], list[str]]) -> list[float]:
+    return _worker_engine.score(*chunk)
+
+
+class ChrfEngine:
+    """Scores (hypothesis, reference) pairs with sentence chrF.
+
+    The character/word n-gram counts of each reference are extracted once and kept in
+    an LRU cache, so references shared by many hypotheses (e.g. across systems) are not
+    re-processed. With `num_workers > 1`, large inputs are scored by a pool of worker
+    processes (each with its own cache) that stays alive between calls, until `close`
+    (or the end of a `with` block).
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 1,
+        chunk_size: int = 4096,
+        max_cached_references: int = 100_000,
+    ):
+        # same configuration as `sacrebleu.sentence_chrf`
+        self.metric = CHRF()
+        self.num_workers = num_workers
+        self.chunk_size = chunk_size
+        self.max_cached_references = max_cached_references
+        self._references = OrderedDict()
+        self._pool = None
+
+    def _reference_info(self, reference: str) -> dict:
+        info = self._references.get(reference)
+        if info is not None:
+            self._references.move_to_end(reference)
+            return info
+        info = self.metric._extract_reference_info(
+            [self.metric._preprocess_segment(reference)]
+        )
+        self._references[reference] = info
+        if len(self._references) > self.max_cached_references:
+            self._references.popitem(last=False)
+        return info
+
+    def _score_local(self, hypotheses: list[str], references: list[str]) -> list[float]:
+        metric = self.metric
+        return [
+            metric._compute_f_score(
+                metric._compute_segment_statistics(
+                    metric._preprocess_segment(hypothesis),
+                    self._reference_info(reference),
+                )
+            )
+            for hypothesis, reference in zip(hypotheses, references)
+        ]
+
+    def score(self, hypotheses: list[str], references: list[str]) -> list[float]:
+        assert len(hypotheses) == len(references)
+        if self.num_workers <= 1 or len(hypotheses) <= self.chunk_size:
+            return self._score_local(hypotheses, references)
+
+        if self._pool is None:
+            # spawn (rather than fork) since the parent usually holds a CUDA context
+            self._pool = multiprocessing.get_context("spawn").Pool(
+                self.num_workers,
+                initializer=_init_worker,
+                initargs=(self.max_cached_references,),
+            )
+        # pairs with the same reference go to the same chunk, so each reference is
+        # extracted by as few workers as possible
+        order = sorted(range(len(hypotheses)), key=lambda i: references[i])
+        chunks = [
+            order[start : start + self.chunk_size]
+            for start in range(0, len(order), self.chunk_size)
+        ]
+        chunk_scores = self._pool.map(
+            _score_chunk,
+            [
+                ([hypotheses[i] for i in chunk], [references[i] for i in chunk])
+                for chunk in chunks
+            ],
+        )
+
+        scores = [0.0] * len(hypotheses)
+        for chunk, chunk_score in zip(chunks, chunk_scores):
+            for i, score in zip(chunk, chunk_score):
+                scores[i] = score
+        return scores
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,62 @@
+"""Deduplication of model inputs, so that repeated rows are only computed once."""
+
+import sys
+
+
+class DedupStats:
+    """Counts how many rows a model was asked to score and how many were unique."""
+
+    def __init__(self, name: str = "model"):
+        self.name = name
+        self.total = 0
+        self.unique = 0
+
+    @property
+    def ratio(self) -> float:
+        # fraction of rows that did not need to be computed
+        return 1.0 - self.unique / self.total if self.total else 0.0
+
+    def report(self):
+        print(
+            f"[{self.name}] unique rows: {self.unique}/{self.total} (dedup ratio: {self.ratio:.1%})",
+            file=sys.stderr,
+        )
+
+
+def deduplicate(rows: list) -> tuple[list[int], list[int]]:
+    """Returns the index of the first occurrence of every unique row, and for every
+    row the position of its unique row in that list. Rows must be hashable."""
+    positions = {}
+    unique_indices = []
+    inverse = []
+    for idx, row in enumerate(rows):
+        if row not in positions:
+            positions[row] = len(unique_indices)
+            unique_indices.append(idx)
+        inverse.append(positions[row])
+    return unique_indices, inverse
+
+
+def run_deduplicated(fn, *columns, stats: DedupStats | None = None) -> list:
+    """Calls `fn` on the unique rows of the aligned `columns` and scatters the results
+    back to every row.
+
+    `fn` gets one (deduplicated) list per column, or None for columns that are None,
+    and must return one result per row.
+    """
+    present = [column for column in columns if column is not None]
+    rows = list(zip(*present))
+    unique_indices, inverse = deduplicate(rows)
+
+    unique_columns = [
+        [column[i] for i in unique_indices] if column is not None else None
+        for column in columns
+    ]
+    unique_results = fn(*unique_columns)
+    assert len(unique_results) == len(unique_indices)
+
+    if stats is not None:
+        stats.total += len(rows)
+        stats.unique += len(unique_indices)
+        stats.report()
+    return [unique_results[i] for i in inverse]
@@ -0,0 +1,124 @@
+"""Process-wide registry of loaded LLM engines, shared between prompt models.
+
+Components that use the same checkpoint with the same engine arguments (e.g. the QA
+and AM models) get the same engine, and the engine is only released once the last
+component using it is cleaned up. Sampling parameters stay per component.
+"""
+
+import threading
+
+# arguments that only affect resource allocation, not the loaded engine itself;
+# they are taken from whichever component loads the engine first
+RESOURCE_ARGS = {"gpu_memory_utilization"}
+
+_ENGINES: dict[tuple, "SharedEngine"] = {}
+_ENGINE_FACTORIES: dict[str, tuple] = {}
+_registry_lock = threading.Lock()
+
+
+class SharedEngine:
+    def __init__(self, key: tuple, llm, tokenizer):
+        self.key = key
+        self.llm = llm
+        self.tokenizer = tokenizer
+        self.ref_count = 0
+        # engines are not thread-safe, so calls into them must hold this lock
+        self.lock = threading.Lock()
+
+
+def _load_vllm_engine(
+    model_name,
+    tensor_parallel_size=1,
+    max_model_len=None,
+    gpu_memory_utilization=0.9,
+    enable_prefix_caching=True,
+):
+    import vllm
+    from transformers import AutoTokenizer
+
+    llm = vllm.LLM(
+        model=model_name,
+        tensor_parallel_size=tensor_parallel_size,
+        max_model_len=max_model_len,
+        gpu_memory_utilization=gpu_memory_utilization,
+        enable_prefix_caching=enable_prefix_caching,
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if tensor_parallel_size > 1:
+        import ctypes
+
+        ctypes.CDLL(None).uselocale(-1)
+    return llm, tokenizer
+
+
+def _release_vllm_engine(llm):
+    from vllm.distributed.parallel_state import destroy_model_parallel
+
+    destroy_model_parallel()
+    del llm.llm_engine.model_executor
+
+
+def register_engine_factory(provider: str, load_fn, release_fn=None):
+    """Registers how to load (and release) engines for a provider.
+
+    `load_fn(model_name, **engine_args)` must return a `(llm, tokenizer)` tuple.
+    """
+    _ENGINE_FACTORIES[provider] = (load_fn, release_fn)
+
+
+register_engine_factory("vllm", _load_vllm_engine, _release_vllm_engine)
+
+
+def engine_key(provider: str, model_name: str, **engine_args) -> tuple:
+    return (
+        provider,
+        model_name,
+        tuple(
+            sorted(
+                (name, value)
+                for name, value in engine_args.items()
+                if name not in RESOURCE_ARGS
+            )
+        ),
+    )
+
+
+def acquire_engine(provider: str, model_name: str, **engine_args) -> SharedEngine:
+    """Returns the engine for (provider, model_name, engine_args), loading it if needed."""
+    key = engine_key(provider, model_name, **engine_args)
+    with _registry_lock:
+        engine = _ENGINES.get(key)
+        if engine is None:
+            if provider not in _ENGINE_FACTORIES:
+                raise ValueError(f"No engine factory registered for: {provider}")
+            load_fn, _ = _ENGINE_FACTORIES[provider]
+            llm, tokenizer = load_fn(model_name, **engine_args)
+            engine = SharedEngine(key, llm, tokenizer)
+            _ENGINES[key] = engine
+        engine.ref_count += 1
+    return engine
+
+
+def release_engine(engine: SharedEngine) -> bool:
+    """Drops one reference to the engine, releasing it if it was the last one.
+
+    Returns whether the engine was released. Releasing an engine that is already
+    released is a no-op.
+    """
+    with _registry_lock:
+        if engine.ref_count <= 0 or _ENGINES.get(engine.key) is not engine:
+            return False
+        engine.ref_count -= 1
+        if engine.ref_count > 0:
+            return False
+        _ENGINES.pop(engine.key, None)
+        _, release_fn = _ENGINE_FACTORIES[engine.key[0]]
+        if release_fn is not None:
+            release_fn(engine.llm)
+        engine.llm = None
+    return True
+
+
+def loaded_engines() -> list[SharedEngine]:
+    with _registry_lock:
+        return list(_ENGINES.values())
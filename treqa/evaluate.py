@@ -1,13 +1,25 @@
 """Evaluate MT systems using QA-based evaluation."""
 
 import argparse
+import hashlib
+import itertools
 import json
+import os
+import sys
+import tempfile
 
 from treqa.scorers import METRICS_REGISTRY
 from treqa.question_answering import QA_MODELS_REGISTRY
 from treqa.answer_extraction import AE_MODELS_REGISTRY
 from treqa.answer_matching import AM_MODELS_REGISTRY
+from treqa.question_generation import QG_MODELS_REGISTRY, BaseQAGModel
 from treqa.prompt_model import PromptModel
+from treqa.pipeline import run_pipeline
+
+# shard size used when --shard-size is not set, for on-the-fly QA generation or
+# when --checkpoint-dir is set
+DEFAULT_SHARD_SIZE = 64
+DEFAULT_CHECKPOINT_DIR = "treqa_checkpoints"
 
 
 def read_args() -> argparse.Namespace:
@@ -15,8 +27,9 @@ def read_args() -> argparse.Namespace:
     parser.add_argument(
         "--hyp",
         type=str,
+        nargs="+",
         required=True,
-        help="Path to the file containing MT system outputs.",
+        help="Path to the file(s) containing MT system outputs. Multiple systems are scored together, sharing models and reference answers.",
     )
     parser.add_argument(
         "--src",
@@ -54,6 +67,32 @@ def read_args() -> argparse.Namespace:
         help="Path to the file containing QA pairs. If not set, the model will generate QA pairs.",
     )
 
+    parser.add_argument(
+        "--qg-model",
+        type=str,
+        choices=QG_MODELS_REGISTRY.keys(),
+        default="prompt_qag",
+        help="Name of the model to use for on-the-fly QA generation, when --qa-file is not set.",
+    )
+    parser.add_argument(
+        "--qg-model-args",
+        type=json.loads,
+        default=r"{}",
+        help="Arguments to pass to the QA generation model, in the format of a JSON dictionary string.",
+    )
+    parser.add_argument(
+        "--num-questions",
+        type=int,
+        default=None,
+        help="Number of questions to generate per segment.",
+    )
+    parser.add_argument(
+        "--save-qa-file",
+        type=str,
+        default=None,
+        help="Path to save the QA pairs generated on the fly, in the same format as --qa-file.",
+    )
+
     # QA-related arguments
     parser.add_argument(
         "--qa-model",
@@ -83,6 +122,12 @@ def read_args() -> argparse.Namespace:
         default=r"{}",
         help="Arguments to pass to the answer extraction model, in the format of a JSON dictionary string.",
     )
+    parser.add_argument(
+        "--langs",
+        type=str,
+        default=None,
+        help="Path to a file with the language (or language pair, e.g. en-de) of each line, for mixed-language corpora. The spacy answer extractor keeps at most `max_loaded_models` (default: 2, set through --ae-model-args) language models loaded at once.",
+    )
     parser.add_argument(
         "--keyphrase-comparator",
         default="jaccard",
@@ -108,17 +153,42 @@ def read_args() -> argparse.Namespace:
     parser.add_argument(
         "--save-scores",
         type=str,
+        nargs="+",
         default=None,
-        help="Path to save the scores.",
+        help="Path(s) to save the scores, one per hypothesis file.",
     )
     parser.add_argument(
         "--save-detailed-evaluation",
         type=str,
+        nargs="+",
         default=None,
-        help="Path to save the full evaluation results.",
+        help="Path(s) to save the full evaluation results, one per hypothesis file.",
     )
 
-    return parser.parse_args()
+    # streaming arguments
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=None,
+        help=f"If set, process the corpus in shards of this many segments, writing results incrementally to --checkpoint-dir so that interrupted runs can be resumed. On-the-fly QA generation always runs over shards ({DEFAULT_SHARD_SIZE} segments by default), but only keeps them when this or --checkpoint-dir is set.",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        default=None,
+        help=f"Directory where per-shard results and the checkpoint manifest are written, so that interrupted runs can be resumed. Setting it enables sharding. Defaults to a per-configuration subdirectory of {DEFAULT_CHECKPOINT_DIR} when --shard-size is set.",
+    )
+
+    args = parser.parse_args()
+
+    for output_arg in ["save_scores", "save_detailed_evaluation"]:
+        output_paths = getattr(args, output_arg)
+        if output_paths is not None and len(output_paths) != len(args.hyp):
+            raise ValueError(
+                f"--{output_arg.replace('_', '-')} must be given one path per hypothesis file."
+            )
+
+    return args
 
 
 def load_qa_pairs(qa_file: str) -> list[list[dict[str, str]]]:
@@ -126,41 +196,19 @@ def load_qa_pairs(qa_file: str) -> list[list[dict[str, str]]]:
         return [json.loads(line.strip()) for line in f]
 
 
-def main():
-    args = read_args()
-    with open(args.src, "r") as f:
-        sources = f.readlines()
-    with open(args.hyp, "r") as f:
-        hypotheses = f.readlines()
-
+def build_scorer(args: argparse.Namespace):
     # TODO: is this the best way to handle optional arguments?
-    init_kwargs = args.scorer_init_args
-    score_kwargs = {}
+    init_kwargs = dict(args.scorer_init_args)
 
-    if args.ref is not None:
-        with open(args.ref, "r") as f:
-            references = f.readlines()
-        score_kwargs["references"] = references
-
-    # for treqa, we need to load QA pairs and QA model
+    # for treqa, we need the QA and AM models
     if args.scorer == "treqa" or args.scorer == "treqa_qe":
-        if args.qa_file is None:
-            raise ValueError(
-                "On-the-fly QA generation is not supported yet. Please generate QA pairs first using treqa-generate."
-            )
-
-        # In case we have already computed QA pairs, load them
-        qa_pairs = load_qa_pairs(args.qa_file)
-
-        # Check if the number of QA pairs matches the number of MT outputs
-        if len(qa_pairs) != len(hypotheses):
-            raise ValueError(
-                "The number of QA pairs does not match the number of MT outputs."
-            )
-
         # Initialize QA model
         qa_model = QA_MODELS_REGISTRY[args.qa_model](**args.qa_model_args)
         init_kwargs["qa_model"] = qa_model
+        # "parent_prompt_model" reuses the QA model as is, whatever its provider (e.g.
+        # a litellm API), sampling parameters and response cache. The engine registry
+        # only shares loaded vLLM engines, between components with their own sampling
+        # parameters, so both are needed.
         if (
             args.am_model == "prompt_am"
             and args.am_model_args["provider"] == "parent_prompt_model"
@@ -170,10 +218,6 @@ def main():
         init_kwargs["answer_comparator"] = AM_MODELS_REGISTRY[args.am_model](
             **args.am_model_args
         )
-        score_kwargs["qa_pairs"] = qa_pairs
-        score_kwargs["return_detailed_evaluation"] = (
-            args.save_detailed_evaluation is not None
-        )
 
     elif args.scorer == "keyphrase":
         # Initialize AE model
@@ -181,43 +225,487 @@ def main():
         init_kwargs["ae_model"] = ae_model
         init_kwargs["comparator"] = args.keyphrase_comparator
 
-    scorer = METRICS_REGISTRY[args.scorer](**init_kwargs)
+    return METRICS_REGISTRY[args.scorer](**init_kwargs)
+
+
+def score_systems(
+    scorer,
+    args: argparse.Namespace,
+    sources: list[str],
+    hypotheses_per_system: list[list[str]],
+    references: list[str] | None,
+    qa_pairs: list[list[dict[str, str]]] | None,
+    langs: list[str] | None = None,
+) -> list:
+    score_kwargs = {}
+    if references is not None:
+        score_kwargs["references"] = references
+    if args.scorer == "keyphrase" and langs is not None:
+        score_kwargs["langs"] = langs
+    if args.scorer == "gemba" and langs is not None:
+        # gemba needs the language pair (e.g. en-de) of each line
+        score_kwargs["lps"] = langs
+    if args.scorer == "treqa" or args.scorer == "treqa_qe":
+        score_kwargs["qa_pairs"] = qa_pairs
+        score_kwargs["return_detailed_evaluation"] = (
+            args.save_detailed_evaluation is not None
+        )
+
+    # Compute scores, for all systems at once
+    return scorer.get_scores_multi(
+        hypotheses_per_system, sources=sources, **score_kwargs
+    )
+
 
-    # Compute scores
-    outputs = scorer.get_scores(hypotheses, sources=sources, **score_kwargs)
+def write_system_outputs(args, outputs, scores_file=None, detailed_file=None):
+    """Writes one system's segment scores (and detailed evaluation) and returns the segment scores."""
     if not args.save_detailed_evaluation:
         segment_scores = outputs
     else:
-        if args.scorer not in ["treqa", "treqa_qe"]:
+        segment_scores, predicted_answers, reference_answers, per_q_scores = outputs
+
+    if scores_file is not None:
+        for score in segment_scores:
+            print(score, file=scores_file)
+    if detailed_file is not None:
+        # create jsonl with predicted_answers, reference_answers, per_q_scores
+        for i in range(len(segment_scores)):
+            print(
+                json.dumps(
+                    {
+                        "predicted_answers": predicted_answers[i],
+                        "reference_answers": reference_answers[i],
+                        "per_q_scores": per_q_scores[i],
+                    },
+                ),
+                file=detailed_file,
+            )
+    return segment_scores
+
+
+def print_overall_score(args, hyp_file, overall_score):
+    if len(args.hyp) == 1:
+        print(f"{args.scorer}: {overall_score:.4f}")
+    else:
+        print(f"{args.scorer} ({hyp_file}): {overall_score:.4f}")
+
+
+def load_langs(langs_file: str) -> list[str]:
+    with open(langs_file, "r") as f:
+        return [line.strip() for line in f]
+
+
+def count_lines(path: str) -> int:
+    with open(path, "r") as f:
+        return sum(1 for _ in f)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def check_line_counts(args: argparse.Namespace):
+    """Checks that every input file has one line per source, before streaming them."""
+    num_sources = count_lines(args.src)
+    for hyp_file in args.hyp:
+        if count_lines(hyp_file) != num_sources:
             raise ValueError(
-                f"Only TREQA metrics support saving detailed evaluation. {args.scorer} is not supported."
+                f"The number of MT outputs in {hyp_file} does not match the number of sources."
+            )
+    for name, description in [
+        ("ref", "references"),
+        ("qa_file", "QA pairs"),
+        ("langs", "languages"),
+    ]:
+        path = getattr(args, name)
+        if path is not None and count_lines(path) != num_sources:
+            raise ValueError(
+                f"The number of {description} does not match the number of sources."
             )
-        segment_scores, predicted_answers, reference_answers, per_q_scores = outputs
 
-    # TODO: for now assume overall score is the mean of segment scores
-    # this breaks for chrf, but lets assume it for now
-    overall_score = sum(segment_scores) / len(segment_scores)
 
-    print(f"{args.scorer}: {overall_score:.4f}")
+def iterate_shards(args: argparse.Namespace):
+    """Lazily yields shards, as dictionaries with the sources, hypotheses_per_system,
+    references, qa_pairs and langs of each shard."""
+    # zip would silently stop at the shortest file
+    check_line_counts(args)
+    files = [open(args.src, "r")] + [open(hyp_file, "r") for hyp_file in args.hyp]
+    optional_inputs = [
+        name for name in ["ref", "qa_file", "langs"] if getattr(args, name) is not None
+    ]
+    for name in optional_inputs:
+        files.append(open(getattr(args, name), "r"))
 
-    if args.save_scores:
-        with open(args.save_scores, "w") as f:
-            for score in segment_scores:
-                print(score, file=f)
-    if args.save_detailed_evaluation:
-        # create jsonl with predicted_answers, reference_answers, per_q_scores
-        with open(args.save_detailed_evaluation, "w") as f:
-            for i, source in enumerate(sources):
-                print(
-                    json.dumps(
-                        {
-                            "predicted_answers": predicted_answers[i],
-                            "reference_answers": reference_answers[i],
-                            "per_q_scores": per_q_scores[i],
-                        },
-                    ),
-                    file=f,
+    try:
+        lines = zip(*files)
+        while True:
+            shard = list(itertools.islice(lines, args.shard_size))
+            if not shard:
+                break
+            columns = list(zip(*shard))
+            optional_columns = dict(
+                zip(optional_inputs, columns[1 + len(args.hyp) :])
+            )
+            yield {
+                "sources": list(columns[0]),
+                "hypotheses_per_system": [
+                    list(c) for c in columns[1 : 1 + len(args.hyp)]
+                ],
+                "references": (
+                    list(optional_columns["ref"]) if "ref" in optional_columns else None
+                ),
+                "qa_pairs": (
+                    [json.loads(line.strip()) for line in optional_columns["qa_file"]]
+                    if "qa_file" in optional_columns
+                    else None
+                ),
+                "langs": (
+                    [line.strip() for line in optional_columns["langs"]]
+                    if "langs" in optional_columns
+                    else None
+                ),
+            }
+    finally:
+        for f in files:
+            f.close()
+
+
+def config_hash(args: argparse.Namespace) -> str:
+    # output paths do not change the results, so they do not invalidate checkpoints
+    ignored = {"save_scores", "save_detailed_evaluation", "checkpoint_dir"}
+    config = {k: v for k, v in vars(args).items() if k not in ignored}
+    for input_arg in ["src", "hyp", "ref", "qa_file", "langs"]:
+        paths = config[input_arg] if isinstance(config[input_arg], list) else [config[input_arg]]
+        # inputs are fingerprinted by content, so edited inputs invalidate checkpoints
+        config[f"{input_arg}_digests"] = [
+            file_digest(path) for path in paths if path is not None
+        ]
+    return hashlib.sha256(
+        json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _write_atomic(path: str, write_fn):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+
+def build_qag_model(args: argparse.Namespace):
+    qg_model_args = args.qg_model_args.copy()
+    if "template" not in qg_model_args:
+        # same defaults as treqa-generate, given the sources, (references) and hypotheses
+        qg_model_args["template"] = (
+            "eng-cands-0shot" if args.ref is not None else "eng-cands"
+        )
+    qg_model = QG_MODELS_REGISTRY[args.qg_model](**qg_model_args)
+    if not isinstance(qg_model, BaseQAGModel):
+        raise ValueError(
+            f"On-the-fly QA generation requires a QAG model. {args.qg_model} is not supported, generate QA pairs first using treqa-generate."
+        )
+    return qg_model
+
+
+def build_stages(args: argparse.Namespace, scorer, qg_model=None) -> list:
+    """Returns the functions that turn a shard into its per-system outputs, one per stage."""
+
+    def score(shard):
+        if shard["qa_pairs"] is not None and len(shard["qa_pairs"]) != len(
+            shard["sources"]
+        ):
+            raise ValueError(
+                "The number of QA pairs does not match the number of MT outputs."
+            )
+        shard["outputs_per_system"] = score_systems(
+            scorer,
+            args,
+            shard["sources"],
+            shard["hypotheses_per_system"],
+            shard["references"],
+            shard["qa_pairs"],
+            shard["langs"],
+        )
+        return shard
+
+    if qg_model is None:
+        return [score]
+
+    def _qag_inputs(shard):
+        passages = [line.strip() for line in shard["sources"]]
+        alt_passages = (
+            [line.strip() for line in shard["references"]]
+            if shard["references"] is not None
+            else None
+        )
+        candidates = [
+            [line.strip() for line in hypotheses]
+            for hypotheses in zip(*shard["hypotheses_per_system"])
+        ]
+        return passages, alt_passages, candidates
+
+    def generate_qa(shard):
+        passages, alt_passages, candidates = _qag_inputs(shard)
+        kwargs = dict(
+            num_questions=args.num_questions,
+            candidates=candidates,
+            alt_passages=alt_passages,
+        )
+        if hasattr(qg_model, "generate_outputs"):
+            # parsing is left to the next stage, to overlap with generation
+            shard["qag_outputs"] = qg_model.generate_outputs(passages, **kwargs)
+        else:
+            shard["qa_pairs"] = qg_model.generate_qa_pairs(passages, **kwargs)
+        return shard
+
+    def parse_qa(shard):
+        if "qag_outputs" in shard:
+            passages, _, _ = _qag_inputs(shard)
+            shard["qa_pairs"] = qg_model.parse_outputs(
+                shard.pop("qag_outputs"), passages
+            )
+        shard["qa_pairs"] = [
+            [{"question": qa_pair[0], "answer": qa_pair[1]} for qa_pair in qa_pairs]
+            for qa_pairs in shard["qa_pairs"]
+        ]
+        return shard
+
+    def answer_questions(shard):
+        shard["passages"] = scorer.get_passages(shard["sources"], shard["references"])
+        shard["answers"] = scorer.answer_questions(
+            shard["hypotheses_per_system"], shard["passages"], shard["qa_pairs"]
+        )
+        return shard
+
+    def match_answers(shard):
+        questions, predicted_answers_per_system, reference_answers = shard.pop(
+            "answers"
+        )
+        shard["outputs_per_system"] = scorer.match_answers(
+            questions,
+            predicted_answers_per_system,
+            reference_answers,
+            shard["passages"],
+            shard["qa_pairs"],
+            return_detailed_evaluation=args.save_detailed_evaluation is not None,
+        )
+        return shard
+
+    return [generate_qa, parse_qa, answer_questions, match_answers]
+
+
+def run_sharded(
+    args: argparse.Namespace, scorer, qg_model=None, resumable: bool = True
+):
+    """Scores the corpus shard by shard, skipping shards completed by a previous run.
+
+    The stages of consecutive shards (e.g. QA generation, question answering and
+    answer matching) run concurrently, see `run_pipeline`. Unless `resumable`, the
+    shards are written to a temporary directory, removed once they are stitched.
+    """
+    if not resumable:
+        with tempfile.TemporaryDirectory(prefix="treqa-shards-") as shard_dir:
+            _run_sharded(args, scorer, qg_model, shard_dir)
+        return
+
+    checkpoint_dir = args.checkpoint_dir
+    if checkpoint_dir is None:
+        # each configuration gets its own directory, so that runs with different
+        # inputs in the same working directory do not collide
+        checkpoint_dir = os.path.join(DEFAULT_CHECKPOINT_DIR, config_hash(args)[:16])
+    print(f"Writing checkpoints to {checkpoint_dir}", file=sys.stderr)
+    _run_sharded(args, scorer, qg_model, checkpoint_dir)
+
+
+def _run_sharded(args: argparse.Namespace, scorer, qg_model, checkpoint_dir: str):
+    run_hash = config_hash(args)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    manifest_path = os.path.join(checkpoint_dir, "manifest.json")
+    manifest = {
+        "config_hash": run_hash,
+        "shard_size": args.shard_size,
+        "completed_shards": [],
+    }
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as f:
+            previous_manifest = json.load(f)
+        if previous_manifest["config_hash"] != manifest["config_hash"]:
+            raise ValueError(
+                f"{checkpoint_dir} contains checkpoints from a different configuration."
+            )
+        manifest = previous_manifest
+    completed_shards = set(manifest["completed_shards"])
+
+    def _shard_path(shard_idx, sys_idx, kind):
+        return os.path.join(
+            checkpoint_dir, f"shard-{shard_idx:06d}.sys-{sys_idx}.{kind}"
+        )
+
+    def _qa_shard_path(shard_idx):
+        return os.path.join(checkpoint_dir, f"shard-{shard_idx:06d}.qa.jsonl")
+
+    num_shards = 0
+
+    def _pending_shards():
+        nonlocal num_shards
+        for shard_idx, shard in enumerate(iterate_shards(args)):
+            num_shards += 1
+            if shard_idx in completed_shards:
+                print(f"Skipping completed shard {shard_idx}")
+                continue
+            shard["idx"] = shard_idx
+            yield shard
+
+    for shard in run_pipeline(_pending_shards(), build_stages(args, scorer, qg_model)):
+        shard_idx = shard["idx"]
+        for sys_idx, outputs in enumerate(shard["outputs_per_system"]):
+            _write_atomic(
+                _shard_path(shard_idx, sys_idx, "scores"),
+                lambda f: write_system_outputs(args, outputs, scores_file=f),
+            )
+            if args.save_detailed_evaluation:
+                _write_atomic(
+                    _shard_path(shard_idx, sys_idx, "detailed.jsonl"),
+                    lambda f: write_system_outputs(args, outputs, detailed_file=f),
                 )
+        if qg_model is not None:
+            _write_atomic(
+                _qa_shard_path(shard_idx),
+                lambda f: f.writelines(
+                    json.dumps(qa_pairs) + "\n" for qa_pairs in shard["qa_pairs"]
+                ),
+            )
+
+        manifest["completed_shards"].append(shard_idx)
+        _write_atomic(manifest_path, lambda f: json.dump(manifest, f))
+
+    if args.save_qa_file is not None and qg_model is not None:
+        with open(args.save_qa_file, "w") as qa_file:
+            for shard_idx in range(num_shards):
+                with open(_qa_shard_path(shard_idx), "r") as f:
+                    for line in f:
+                        qa_file.write(line)
+
+    # stitch the shards together, streaming so that memory stays bounded
+    for sys_idx, hyp_file in enumerate(args.hyp):
+        total, count = 0.0, 0
+        scores_file = (
+            open(args.save_scores[sys_idx], "w") if args.save_scores else None
+        )
+        detailed_file = (
+            open(args.save_detailed_evaluation[sys_idx], "w")
+            if args.save_detailed_evaluation
+            else None
+        )
+        for shard_idx in range(num_shards):
+            with open(_shard_path(shard_idx, sys_idx, "scores"), "r") as f:
+                for line in f:
+                    total += float(line)
+                    count += 1
+                    if scores_file is not None:
+                        scores_file.write(line)
+            if detailed_file is not None:
+                with open(_shard_path(shard_idx, sys_idx, "detailed.jsonl"), "r") as f:
+                    for line in f:
+                        detailed_file.write(line)
+        for f in [scores_file, detailed_file]:
+            if f is not None:
+                f.close()
+
+        # TODO: for now assume overall score is the mean of segment scores
+        print_overall_score(args, hyp_file, total / count)
+
+
+def main():
+    args = read_args()
+    scorer = build_scorer(args)
+    try:
+        run_evaluation(args, scorer)
+    finally:
+        # e.g. chrF scorers/matchers may hold a pool of worker processes
+        if hasattr(scorer, "close"):
+            scorer.close()
+
+
+def run_evaluation(args, scorer):
+
+    if args.save_detailed_evaluation and args.scorer not in ["treqa", "treqa_qe"]:
+        raise ValueError(
+            f"Only TREQA metrics support saving detailed evaluation. {args.scorer} is not supported."
+        )
+
+    qg_model = None
+    if args.scorer in ["treqa", "treqa_qe"] and args.qa_file is None:
+        # generate the QA pairs on the fly, overlapping generation with the later stages
+        qg_model = build_qag_model(args)
+
+    # checkpoints are only kept when asked for
+    resumable = args.shard_size is not None or args.checkpoint_dir is not None
+    if resumable or qg_model is not None:
+        if args.shard_size is None:
+            args.shard_size = DEFAULT_SHARD_SIZE
+        run_sharded(args, scorer, qg_model, resumable=resumable)
+        return
+
+    with open(args.src, "r") as f:
+        sources = f.readlines()
+    hypotheses_per_system = []
+    for hyp_file in args.hyp:
+        with open(hyp_file, "r") as f:
+            hypotheses_per_system.append(f.readlines())
+        if len(hypotheses_per_system[-1]) != len(sources):
+            raise ValueError(
+                f"The number of MT outputs in {hyp_file} does not match the number of sources."
+            )
+
+    references = None
+    if args.ref is not None:
+        with open(args.ref, "r") as f:
+            references = f.readlines()
+
+    qa_pairs = None
+    if args.scorer == "treqa" or args.scorer == "treqa_qe":
+        # In case we have already computed QA pairs, load them
+        qa_pairs = load_qa_pairs(args.qa_file)
+
+        # Check if the number of QA pairs matches the number of MT outputs
+        if len(qa_pairs) != len(sources):
+            raise ValueError(
+                "The number of QA pairs does not match the number of MT outputs."
+            )
+
+    langs = None
+    if args.langs is not None:
+        langs = load_langs(args.langs)
+        if len(langs) != len(sources):
+            raise ValueError(
+                "The number of languages does not match the number of sources."
+            )
+
+    outputs_per_system = score_systems(
+        scorer, args, sources, hypotheses_per_system, references, qa_pairs, langs
+    )
+
+    for sys_idx, (hyp_file, outputs) in enumerate(zip(args.hyp, outputs_per_system)):
+        scores_file = open(args.save_scores[sys_idx], "w") if args.save_scores else None
+        detailed_file = (
+            open(args.save_detailed_evaluation[sys_idx], "w")
+            if args.save_detailed_evaluation
+            else None
+        )
+        segment_scores = write_system_outputs(args, outputs, scores_file, detailed_file)
+        for f in [scores_file, detailed_file]:
+            if f is not None:
+                f.close()
+
+        # TODO: for now assume overall score is the mean of segment scores
+        # this breaks for chrf, but lets assume it for now
+        overall_score = sum(segment_scores) / len(segment_scores)
+        print_overall_score(args, hyp_file, overall_score)
 
 
 if __name__ == "__main__":
@@ -9,6 +9,7 @@ from treqa.question_generation import (
     BaseQAGModel,
     BaseQGModel,
 )
+from treqa.question_generation.near_duplicates import collapse_near_duplicates
 from treqa.answer_extraction import AE_MODELS_REGISTRY
 
 
@@ -50,6 +51,18 @@ def read_args() -> argparse.Namespace:
         help="Number of questions to generate.",
     )
 
+    parser.add_argument(
+        "--collapse-near-duplicates",
+        action="store_true",
+        help="Keep only one question per cluster of near-duplicate questions with the same answer (per passage), found with MinHash/LSH. The collapse ratio is saved to {output_file}.meta.json.",
+    )
+    parser.add_argument(
+        "--near-duplicate-threshold",
+        type=float,
+        default=0.7,
+        help="Minimum Jaccard similarity of character n-grams for two questions to be near-duplicates.",
+    )
+
     # AE-related arguments
     parser.add_argument(
         "--ae-model",
@@ -70,6 +83,12 @@ def read_args() -> argparse.Namespace:
         default=None,
         help="Path to the file containing the answers to the questions. If provided, the answers will be used to generate the questions",
     )
+    parser.add_argument(
+        "--langs",
+        type=str,
+        default=None,
+        help="Path to a file with the language (or language pair, e.g. en-de) of each line, for mixed-language corpora. The spacy answer extractor keeps at most `max_loaded_models` (default: 2, set through --ae-model-args) language models loaded at once.",
+    )
     parser.add_argument(
         "--num-answers",
         type=int,
@@ -154,6 +173,9 @@ def main():
                     json.loads(line.strip()) for line in answers_file.readlines()
                 ]
         else:
+            # "parent_prompt_model" reuses the QG model as is, whatever its provider
+            # (see `build_scorer` in evaluate.py), while the engine registry only
+            # shares loaded vLLM engines between components with their own settings
             if (
                 args.ae_model == "prompt_ae"
                 and args.ae_model_args["provider"] == "parent_prompt_model"
@@ -161,9 +183,17 @@ def main():
             ):
                 args.ae_model_args["parent_prompt_model"] = qg_model
 
+            langs = None
+            if args.langs is not None:
+                with open(args.langs, "r") as langs_file:
+                    langs = [line.strip() for line in langs_file.readlines()]
+                assert (
+                    len(langs) == num_texts
+                ), "Number of languages must be the same as the number of sources/targets"
+
             answer_extractor = AE_MODELS_REGISTRY[args.ae_model](**args.ae_model_args)
             answers = answer_extractor.extract_answers(
-                passages=texts, num_answers=args.num_answers
+                passages=texts, num_answers=args.num_answers, langs=langs
             )
             answer_extractor = None
 
@@ -178,6 +208,15 @@ def main():
                                        qg-model:{args.qg_model}. Change --qg-model arg or implement..."
             )
 
+    metadata = {}
+    if args.collapse_near_duplicates:
+        corpus_qa_pairs, metadata["near_duplicates"] = collapse_near_duplicates(
+            corpus_qa_pairs, threshold=args.near_duplicate_threshold
+        )
+        print(
+            f"Collapsed near-duplicate questions: {metadata['near_duplicates']['collapse_ratio']:.1%} removed"
+        )
+
     # write the questions to the output file
     with open(args.output_file, "w") as output_file:
         for qa_pairs in corpus_qa_pairs:
@@ -186,6 +225,10 @@ def main():
             ]
             print(json.dumps(qa_pairs), file=output_file)
 
+    if metadata:
+        with open(f"{args.output_file}.meta.json", "w") as meta_file:
+            json.dump(metadata, meta_file, indent=2)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,72 @@
+"""Runs a sequence of stages over a stream of items, overlapping the stages."""
+
+import queue
+import threading
+
+_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _feed(items, out_queue: queue.Queue, stop: threading.Event):
+    try:
+        for item in items:
+            if stop.is_set():
+                break
+            out_queue.put(item)
+    except BaseException as e:
+        out_queue.put(_StageError(e))
+    out_queue.put(_DONE)
+
+
+def _work(stage, in_queue: queue.Queue, out_queue: queue.Queue):
+    while True:
+        item = in_queue.get()
+        if item is _DONE or isinstance(item, _StageError):
+            out_queue.put(item)
+            if item is _DONE:
+                return
+            continue
+        try:
+            out_queue.put(stage(item))
+        except BaseException as e:
+            out_queue.put(_StageError(e))
+
+
+def run_pipeline(items, stages: list, max_queued: int = 2):
+    """Applies `stages` in order to every item, yielding the results in input order.
+
+    Each stage runs in its own thread, so that e.g. LLM generation for one item
+    overlaps with CPU-side parsing or answer matching of the previous ones. Stages
+    are connected by queues holding at most `max_queued` items, which bounds memory
+    and keeps fast stages from running far ahead of slow ones. An exception in any
+    stage is re-raised to the caller.
+    """
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=max_queued) for _ in range(len(stages) + 1)]
+    threads = [
+        threading.Thread(target=_feed, args=(items, queues[0], stop), daemon=True)
+    ] + [
+        threading.Thread(
+            target=_work, args=(stage, queues[i], queues[i + 1]), daemon=True
+        )
+        for i, stage in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            result = queues[-1].get()
+            if result is _DONE:
+                break
+            if isinstance(result, _StageError):
+                raise result.exc
+            yield result
+    finally:
+        # stop feeding new items; threads are daemons, so anything still
+        # in flight does not keep the process alive
+        stop.set()
@@ -1,13 +1,74 @@
+import copy
 import json
+import math
 import os
 import gc
+import sys
 import torch
 from abc import ABC, abstractmethod
 from collections import defaultdict
 import vllm
 import litellm
-from transformers import AutoTokenizer
-from vllm.distributed.parallel_state import destroy_model_parallel
+from vllm.inputs import TokensPrompt
+
+from treqa.async_litellm import AsyncLiteLLMClient
+from treqa.cache import ResponseCache, make_cache_key
+from treqa.chat_templates import ChatTokenizer
+from treqa.engine_registry import acquire_engine, release_engine
+
+STOP_SEQUENCES = [
+    "<|im_end|>",
+    "<|eot_id|>",
+    "<|END_OF_TURN_TOKEN|>",
+]
+
+
+def hash_chat(chat: list[dict[str, str]]) -> str:
+    return json.dumps(chat, sort_keys=True)
+
+
+def order_by_prefix(prompts) -> list[int]:
+    """Returns an ordering of the prompts that places shared prefixes next to each other.
+
+    Sorting lexicographically groups prompts that share the same system prompt and
+    passage, so that the prefix cache can reuse them while they are still resident.
+    """
+    return sorted(range(len(prompts)), key=prompts.__getitem__)
+
+
+# whether the missing guided decoding support in vLLM was already reported
+_warned_unguided = False
+
+
+def vllm_guided_json(sampling_params, json_schema: dict):
+    """Returns the sampling params and the extra `LLM.generate` arguments that constrain
+    vLLM outputs to `json_schema`."""
+    global _warned_unguided
+    try:
+        # vLLM >= 0.6.3
+        from vllm.sampling_params import GuidedDecodingParams
+
+        sampling_params = sampling_params.clone()
+        sampling_params.guided_decoding = GuidedDecodingParams(json=json_schema)
+        return sampling_params, {}
+    except ImportError:
+        pass
+    try:
+        # earlier versions (e.g. the pinned 0.6.2) take the options per generate call
+        from vllm.model_executor.guided_decoding.guided_fields import LLMGuidedOptions
+
+        return sampling_params, {
+            "guided_options_request": LLMGuidedOptions(guided_json=json_schema)
+        }
+    except ImportError:
+        pass
+    if not _warned_unguided:
+        print(
+            "WARNING: guided decoding is not available in this vLLM version, so outputs are not constrained.",
+            file=sys.stderr,
+        )
+        _warned_unguided = True
+    return sampling_params, {}
 
 
 class PromptModel(ABC):
@@ -25,6 +86,14 @@ class PromptModel(ABC):
         parent_prompt_model=None,
         gpu_memory_utilization=0.9,
         logprobs=None,
+        cache_path=None,
+        cache_max_size_mb=1024,
+        max_concurrency=16,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        enable_prefix_caching=True,
+        sort_prompts=True,
+        num_tokenizer_workers=0,
     ):
         self.provider = provider
         self.model_name = model_name
@@ -32,15 +101,33 @@ class PromptModel(ABC):
         self.temperature = temperature
         self.top_p = top_p
         self.logprobs = logprobs
+        self.sort_prompts = sort_prompts
+        self.stop = STOP_SEQUENCES if provider == "vllm" else None
+
+        # persistent response cache, shared across runs
+        self.cache = (
+            ResponseCache(cache_path, max_size_mb=cache_max_size_mb)
+            if cache_path is not None
+            else None
+        )
 
         if self.provider == "vllm":
-            self.llm = vllm.LLM(
-                model=model_name,
+            # components using the same model and engine arguments share one engine
+            self.engine = acquire_engine(
+                "vllm",
+                model_name,
                 tensor_parallel_size=tensor_parallel_size,
                 max_model_len=max_model_len,
                 gpu_memory_utilization=gpu_memory_utilization,
+                enable_prefix_caching=enable_prefix_caching,
+            )
+            self.llm = self.engine.llm
+            # components sharing an engine run in different pipeline threads, and a
+            # fast tokenizer cannot be used from several threads at once
+            self.tokenizer = copy.deepcopy(self.engine.tokenizer)
+            self.chat_tokenizer = ChatTokenizer(
+                self.tokenizer, num_workers=num_tokenizer_workers
             )
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
             self.sampling_params = vllm.SamplingParams(
                 use_beam_search=False,
                 best_of=1,
@@ -48,20 +135,28 @@ class PromptModel(ABC):
                 top_p=top_p,
                 max_tokens=max_tokens,
                 logprobs=logprobs,
-                stop=[
-                    "<|im_end|>",
-                    "<|eot_id|>",
-                    "<|END_OF_TURN_TOKEN|>",
-                ],
+                stop=self.stop,
             )
-            if tensor_parallel_size > 1:
-                import ctypes
-
-                ctypes.CDLL(None).uselocale(-1)
         elif self.provider == "litellm":
             self.base_url = base_url
             self.api_key = api_key or os.environ.get("LITELLM_API_KEY")
             # assert self.api_key is not None, "api_key must be provided for litellm"
+        elif self.provider == "litellm_async":
+            self.base_url = base_url
+            self.api_key = api_key or os.environ.get("LITELLM_API_KEY")
+            self.async_client = AsyncLiteLLMClient(
+                model_name=model_name,
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_concurrency=max_concurrency,
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                completion_kwargs={
+                    "temperature": temperature,
+                    "top_p": top_p,
+                    "max_tokens": max_tokens,
+                },
+            )
         elif self.provider == "parent_prompt_model":
             assert (
                 parent_prompt_model is not None
@@ -75,9 +170,12 @@ class PromptModel(ABC):
         pass
 
     def cleanup_model(self):
-        if self.provider == "vllm":
-            destroy_model_parallel()
-            del self.llm.llm_engine.model_executor
+        # cleaning up twice must not drop another component's reference to the engine
+        if self.provider == "vllm" and self.engine is not None:
+            self.chat_tokenizer.close()
+            # the engine is only released once its last user is cleaned up
+            release_engine(self.engine)
+            self.engine = None
             del self.llm
         gc.collect()
         torch.cuda.empty_cache()
@@ -93,42 +191,245 @@ class PromptModel(ABC):
             prompt = prompt.replace(self.tokenizer.bos_token, "")
         return prompt
 
-    def generate(self, chats, unique_only=True):
+    def count_tokens(self, chats: list[list[dict[str, str]]]) -> list[int]:
+        """Number of prompt tokens of each chat, cached across calls."""
         if self.provider == "parent_prompt_model":
-            return self.parent_prompt_model.generate(chats)
+            return self.parent_prompt_model.count_tokens(chats)
+        return self.chat_tokenizer.count_tokens(
+            chats, [hash_chat(chat) for chat in chats]
+        )
 
-        # Create a mapping of unique prompts to their indices
-        # this is avoid duplicate computation when generating questions
-        # TODO: is this the right abstraction layer to do this?
-        def _hash_chat(chat: list[dict[str, str]]):
-            return json.dumps(chat, sort_keys=True)
+    def _cache_key(self, chat: list[dict[str, str]], tag=None) -> str:
+        return make_cache_key(
+            self.model_name,
+            chat,
+            self.temperature,
+            self.top_p,
+            self.max_tokens,
+            self.stop,
+            tag,
+        )
 
-        if unique_only:
-            chat_to_indices = defaultdict(list)
-            unique_chats = []
-            for i, chat in enumerate(chats):
-                if _hash_chat(chat) not in chat_to_indices:
-                    unique_chats.append(chat)
-                chat_to_indices[_hash_chat(chat)].append(i)
-        else:
-            unique_chats = chats
+    def _vllm_generate(self, chats, sampling_params, **generate_kwargs):
+        # render and tokenize in batches, and hand the token ids to the engine
+        token_ids = self.chat_tokenizer.tokenize(
+            chats, [hash_chat(chat) for chat in chats]
+        )
+        order = (
+            order_by_prefix(token_ids)
+            if self.sort_prompts
+            else list(range(len(token_ids)))
+        )
+        with self.engine.lock:
+            responses = self.llm.generate(
+                [TokensPrompt(prompt_token_ids=token_ids[i]) for i in order],
+                sampling_params,
+                **generate_kwargs,
+            )
+        # restore the original order
+        ordered_responses = [None] * len(token_ids)
+        for i, response in zip(order, responses):
+            ordered_responses[i] = response
+        return ordered_responses
 
+    def _generate(self, chats, on_result=None):
         if self.provider == "vllm":
-            prompts = [self.prepare_prompt(chat) for chat in unique_chats]
-            responses = self.llm.generate(prompts, self.sampling_params)
-            unique_outputs = [response.outputs[0].text for response in responses]
+            responses = self._vllm_generate(chats, self.sampling_params)
+            outputs = [response.outputs[0].text for response in responses]
         elif self.provider == "litellm":
             responses = litellm.batch_completion(
                 api_key=self.api_key,
                 base_url=self.base_url,
                 model=self.model_name,
-                messages=unique_chats,
+                messages=chats,
                 max_retries=10,
             )
 
-            unique_outputs = [
-                response.choices[0].message.content for response in responses
-            ]
+            outputs = [response.choices[0].message.content for response in responses]
+        elif self.provider == "litellm_async":
+            outputs = self.async_client.generate(chats, on_result=on_result)
+        return outputs
+
+    def _generate_logprobs(self, chats, num_logprobs, on_result=None):
+        """Top `num_logprobs` log-probabilities of the first generated token, JSON-encoded."""
+
+        def _add(top_logprobs, token, logprob):
+            # different token ids can decode to the same string
+            if token in top_logprobs:
+                logprob = max(logprob, top_logprobs[token]) + math.log1p(
+                    math.exp(-abs(logprob - top_logprobs[token]))
+                )
+            top_logprobs[token] = logprob
+
+        def _from_litellm(response):
+            top_logprobs = {}
+            for candidate in response.choices[0].logprobs.content[0].top_logprobs:
+                _add(top_logprobs, candidate.token, candidate.logprob)
+            return json.dumps(top_logprobs)
+
+        if self.provider == "vllm":
+            sampling_params = vllm.SamplingParams(
+                temperature=0.0, max_tokens=1, logprobs=num_logprobs
+            )
+            outputs = []
+            for response in self._vllm_generate(chats, sampling_params):
+                top_logprobs = {}
+                for logprob in response.outputs[0].logprobs[0].values():
+                    _add(top_logprobs, logprob.decoded_token, logprob.logprob)
+                outputs.append(json.dumps(top_logprobs))
+        elif self.provider == "litellm":
+            responses = litellm.batch_completion(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                model=self.model_name,
+                messages=chats,
+                max_retries=10,
+                temperature=0.0,
+                max_tokens=1,
+                logprobs=True,
+                top_logprobs=num_logprobs,
+            )
+            outputs = [_from_litellm(response) for response in responses]
+        elif self.provider == "litellm_async":
+            outputs = self.async_client.generate(
+                chats,
+                on_result=on_result,
+                response_fn=_from_litellm,
+                temperature=0.0,
+                max_tokens=1,
+                logprobs=True,
+                top_logprobs=num_logprobs,
+            )
+        return outputs
+
+    def _generate_structured(self, chats, json_schema, on_result=None):
+        """Generates outputs constrained to `json_schema`, where the provider supports it."""
+        response_format = {
+            "type": "json_schema",
+            "json_schema": {
+                "name": json_schema.get("title", "response"),
+                "schema": json_schema,
+            },
+        }
+        if self.provider == "vllm":
+            sampling_params, generate_kwargs = vllm_guided_json(
+                self.sampling_params, json_schema
+            )
+            responses = self._vllm_generate(chats, sampling_params, **generate_kwargs)
+            outputs = [response.outputs[0].text for response in responses]
+        elif self.provider == "litellm":
+            responses = litellm.batch_completion(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                model=self.model_name,
+                messages=chats,
+                max_retries=10,
+                response_format=response_format,
+            )
+            outputs = [response.choices[0].message.content for response in responses]
+        elif self.provider == "litellm_async":
+            outputs = self.async_client.generate(
+                chats, on_result=on_result, response_format=response_format
+            )
+        return outputs
+
+    def _generate_cached(self, chats, generate_fn, tag=None):
+        keys = [self._cache_key(chat, tag) for chat in chats]
+        outputs = self.cache.get_many(keys)
+        missing = [i for i, output in enumerate(outputs) if output is None]
+        if missing:
+            # providers that stream results back persist them as they finish,
+            # so an interrupted run can resume from the cache
+            persisted = set()
+
+            def _persist(j, output):
+                if output is not None:
+                    self.cache.put(keys[missing[j]], output)
+                    persisted.add(j)
+
+            new_outputs = generate_fn([chats[i] for i in missing], on_result=_persist)
+            for i, output in zip(missing, new_outputs):
+                outputs[i] = output
+            self.cache.put_many(
+                [
+                    (keys[i], output)
+                    for j, (i, output) in enumerate(zip(missing, new_outputs))
+                    if output is not None and j not in persisted
+                ]
+            )
+        self.cache.report(self.__class__.__name__)
+        return outputs
+
+    def generate(self, chats, unique_only=True, use_cache=True):
+        if self.provider == "parent_prompt_model":
+            return self.parent_prompt_model.generate(
+                chats, unique_only=unique_only, use_cache=use_cache
+            )
+        return self._run_generation(
+            chats, self._generate, unique_only=unique_only, use_cache=use_cache
+        )
+
+    def generate_logprobs(self, chats, num_logprobs=20) -> list[dict[str, float]]:
+        """Returns the top log-probabilities of the first generated token of each chat.
+
+        A single prefill (and one decoding step) per chat, keyed by the decoded token.
+        """
+        if self.provider == "parent_prompt_model":
+            return self.parent_prompt_model.generate_logprobs(chats, num_logprobs)
+        outputs = self._run_generation(
+            chats,
+            lambda chats, on_result=None: self._generate_logprobs(
+                chats, num_logprobs, on_result=on_result
+            ),
+            tag=("logprobs", num_logprobs),
+        )
+        return [json.loads(output) for output in outputs]
+
+    def generate_structured(
+        self, chats, json_schema: dict, use_cache=True
+    ) -> list[str]:
+        """Generates one JSON output per chat, following `json_schema` (with guided
+        decoding for vLLM and `response_format` for LiteLLM providers).
+
+        Outputs are not guaranteed to be valid if the provider ignores the schema, so
+        callers should still handle parsing errors.
+        """
+        if self.provider == "parent_prompt_model":
+            return self.parent_prompt_model.generate_structured(
+                chats, json_schema, use_cache=use_cache
+            )
+        return self._run_generation(
+            chats,
+            lambda chats, on_result=None: self._generate_structured(
+                chats, json_schema, on_result=on_result
+            ),
+            tag=("json_schema", make_cache_key(json_schema)),
+            use_cache=use_cache,
+        )
+
+    def _run_generation(
+        self, chats, generate_fn, unique_only=True, tag=None, use_cache=True
+    ):
+        # Create a mapping of unique prompts to their indices
+        # this is avoid duplicate computation when generating questions
+        # TODO: is this the right abstraction layer to do this?
+        if unique_only:
+            chat_to_indices = defaultdict(list)
+            unique_chats = []
+            for i, chat in enumerate(chats):
+                if hash_chat(chat) not in chat_to_indices:
+                    unique_chats.append(chat)
+                chat_to_indices[hash_chat(chat)].append(i)
+        else:
+            unique_chats = chats
+
+        # NOTE: repeated chats (unique_only=False) are intentional resamples,
+        # so they should not be answered from the cache; callers that cache their
+        # own (e.g. parsed) outputs skip it with use_cache=False
+        if self.cache is not None and unique_only and use_cache:
+            unique_outputs = self._generate_cached(unique_chats, generate_fn, tag)
+        else:
+            unique_outputs = generate_fn(unique_chats)
 
         assert len(unique_chats) == len(unique_outputs)
 
@@ -136,7 +437,7 @@ class PromptModel(ABC):
             # map the unique outputs back to the original indices
             outputs = [None] * len(chats)
             for unique_chat, unique_output in zip(unique_chats, unique_outputs):
-                for original_index in chat_to_indices[_hash_chat(unique_chat)]:
+                for original_index in chat_to_indices[hash_chat(unique_chat)]:
                     outputs[original_index] = unique_output
         else:
             outputs = unique_outputs
@@ -1,7 +1,55 @@
+import json
+import re
+
 from ..prompt_model import PromptModel
 
 from .qa_model import BaseQAModel
-from .qa_templates import template_dict, system_prompt_dict
+from .qa_templates import template_dict, system_prompt_dict, multi_template_dict
+
+NUMBERED_ANSWER_REGEX = re.compile(r"^\s*(?:answer\s*)?(\d+)\s*[.):\-]\s*(.*)$", re.I)
+
+
+def _clean_answer(answer) -> str | None:
+    if isinstance(answer, dict):
+        answer = answer.get("answer")
+    if answer is None:
+        return None
+    answer = str(answer).strip().strip('"').strip()
+    return answer or None
+
+
+def parse_answer_list(output: str, num_answers: int) -> list[str | None]:
+    """Parses the answers of a multi-question prompt.
+
+    Accepts a JSON list (or a JSON object keyed by question number) and falls back
+    to numbered lines. Answers that could not be parsed are returned as None.
+    """
+    answers = [None] * num_answers
+
+    start, end = output.find("["), output.rfind("]")
+    if start == -1 or end <= start:
+        start, end = output.find("{"), output.rfind("}")
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(output[start : end + 1])
+        except json.JSONDecodeError:
+            parsed = None
+        # without numbering, a list of the wrong length cannot be aligned
+        if isinstance(parsed, list) and len(parsed) == num_answers:
+            return [_clean_answer(answer) for answer in parsed]
+        if isinstance(parsed, dict):
+            for key, answer in parsed.items():
+                if str(key).strip().isdigit() and 1 <= int(key) <= num_answers:
+                    answers[int(key) - 1] = _clean_answer(answer)
+            return answers
+
+    for line in output.split("\n"):
+        match = NUMBERED_ANSWER_REGEX.match(line)
+        if match and 1 <= int(match.group(1)) <= num_answers:
+            idx = int(match.group(1)) - 1
+            if answers[idx] is None:
+                answers[idx] = _clean_answer(match.group(2))
+    return answers
 
 
 class PromptQA(PromptModel, BaseQAModel):
@@ -9,29 +57,19 @@ class PromptQA(PromptModel, BaseQAModel):
         self,
         provider="vllm",
         model_name="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=1024,
-        max_model_len=None,
-        temperature=0.0,
-        top_p=1.0,
-        tensor_parallel_size=1,
-        base_url="https://cmu.litellm.ai",
-        api_key=None,
         template="standard",
         system_template="standard",
+        questions_per_prompt=1,
+        **prompt_model_kwargs,
     ):
         super().__init__(
             provider=provider,
             model_name=model_name,
-            max_tokens=max_tokens,
-            max_model_len=max_model_len,
-            temperature=temperature,
-            top_p=top_p,
-            tensor_parallel_size=tensor_parallel_size,
-            base_url=base_url,
-            api_key=api_key,
+            **prompt_model_kwargs,
         )
         self.template = template_dict[template]
         self.system_prompt = system_prompt_dict[system_template]
+        self.questions_per_prompt = questions_per_prompt
 
     def prepare_chat(self, passage: str, question: str) -> list[dict[str, str]]:
         query_prompt = self.template.format(passage=passage, question=question)
@@ -41,13 +79,87 @@ class PromptQA(PromptModel, BaseQAModel):
         ]
         return chat
 
+    def _multi_template(self) -> str:
+        # look up by value, since scorers swap `self.template` for the reference answers
+        for name, template in template_dict.items():
+            if template == self.template and name in multi_template_dict:
+                return multi_template_dict[name]
+        raise ValueError("The current template has no multi-question variant.")
+
+    def prepare_multi_chat(
+        self, passage: str, questions: list[str]
+    ) -> list[dict[str, str]]:
+        questions_str = "\n".join(
+            f"{i+1}. {question}" for i, question in enumerate(questions)
+        )
+        query_prompt = self._multi_template().format(
+            passage=passage, questions=questions_str
+        )
+        chat = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "user", "content": query_prompt},
+        ]
+        return chat
+
     def extract_answers(
         self,
         passages: list[str],
         questions: list[list[str]],
         answer_file: str = "answers.json",
     ) -> list[list[str]]:
+        if self.questions_per_prompt > 1:
+            answers = self._extract_answers_multi(passages, questions)
+        else:
+            answers = self._extract_answers_single(passages, questions)
 
+        # HACK: dump answers to file
+        with open(answer_file, "w") as f:
+            json.dump(answers, f)
+
+        return answers
+
+    def _extract_answers_multi(
+        self, passages: list[str], questions: list[list[str]]
+    ) -> list[list[str]]:
+        # one chat per chunk of `questions_per_prompt` questions of the same passage
+        all_chats = []
+        chunks = []
+        for passage_idx, (passage, passage_qs) in enumerate(zip(passages, questions)):
+            for start in range(0, len(passage_qs), self.questions_per_prompt):
+                chunk_qs = passage_qs[start : start + self.questions_per_prompt]
+                all_chats.append(self.prepare_multi_chat(passage, chunk_qs))
+                chunks.append((passage_idx, start, len(chunk_qs)))
+        all_outputs = self.generate(all_chats)
+
+        answers = [[None] * len(passage_qs) for passage_qs in questions]
+        for (passage_idx, start, num_qs), output in zip(chunks, all_outputs):
+            for i, answer in enumerate(parse_answer_list(output, num_qs)):
+                answers[passage_idx][start + i] = answer
+
+        # fall back to one prompt per question for the answers that failed to parse
+        failed = [
+            (passage_idx, q_idx)
+            for passage_idx, passage_answers in enumerate(answers)
+            for q_idx, answer in enumerate(passage_answers)
+            if answer is None
+        ]
+        if failed:
+            print(
+                f"Failed to parse {len(failed)} answers, falling back to single-question prompts."
+            )
+            fallback_answers = self.generate(
+                [
+                    self.prepare_chat(passages[passage_idx], questions[passage_idx][q_idx])
+                    for passage_idx, q_idx in failed
+                ]
+            )
+            for (passage_idx, q_idx), answer in zip(failed, fallback_answers):
+                answers[passage_idx][q_idx] = answer
+        return answers
+
+    def _extract_answers_single(
+        self, passages: list[str], questions: list[list[str]]
+    ) -> list[list[str]]:
         all_chats = []
         for passage, passage_qs in zip(passages, questions):
             passage_chats = [
@@ -64,10 +176,4 @@ class PromptQA(PromptModel, BaseQAModel):
             answers.append(all_answers[idx : idx + len(passage_qs)])
             idx += len(passage_qs)
 
-        # HACK: dump answers to file
-        with open(answer_file, "w") as f:
-            import json
-
-            json.dump(answers, f)
-
         return answers
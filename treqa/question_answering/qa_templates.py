@@ -46,3 +46,40 @@ template_dict = {
     "eng-standard": ENG_QUERY_TEMPLATE,
     "eng-detailed": ENG_DETAILED_TEMPLATE,
 }
+
+# multi-question variants: all questions for a passage are answered in a single prompt
+MULTI_QUERY_TEMPLATE = """Given the following passage and numbered questions, extract the exact answer to each question from the passage. Each answer should be a short span of text found verbatim in the passage. Return the answers as a JSON list of strings, with exactly one answer per question, in the same order as the questions.
+###
+Passage:
+{passage}
+###
+Questions:
+{questions}
+###
+Answers:"""
+
+MULTI_ENG_QUERY_TEMPLATE = """Given the following passage and numbered questions, return the answer to each question in English using only the information from the passage. Each answer should be a concise response based on the provided content. Return the answers as a JSON list of strings, with exactly one answer per question, in the same order as the questions.
+###
+Passage:
+{passage}
+###
+Questions:
+{questions}
+###
+Answers:"""
+
+MULTI_ENG_DETAILED_TEMPLATE = """Given a passage written in a non-English language, followed by numbered questions written in English. Your task is to extract the answer to each question from the passage and provide it in English. If the answer is not explicitly mentioned in the passage, answer "The passage does not provide this information." Return the answers as a JSON list of strings, with exactly one answer per question, in the same order as the questions.
+###
+Passage:
+{passage}
+###
+Questions:
+{questions}
+###
+Answers:"""
+
+multi_template_dict = {
+    "standard": MULTI_QUERY_TEMPLATE,
+    "eng-standard": MULTI_ENG_QUERY_TEMPLATE,
+    "eng-detailed": MULTI_ENG_DETAILED_TEMPLATE,
+}
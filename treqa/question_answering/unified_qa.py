@@ -3,6 +3,7 @@ from tqdm import tqdm
 from transformers import T5Tokenizer, T5ForConditionalGeneration
 import torch
 
+from ..dedup import DedupStats, run_deduplicated
 from .qa_model import BaseQAModel
 
 
@@ -17,12 +18,17 @@ class UnifiedQA(BaseQAModel):
         self.model = T5ForConditionalGeneration.from_pretrained(model_name).to(device)
         self.batch_size = batch_size
         self.device = device
+        self.dedup_stats = DedupStats("unified_qa")
 
     def prepare_input(self, passage: str, question: str) -> str:
         return f"{question} \\n {passage}".lower()
 
     def extract_answers(
-        self, passages: list[str], questions: list[list[str]]
+        self,
+        passages: list[str],
+        questions: list[list[str]],
+        # accepted for compatibility with PromptQA; answers are not dumped
+        answer_file: str | None = None,
     ) -> list[list[str]]:
         all_inputs = []
         for passage, passage_questions in zip(passages, questions):
@@ -30,6 +36,21 @@ class UnifiedQA(BaseQAModel):
                 [self.prepare_input(passage, q) for q in passage_questions]
             )
 
+        # repeated (passage, question) pairs, e.g. across agreeing systems, are
+        # only answered once
+        all_answers = run_deduplicated(
+            self._generate_answers, all_inputs, stats=self.dedup_stats
+        )
+
+        answers = []
+        idx = 0
+        for passage_qs in questions:
+            answers.append(all_answers[idx : idx + len(passage_qs)])
+            idx += len(passage_qs)
+
+        return answers
+
+    def _generate_answers(self, all_inputs: list[str]) -> list[str]:
         all_answers = []
         for i in tqdm(
             range(0, len(all_inputs), self.batch_size),
@@ -50,10 +71,4 @@ class UnifiedQA(BaseQAModel):
             )
             all_answers.extend(batch_answers)
 
-        answers = []
-        idx = 0
-        for passage_qs in questions:
-            answers.append(all_answers[idx : idx + len(passage_qs)])
-            idx += len(passage_qs)
-
-        return answers
+        return all_answers
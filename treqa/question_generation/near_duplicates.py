@@ -0,0 +1,157 @@
+"""Collapsing of near-duplicate (e.g. paraphrased) questions with MinHash and LSH."""
+
+import re
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+# hashes are computed modulo a Mersenne prime, small enough that a * x + b fits in 64 bits
+_PRIME = (1 << 31) - 1
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\W+", " ", text.lower()).strip()
+
+
+def _normalize_answer(answer: str) -> str:
+    # case, punctuation and articles do not change the answer
+    return " ".join(
+        word for word in _normalize(answer).split() if word not in {"a", "an", "the"}
+    )
+
+
+def _shingles(question: str, ngram_size: int) -> set[str]:
+    text = _normalize(question)
+    if len(text) <= ngram_size:
+        return {text}
+    return {text[i : i + ngram_size] for i in range(len(text) - ngram_size + 1)}
+
+
+class MinHashLSH:
+    """MinHash signatures over character n-grams, bucketed with banded LSH.
+
+    Two questions become candidates if any band of their signatures matches; with
+    `num_bands` bands of `num_perm / num_bands` rows, this happens with high
+    probability for pairs whose Jaccard similarity is above
+    (1 / num_bands) ** (num_bands / num_perm).
+    """
+
+    def __init__(
+        self, num_perm: int = 64, num_bands: int = 16, ngram_size: int = 3, seed: int = 0
+    ):
+        assert num_perm % num_bands == 0, "num_perm must be divisible by num_bands"
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.ngram_size = ngram_size
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, _PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, _PRIME, size=num_perm).astype(np.uint64)
+
+    def signature(self, question: str) -> np.ndarray:
+        hashes = np.array(
+            [
+                zlib.crc32(shingle.encode("utf-8")) % _PRIME
+                for shingle in _shingles(question, self.ngram_size)
+            ],
+            dtype=np.uint64,
+        )
+        # (num_perm, num_shingles) permuted hashes, minimum over shingles
+        permuted = (np.outer(self.a, hashes) + self.b[:, None]) % _PRIME
+        return permuted.min(axis=1)
+
+    def candidate_pairs(self, signatures: np.ndarray) -> set[tuple[int, int]]:
+        rows_per_band = self.num_perm // self.num_bands
+        pairs = set()
+        for band in range(self.num_bands):
+            buckets = defaultdict(list)
+            band_slice = signatures[:, band * rows_per_band : (band + 1) * rows_per_band]
+            for idx, row in enumerate(band_slice):
+                buckets[row.tobytes()].append(idx)
+            for bucket in buckets.values():
+                for i in range(len(bucket)):
+                    for j in range(i + 1, len(bucket)):
+                        pairs.add((bucket[i], bucket[j]))
+        return pairs
+
+
+def _jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def cluster_near_duplicates(
+    questions: list[str],
+    answers: list[str],
+    lsh: MinHashLSH,
+    threshold: float = 0.7,
+) -> list[int]:
+    """Returns the cluster (the index of its representative) of every question.
+
+    A question joins the cluster of the earliest representative whose question has a
+    character n-gram Jaccard similarity of at least `threshold` and whose normalized
+    answer is the same. Questions are only compared to representatives, so clusters
+    do not grow by chaining similar questions (e.g. "Who founded X?" / "When was X
+    founded?"), and questions that differ in an entity (e.g. "What is the capital of
+    France?" / "... of Germany?") are kept apart by their answers.
+    """
+    assert len(questions) == len(answers)
+    if len(questions) < 2:
+        return list(range(len(questions)))
+
+    shingles = [_shingles(question, lsh.ngram_size) for question in questions]
+    signatures = np.stack([lsh.signature(question) for question in questions])
+    normalized_answers = [_normalize_answer(answer) for answer in answers]
+
+    # LSH only proposes the candidates, their similarity is computed exactly
+    candidates = defaultdict(set)
+    for i, j in lsh.candidate_pairs(signatures):
+        candidates[max(i, j)].add(min(i, j))
+
+    clusters = list(range(len(questions)))
+    for i in range(len(questions)):
+        for j in sorted(candidates[i]):
+            if (
+                clusters[j] == j
+                and normalized_answers[i] == normalized_answers[j]
+                and _jaccard(shingles[i], shingles[j]) >= threshold
+            ):
+                clusters[i] = j
+                break
+    return clusters
+
+
+def collapse_near_duplicates(
+    corpus_qa_pairs: list[list[tuple[str, str]]],
+    threshold: float = 0.7,
+    num_perm: int = 64,
+    num_bands: int = 16,
+) -> tuple[list[list[tuple[str, str]]], dict]:
+    """Keeps one QA pair per cluster of near-duplicate questions (with the same
+    answer), for each passage.
+
+    Returns the collapsed QA pairs and statistics about how many were removed.
+    """
+    lsh = MinHashLSH(num_perm=num_perm, num_bands=num_bands)
+    collapsed = []
+    for qa_pairs in corpus_qa_pairs:
+        clusters = cluster_near_duplicates(
+            [qa_pair[0] for qa_pair in qa_pairs],
+            [qa_pair[1] for qa_pair in qa_pairs],
+            lsh,
+            threshold=threshold,
+        )
+        collapsed.append(
+            [qa_pair for idx, qa_pair in enumerate(qa_pairs) if clusters[idx] == idx]
+        )
+
+    num_before = sum(len(qa_pairs) for qa_pairs in corpus_qa_pairs)
+    num_after = sum(len(qa_pairs) for qa_pairs in collapsed)
+    stats = {
+        "threshold": threshold,
+        "num_perm": num_perm,
+        "num_bands": num_bands,
+        "num_questions_before": num_before,
+        "num_questions_after": num_after,
+        "collapse_ratio": 1.0 - num_after / num_before if num_before else 0.0,
+    }
+    return collapsed, stats
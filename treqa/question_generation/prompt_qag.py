@@ -22,28 +22,16 @@ class PromptQAG(PromptModel, BaseQAGModel):
         self,
         provider="vllm",
         model_name="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=1024,
-        max_model_len=None,
-        temperature=0.0,
-        top_p=1.0,
         min_p=0.0,
-        tensor_parallel_size=1,
-        base_url="https://cmu.litellm.ai",
-        api_key=None,
         template="eng-cands-0shot",
         answer_overlap_threshold=0.0,
         system_template="standard",
+        **prompt_model_kwargs,
     ):
         super().__init__(
             provider=provider,
             model_name=model_name,
-            max_tokens=max_tokens,
-            max_model_len=max_model_len,
-            temperature=temperature,
-            top_p=top_p,
-            tensor_parallel_size=tensor_parallel_size,
-            base_url=base_url,
-            api_key=api_key,
+            **prompt_model_kwargs,
         )
         self.template = template
         self.answer_overlap_threshold = answer_overlap_threshold
@@ -91,17 +79,16 @@ class PromptQAG(PromptModel, BaseQAGModel):
         ]
         return chat
 
-    def generate_qa_pairs(
+    def prepare_chats(
         self,
         passages: list[str],
         num_questions: int | None = None,
         candidates: list[list[str]] | None = None,
         alt_passages: list[str] | None = None,
-    ) -> list[list[tuple[str, str]]]:
-
+    ) -> list[list[dict[str, str]]]:
         num_questions_def = f" {num_questions}" if num_questions else ""
 
-        chats = [
+        return [
             self.prepare_chat(
                 target,
                 num_questions=num_questions_def,
@@ -111,9 +98,20 @@ class PromptQAG(PromptModel, BaseQAGModel):
             for idx, target in enumerate(passages)
         ]
 
-        outputs = self.generate(chats)
+    def generate_outputs(
+        self,
+        passages: list[str],
+        num_questions: int | None = None,
+        candidates: list[list[str]] | None = None,
+        alt_passages: list[str] | None = None,
+    ) -> list[str]:
+        """Generates the raw model outputs, to be parsed with `parse_outputs`."""
+        chats = self.prepare_chats(passages, num_questions, candidates, alt_passages)
+        return self.generate(chats)
 
-        # Process the generated questions
+    def parse_outputs(
+        self, outputs: list[str], passages: list[str]
+    ) -> list[list[tuple[str, str]]]:
         qa_pairs = []
         for output, target in zip(outputs, passages):
             qas, _ = self.out_parser.parse(
@@ -122,3 +120,20 @@ class PromptQAG(PromptModel, BaseQAGModel):
             qa_pairs.append(qas)
 
         return qa_pairs
+
+    def generate_qa_pairs(
+        self,
+        passages: list[str],
+        num_questions: int | None = None,
+        candidates: list[list[str]] | None = None,
+        alt_passages: list[str] | None = None,
+    ) -> list[list[tuple[str, str]]]:
+        outputs = self.generate_outputs(
+            passages,
+            num_questions=num_questions,
+            candidates=candidates,
+            alt_passages=alt_passages,
+        )
+
+        # Process the generated questions
+        return self.parse_outputs(outputs, passages)
@@ -46,26 +46,16 @@ class PromptQG(PromptModel, BaseQGModel):
         self,
         provider="vllm",
         model_name="Qwen/Qwen2.5-7B-Instruct",
-        max_tokens=1024,
-        max_model_len=None,
-        temperature=0.0,
         top_p=0.9,
-        tensor_parallel_size=1,
-        base_url="https://cmu.litellm.ai",
-        api_key=None,
         template="standard",
         answer_overlap_threshold=60,
+        **prompt_model_kwargs,
     ):
         super().__init__(
             provider=provider,
             model_name=model_name,
-            max_tokens=max_tokens,
-            max_model_len=max_model_len,
-            temperature=temperature,
             top_p=top_p,
-            tensor_parallel_size=tensor_parallel_size,
-            base_url=base_url,
-            api_key=api_key,
+            **prompt_model_kwargs,
         )
         self.template = template_dict[template]
         self.answer_overlap_threshold = answer_overlap_threshold
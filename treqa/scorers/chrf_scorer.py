@@ -1,12 +1,12 @@
-import sacrebleu
-
-from .doc_scorer import DocScorer
+from ..chrf import ChrfEngine
+from .doc_scorer import DocScorer, flatten
 
 
 class ChrfScorer(DocScorer):
-    def __init__(self):
+    def __init__(self, num_workers: int = 1):
         self.maximum_val = 100.0
         self.minimum_val = 0.0
+        self.engine = ChrfEngine(num_workers=num_workers)
 
     def get_scores(
         self,
@@ -15,7 +15,29 @@ class ChrfScorer(DocScorer):
         references: list[str] | None = None,
     ):
         assert references is not None, "References are required for CHRF"
+        return self.engine.score(translations, references)
+
+    def get_scores_multi(
+        self,
+        translations_per_system: list[list[str]],
+        sources: list[str] | None = None,
+        references: list[str] | None = None,
+    ) -> list:
+        # all systems are scored in one call, extracting each reference only once
+        assert references is not None, "References are required for CHRF"
+        scores = self.engine.score(
+            flatten(translations_per_system), references * len(translations_per_system)
+        )
         return [
-            sacrebleu.sentence_chrf(x, [y]).score
-            for x, y in zip(translations, references)
+            scores[sys_idx * len(references) : (sys_idx + 1) * len(references)]
+            for sys_idx in range(len(translations_per_system))
         ]
+
+    def close(self):
+        self.engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,42 +1,41 @@
+import os
+import sys
+
 import torch
 from tqdm import tqdm
 from comet import download_model, load_from_checkpoint
+from comet.models import UnifiedMetric
 
+from ..cache import MemmapEmbeddingCache
 from .doc_scorer import DocScorer
 
+DEFAULT_EMBEDDING_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "treqa", "comet"
+)
 
-def build_embeddings(sources, translations, comet_model, batch_size):
-    src_batches = [
-        sources[i : i + batch_size] for i in range(0, len(sources), batch_size)
-    ]
-    src_inputs = [comet_model.encoder.prepare_sample(batch) for batch in src_batches]
-    mt_batches = [
-        translations[i : i + batch_size]
-        for i in range(0, len(translations), batch_size)
-    ]
-    mt_inputs = [comet_model.encoder.prepare_sample(batch) for batch in mt_batches]
-
-    src_embeddings = []
-    with torch.no_grad():
-        for batch in src_inputs:
-            input_ids = batch["input_ids"].to(comet_model.device)
-            attention_mask = batch["attention_mask"].to(comet_model.device)
-            src_embeddings.append(
-                comet_model.get_sentence_embedding(input_ids, attention_mask)
-            )
-    src_embeddings = torch.vstack(src_embeddings)
 
-    mt_embeddings = []
+def build_embeddings(texts: list[str], comet_model, batch_size: int) -> torch.Tensor:
+    """Encodes texts into COMET sentence embeddings (float32, on CPU)."""
+    if not texts:
+        return torch.empty(0, comet_model.encoder.output_units)
+    # batching texts of similar length keeps padding low
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    embeddings = [None] * len(texts)
     with torch.no_grad():
-        for batch in tqdm(mt_inputs, desc="Encoding sentences...", dynamic_ncols=True):
-            input_ids = batch["input_ids"].to(comet_model.device)
-            attention_mask = batch["attention_mask"].to(comet_model.device)
-            mt_embeddings.append(
-                comet_model.get_sentence_embedding(input_ids, attention_mask)
+        for start in tqdm(
+            range(0, len(order), batch_size),
+            desc="Encoding sentences...",
+            dynamic_ncols=True,
+        ):
+            batch_ids = order[start : start + batch_size]
+            batch = comet_model.encoder.prepare_sample([texts[i] for i in batch_ids])
+            batch_embeddings = comet_model.get_sentence_embedding(
+                batch["input_ids"].to(comet_model.device),
+                batch["attention_mask"].to(comet_model.device),
             )
-    mt_embeddings = torch.vstack(mt_embeddings)
-
-    return src_embeddings, mt_embeddings
+            for i, embedding in zip(batch_ids, batch_embeddings.float().cpu()):
+                embeddings[i] = embedding
+    return torch.stack(embeddings)
 
 
 class CometScorer(DocScorer):
@@ -45,29 +44,133 @@ class CometScorer(DocScorer):
         model_name="Unbabel/wmt22-comet-da",
         batch_size=8,
         device_id=0,
+        embedding_cache_dir: str | None = DEFAULT_EMBEDDING_CACHE_DIR,
     ):
         checkpoint_path = download_model(model_name)
         self.model = load_from_checkpoint(checkpoint_path)
         self.batch_size = batch_size
         self.device_id = device_id
 
-    def get_scores(
+        # unified models (e.g. CometKiwi, XCOMET) encode all the inputs jointly, so
+        # there are no sentence embeddings to reuse and they go through `predict`
+        self.use_embeddings = not isinstance(self.model, UnifiedMetric)
+        if not self.use_embeddings:
+            print(
+                f"{model_name} is a unified model: scoring every system with "
+                "`predict`, without reusing source/reference embeddings",
+                file=sys.stderr,
+            )
+        # source/reference embeddings are cached by (model, text) across systems and runs
+        self.embedding_cache = None
+        if self.use_embeddings and embedding_cache_dir is not None:
+            self.embedding_cache = MemmapEmbeddingCache(
+                os.path.join(embedding_cache_dir, model_name.replace("/", "--"))
+            )
+        if self.use_embeddings:
+            device = (
+                torch.device(f"cuda:{device_id}")
+                if torch.cuda.is_available()
+                else torch.device("cpu")
+            )
+            self.model.to(device)
+            self.model.eval()
+
+    def build_samples(
         self,
         translations: list[str],
-        sources: list[str] | None = None,
-        references: list[str] | None = None,
-    ):
+        sources: list[str] | None,
+        references: list[str] | None,
+    ) -> list[dict]:
+        assert sources is not None, "Must provide sources"
+        assert references is not None, "Must provide references"
+        return [
+            {"mt": y, "ref": z, "src": x}
+            for x, y, z in zip(sources, translations, references)
+        ]
+
+    def get_context_texts(
+        self, sources: list[str] | None, references: list[str] | None
+    ) -> list[list[str]]:
+        """Returns the texts encoded alongside the translations, in `estimate` order."""
         assert sources is not None, "Must provide sources"
         assert references is not None, "Must provide references"
+        return [sources, references]
 
-        seg_scores = self.model.predict(
-            [
-                {"mt": y, "ref": z, "src": x}
-                for x, y, z in zip(sources, translations, references)
-            ],
+    def _predict(self, translations, sources, references) -> list[float]:
+        return self.model.predict(
+            self.build_samples(translations, sources, references),
             batch_size=self.batch_size,
             gpus=1,
             progress_bar=True,
             devices=[self.device_id],
         )["scores"]
-        return seg_scores
+
+    def _cached_embeddings(self, texts: list[str]) -> torch.Tensor:
+        if self.embedding_cache is None or not texts:
+            return build_embeddings(texts, self.model, self.batch_size)
+        missing = self.embedding_cache.missing(texts)
+        if missing:
+            self.embedding_cache.add(
+                [texts[i] for i in missing],
+                build_embeddings(
+                    [texts[i] for i in missing], self.model, self.batch_size
+                ).numpy(),
+            )
+        return torch.from_numpy(self.embedding_cache.get(texts))
+
+    def _estimate(
+        self, mt_embeddings: torch.Tensor, context_embeddings: list[torch.Tensor]
+    ) -> list[float]:
+        dtype = next(self.model.parameters()).dtype
+        scores = []
+        with torch.no_grad():
+            for start in range(0, len(mt_embeddings), self.batch_size):
+                src, *others = [
+                    embeddings[start : start + self.batch_size].to(
+                        self.model.device, dtype=dtype
+                    )
+                    for embeddings in context_embeddings
+                ]
+                mt = mt_embeddings[start : start + self.batch_size].to(
+                    self.model.device, dtype=dtype
+                )
+                prediction = self.model.estimate(src, mt, *others)
+                scores.extend(prediction.score.view(-1).float().cpu().tolist())
+        return scores
+
+    def get_scores(
+        self,
+        translations: list[str],
+        sources: list[str] | None = None,
+        references: list[str] | None = None,
+    ):
+        if not self.use_embeddings:
+            return self._predict(translations, sources, references)
+        return self.get_scores_multi([translations], sources, references)[0]
+
+    def get_scores_multi(
+        self,
+        translations_per_system: list[list[str]],
+        sources: list[str] | None = None,
+        references: list[str] | None = None,
+    ) -> list:
+        if not self.use_embeddings:
+            return [
+                self._predict(translations, sources, references)
+                for translations in translations_per_system
+            ]
+
+        # sources/references are encoded once, only translations are encoded per system
+        context_embeddings = [
+            self._cached_embeddings(texts)
+            for texts in self.get_context_texts(sources, references)
+        ]
+        if self.embedding_cache is not None:
+            self.embedding_cache.report("comet embeddings")
+        return [
+            self._estimate(
+                build_embeddings(translations, self.model, self.batch_size),
+                context_embeddings,
+            )
+            for translations in translations_per_system
+        ]
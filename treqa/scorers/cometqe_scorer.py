@@ -1,32 +1,41 @@
-from comet import download_model, load_from_checkpoint
+from .comet_scorer import DEFAULT_EMBEDDING_CACHE_DIR, CometScorer
 
-from .doc_scorer import DocScorer
 
+class CometQEScorer(CometScorer):
+    """Referenceless COMET scorer.
+
+    The default CometKiwi checkpoints are unified models, which encode the source
+    and translation jointly: they always score through `predict`, and the embedding
+    cache and estimator head of `CometScorer` only apply to regression QE models
+    (e.g. "Unbabel/wmt20-comet-qe-da").
+    """
 
-class CometQEScorer(DocScorer):
     def __init__(
         self,
         model_name="Unbabel/wmt23-cometkiwi-da-xl",
         batch_size=8,
         device_id=0,
+        embedding_cache_dir: str | None = DEFAULT_EMBEDDING_CACHE_DIR,
     ):
-        checkpoint_path = download_model(model_name)
-        self.model = load_from_checkpoint(checkpoint_path)
-        self.batch_size = batch_size
-        self.device_id = device_id
+        super().__init__(
+            model_name=model_name,
+            batch_size=batch_size,
+            device_id=device_id,
+            embedding_cache_dir=embedding_cache_dir,
+        )
 
-    def get_scores(
+    def build_samples(
         self,
         translations: list[str],
-        sources: list[str] | None = None,
-        references: list[str] | None = None,
-    ):
+        sources: list[str] | None,
+        references: list[str] | None,
+    ) -> list[dict]:
+        assert sources is not None, "Must provide sources"
+        return [{"mt": y, "src": x} for x, y in zip(sources, translations)]
+
+    def get_context_texts(
+        self, sources: list[str] | None, references: list[str] | None
+    ) -> list[list[str]]:
+        # referenceless models only look at the source
         assert sources is not None, "Must provide sources"
-        seg_scores = self.model.predict(
-            [{"mt": y, "src": x} for x, y in zip(sources, translations)],
-            batch_size=self.batch_size,
-            gpus=1,
-            progress_bar=True,
-            devices=[self.device_id],
-        )["scores"]
-        return seg_scores
+        return [sources]
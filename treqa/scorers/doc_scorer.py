@@ -21,3 +21,20 @@ class DocScorer(ABC):
         Returns: score
         """
         raise NotImplementedError
+
+    def get_scores_multi(
+        self,
+        translations_per_system: list[list[str]],
+        sources: list[str] | None = None,
+        references: list[str] | None = None,
+        **kwargs,
+    ) -> list:
+        """
+        Scores several systems' translations of the same sources/references.
+        Scorers can override this to share work across systems.
+        Returns: a list with the output of `get_scores` for each system
+        """
+        return [
+            self.get_scores(translations, sources, references, **kwargs)
+            for translations in translations_per_system
+        ]
@@ -1,5 +1,7 @@
-from collections import defaultdict
+import json
+import sys
 
+from treqa.cache import make_cache_key
 from treqa.prompt_model import PromptModel
 
 from .doc_scorer import DocScorer
@@ -82,45 +84,118 @@ TEMPLATE_GEMBA_MQM = mqm_fewshot(
 )
 
 
-def parse_error_class(error):
-    # parse error from error description, errors are ['accuracy', 'fluency', 'locale convention', 'style', 'terminology', 'non-translation', 'other']
-    #  locale convention (currency, date, name, telephone, or time format), style (awkward), terminology (inappropriate for context, inconsistent use),
-    class_name = "unknown"
-    if "accuracy" in error:
-        class_name = "accuracy"
-        for subclass in ["addition", "mistranslation", "omission", "untranslated text"]:
-            if subclass in error:
-                class_name = f"accuracy-{subclass}"
-    elif "fluency" in error:
-        class_name = "fluency"
-        for subclass in [
-            "character encoding",
-            "grammar",
-            "inconsistency",
-            "punctuation",
-            "register",
-            "spelling",
-        ]:
-            if subclass in error:
-                class_name = f"fluency-{subclass}"
-    elif "locale convention" in error:
-        class_name = "locale convention"
-        for subclass in ["currency", "date", "name", "telephone", "time"]:
-            if subclass in error:
-                class_name = f"locale convention-{subclass}"
-    elif "style" in error:
-        class_name = "style"
-    elif "terminology" in error:
-        class_name = "terminology"
-        for subclass in ["inappropriate", "inconsistent"]:
-            if subclass in error:
-                class_name = f"terminology-{subclass}"
-    elif "non-translation" in error:
-        class_name = "non-translation"
-    elif "other" in error:
-        class_name = "other"
-
-    return class_name
+ERROR_LEVELS = ["critical", "major", "minor"]
+ERROR_WEIGHTS = {"critical": 10, "major": 5, "minor": 1}
+
+MQM_JSON_SCHEMA = {
+    "title": "mqm_errors",
+    "type": "object",
+    "properties": {
+        level: {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "category": {"type": "string"},
+                    "span": {"type": "string"},
+                },
+                "required": ["category", "span"],
+                "additionalProperties": False,
+            },
+        }
+        for level in ERROR_LEVELS
+    },
+    "required": ERROR_LEVELS,
+    "additionalProperties": False,
+}
+
+
+def _add_error(errors, level, category, span):
+    category = category.strip().lower()
+    # non-translations are always critical
+    if "non-translation" in category:
+        level = "critical"
+    errors[level].append({"category": category, "span": span.strip().strip('"')})
+
+
+def parse_structured_answer(x: str) -> dict | None:
+    """Reads an answer following `MQM_JSON_SCHEMA`, or returns None if it does not."""
+    x = x.strip()
+    try:
+        answer = json.loads(x[x.index("{") : x.rindex("}") + 1])
+        errors = {level: [] for level in ERROR_LEVELS}
+        for level in ERROR_LEVELS:
+            for error in answer.get(level, []):
+                if "no-error" in error["category"].lower():
+                    continue
+                _add_error(errors, level, error["category"], error["span"])
+        return errors
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+def parse_mqm_errors(x: str | None, structured: bool = False) -> dict | None:
+    """Parses a GEMBA-MQM answer into its errors per level.
+
+    With `structured`, the answer is read as JSON (following `MQM_JSON_SCHEMA`),
+    falling back to the free-text format if it is not valid. Free-text answers are
+    never read as JSON, since their error spans may themselves look like JSON.
+    """
+    if x is None:
+        return None
+    x = str(x)
+    if structured:
+        errors = parse_structured_answer(x)
+        if errors is not None:
+            return errors
+
+    errors = {level: [] for level in ERROR_LEVELS}
+    error_level = None
+    for line in x.split("\n"):
+        line = line.strip()
+        lowered = line.lower()
+        if "no-error" in lowered or "no error" in lowered or "" == lowered:
+            continue
+        if lowered.rstrip(":") in ERROR_LEVELS and lowered.endswith(":"):
+            error_level = lowered.rstrip(":")
+            continue
+        if error_level is None:
+            print(f"No error level for {line}", file=sys.stderr)
+            continue
+
+        category, _, span = line.partition(" - ")
+        _add_error(errors, error_level, category, span)
+    return errors
+
+
+def mqm_score(errors: dict | None) -> float | None:
+    if errors is None:
+        return None
+    return -sum(ERROR_WEIGHTS[level] * len(errors[level]) for level in ERROR_LEVELS)
+
+
+# appended to the last turn, since not every provider enforces `MQM_JSON_SCHEMA`
+# (braces are doubled, as the turn is filled in with `str.format`)
+JSON_FORMAT_INSTRUCTION = """
+
+Answer only with a JSON object with the keys "critical", "major" and "minor", each a list of {{"category": ..., "span": ...}} objects with the category of an error and the erroneous span of the translation. Use empty lists for levels without errors."""
+
+# same few-shot examples, with the answers in the structured format
+TEMPLATE_GEMBA_MQM_JSON = mqm_fewshot(
+    [
+        {
+            **shot,
+            "answer": json.dumps(
+                parse_mqm_errors(shot["answer"]), ensure_ascii=False
+            ),
+        }
+        for shot in [few_shots["ende"], few_shots["encs"], few_shots["zhen"]]
+    ]
+)
+TEMPLATE_GEMBA_MQM_JSON[-1] = {
+    "role": "user",
+    "content": TEMPLATE_GEMBA_MQM_JSON[-1]["content"] + JSON_FORMAT_INSTRUCTION,
+}
 
 
 class GembaScorer(PromptModel, DocScorer):
@@ -130,124 +205,47 @@ class GembaScorer(PromptModel, DocScorer):
         tgt_lang=None,
         provider="litellm",
         model_name="openai/neulab/gpt-4o-mini-2024-07-18",
-        max_tokens=1024,
-        max_model_len=None,
-        temperature=0.0,
-        top_p=1.0,
-        tensor_parallel_size=1,
-        base_url="https://cmu.litellm.ai",
-        api_key=None,
         fallback="no_error",
+        structured_output=False,
+        **prompt_model_kwargs,
     ):
         super().__init__(
             provider=provider,
             model_name=model_name,
-            max_tokens=max_tokens,
-            max_model_len=max_model_len,
-            temperature=temperature,
-            top_p=top_p,
-            tensor_parallel_size=tensor_parallel_size,
-            base_url=base_url,
-            api_key=api_key,
+            **prompt_model_kwargs,
         )
         self.maximum_val = 100.0
         self.minimum_val = 0.0
         self.src_lang = src_lang
         self.tgt_lang = tgt_lang
         self.fallback = fallback
+        # ask for JSON answers (constrained to MQM_JSON_SCHEMA where the provider
+        # supports it) instead of the original free-text format
+        self.structured_output = structured_output
+        self.template = (
+            TEMPLATE_GEMBA_MQM_JSON if structured_output else TEMPLATE_GEMBA_MQM
+        )
 
     def prepare_chat(
         self, source_seg: str, target_seg: str, src_lang: str, tgt_lang: str
     ) -> list[dict[str, str]]:
-        prompt = []
-        for conversation_turn in TEMPLATE_GEMBA_MQM:
-            p = conversation_turn.copy()
-            p["content"] = p["content"].format(
-                source_lang=src_lang,
-                source_seg=source_seg,
-                target_lang=tgt_lang,
-                target_seg=target_seg,
-            )
-            prompt.append(p)
-        return prompt
-
-    def parse_mqm_answer(self, x, full_desc=True):
-        if x is None:
-            return None
-
-        x = str(x)
-        if x.startswith('{"improved translation"'):
-            print("here")
-        else:
-            x = x.lower()
-            errors = {"critical": [], "major": [], "minor": []}
-            error_level = None
-            for line in x.split("\n"):
-                line = line.strip()
-                if (
-                    "no-error" in line
-                    or "no error" in line
-                    or "no errors" in line
-                    or "" == line
-                ):
-                    continue
-                if "critical:" == line:
-                    error_level = "critical"
-                    continue
-                elif "major:" == line:
-                    error_level = "major"
-                    continue
-                elif "minor:" == line:
-                    error_level = "minor"
-                    continue
-
-                if "critical" in line or "major" in line or "minor" in line:
-                    if not any(
-                        [
-                            line.startswith(x)
-                            for x in [
-                                "accuracy",
-                                "fluency",
-                                "locale convention",
-                                "style",
-                                "terminology",
-                                "non-translation",
-                                "other",
-                            ]
-                        ]
-                    ):
-                        print(line)
-
-                if error_level is None:
-                    print(f"No error level for {line}")
-                    continue
-
-                if "non-translation" in line:
-                    errors["critical"].append(line)
-                else:
-                    errors[error_level].append(line)
-
-        error_classes = defaultdict(list)
-        final_score = 0
-        error_counter = {"critical": 0, "major": 0, "minor": 0}
-        for error_level in ["critical", "major", "minor"]:
-            if error_level not in errors:
-                continue
-            for error in errors[error_level]:
-                final_score += (
-                    10
-                    if error_level == "critical"
-                    else 5 if error_level == "major" else 1
-                )
-                error_counter[error_level] += 1
+        # only the last turn depends on the segment, the few-shot prefix is shared
+        last_turn = self.template[-1].copy()
+        last_turn["content"] = last_turn["content"].format(
+            source_lang=src_lang,
+            source_seg=source_seg,
+            target_lang=tgt_lang,
+            target_seg=target_seg,
+        )
+        return self.template[:-1] + [last_turn]
 
-                if full_desc:
-                    error_classes[error_level].append(error)
-                else:
-                    class_name = parse_error_class(error)
-                    error_classes[error_level].append(class_name)
+    def parse_mqm_answer(self, x):
+        return mqm_score(parse_mqm_errors(x, structured=self.structured_output))
 
-        return -final_score
+    def _error_cache_key(self, source_seg: str, target_seg: str, lp: str) -> str:
+        return make_cache_key(
+            "gemba_mqm", self.model_name, self.structured_output, source_seg, target_seg, lp
+        )
 
     def get_scores(
         self,
@@ -263,29 +261,58 @@ class GembaScorer(PromptModel, DocScorer):
             # then we use the lps passed (specific configuration for LitTranslation)
             src_langs = [lp.split("-")[0] for lp in lps]
             tgt_langs = [lp.split("-")[1] for lp in lps]
-            assert len(sources) == len(src_langs) == len(tgt_langs)
-        elif lps is None and self.src_lang is not None and self.tgt_lang is not None:
+        elif self.src_lang is not None and self.tgt_lang is not None:
             # use specified src and tgt languages:
             src_langs = [self.src_lang] * len(sources)
             tgt_langs = [self.tgt_lang] * len(sources)
         else:
-            assert "Please provide (1) src_lang and tgt_lang or (2) lps."
+            raise ValueError("Please provide (1) src_lang and tgt_lang or (2) lps.")
         assert len(sources) == len(src_langs) == len(tgt_langs)
-
-        chats = [
-            self.prepare_chat(source_seg, target_seg, src_lang, tgt_lang)
-            for (source_seg, target_seg, src_lang, tgt_lang) in zip(
-                sources, translations, src_langs, tgt_langs
+        segment_lps = [f"{s}-{t}" for s, t in zip(src_langs, tgt_langs)]
+
+        # error spans are cached by (source, translation, lp, model), so segments
+        # already annotated (e.g. shared by several systems) are not prompted again;
+        # the raw responses are not cached as well
+        errors = [None] * len(sources)
+        keys = None
+        if self.cache is not None:
+            keys = [
+                self._error_cache_key(x, y, lp)
+                for x, y, lp in zip(sources, translations, segment_lps)
+            ]
+            for i, value in enumerate(self.cache.get_many(keys)):
+                if value is not None:
+                    errors[i] = json.loads(value)
+
+        # segments of the same language pair are prompted together
+        missing = sorted(
+            (i for i, error in enumerate(errors) if error is None),
+            key=lambda i: segment_lps[i],
+        )
+        if missing:
+            chats = [
+                self.prepare_chat(sources[i], translations[i], src_langs[i], tgt_langs[i])
+                for i in missing
+            ]
+            outputs = (
+                self.generate_structured(chats, MQM_JSON_SCHEMA, use_cache=False)
+                if self.structured_output
+                else self.generate(chats, use_cache=False)
             )
-        ]
-        outputs = self.generate(chats)
+            for i, output in zip(missing, outputs):
+                errors[i] = parse_mqm_errors(output, structured=self.structured_output)
+            if self.cache is not None:
+                self.cache.put_many(
+                    [
+                        (keys[i], json.dumps(errors[i]))
+                        for i in missing
+                        if errors[i] is not None
+                    ]
+                )
+                self.cache.report("gemba error spans")
 
         # this is for debugging
         with open(output_file, "w") as f:
-            import json
-
-            json.dump(outputs, f)
-
-        scores = [self.parse_mqm_answer(x) for x in outputs]
+            json.dump(errors, f)
 
-        return scores
+        return [mqm_score(error) for error in errors]
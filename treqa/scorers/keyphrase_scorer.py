@@ -1,53 +1,195 @@
-from tqdm import tqdm
+import json
+
+import numpy as np
 from treqa.answer_extraction.ae_model import BaseAEModel
+from treqa.cache import ResponseCache, make_cache_key
+
+from .doc_scorer import DocScorer, flatten
+
+
+def corpus_jaccard_similarity(
+    hyp_lists: list[list[str]], ref_lists: list[list[str]]
+) -> np.ndarray:
+    """Computes the Jaccard similarity of the keyphrase sets of every (hypothesis,
+    reference) pair at once; pairs with an empty side score 0."""
+    codes = {}
+
+    def _keys(lists):
+        # encode every (document, keyphrase) as a single integer
+        doc_ids = np.array(
+            [i for i, kps in enumerate(lists) for _ in kps], dtype=np.int64
+        )
+        kp_ids = np.array(
+            [codes.setdefault(kp, len(codes)) for kps in lists for kp in kps],
+            dtype=np.int64,
+        )
+        return doc_ids, kp_ids
 
-from .doc_scorer import DocScorer
+    hyp_docs, hyp_kps = _keys(hyp_lists)
+    ref_docs, ref_kps = _keys(ref_lists)
+    vocab_size = max(len(codes), 1)
+    hyp_keys = np.unique(hyp_docs * vocab_size + hyp_kps)
+    ref_keys = np.unique(ref_docs * vocab_size + ref_kps)
 
+    num_docs = len(hyp_lists)
+    hyp_sizes = np.bincount(hyp_keys // vocab_size, minlength=num_docs)
+    ref_sizes = np.bincount(ref_keys // vocab_size, minlength=num_docs)
+    intersections = np.bincount(
+        np.intersect1d(hyp_keys, ref_keys, assume_unique=True) // vocab_size,
+        minlength=num_docs,
+    )
+    unions = hyp_sizes + ref_sizes - intersections
 
-def jaccard_similarity(hyp_list, ref_list):
-    if len(hyp_list) == 0 or len(ref_list) == 0:
-        return 0
-    set1, set2 = set(hyp_list), set(ref_list)
-    intersection = set1.intersection(set2)
-    union = set1.union(set2)
-    return len(intersection) / len(union) if len(union) > 0 else 0
+    scores = np.zeros(num_docs)
+    valid = (hyp_sizes > 0) & (ref_sizes > 0)
+    scores[valid] = intersections[valid] / unions[valid]
+    return scores
 
 
 def compare_keyphrases(
-    predicted_keyphrases: str, reference_keyphrases: str, comparator: str = "jaccard"
-) -> float:
-    """Evaluates a list of keyphrases extracted from hypothesis and reference using a specified comparator."""
+    predicted_keyphrases: list[list[str]],
+    reference_keyphrases: list[list[str]],
+    comparator: str = "jaccard",
+) -> list[float]:
+    """Evaluates the lists of keyphrases extracted from each hypothesis and reference using a specified comparator."""
     if comparator == "jaccard":
-        return jaccard_similarity(predicted_keyphrases, reference_keyphrases)
+        return corpus_jaccard_similarity(
+            predicted_keyphrases, reference_keyphrases
+        ).tolist()
     else:
         raise ValueError(f"Unknown comparator: {comparator}")
 
 
+# AE model attributes that only affect speed, resources or connection details, not the
+# extracted keyphrases, so changing them keeps the cache
+RUNTIME_SETTINGS = {"batch_size", "n_process", "sort_prompts", "base_url", "api_key"}
+
+
+# settings of the prompt model that generates the output
+GENERATION_SETTINGS = ("provider", "model_name", "temperature", "top_p", "max_tokens")
+
+
+def ae_config_id(ae_model: BaseAEModel) -> str:
+    """Identifies an AE model by its class and the (simple) configuration attributes
+    that affect its output.
+
+    Prompt models with `provider="parent_prompt_model"` generate with their parent's
+    model, so the parent's model name and sampling settings are part of the id.
+    """
+    config = {
+        name: value
+        for name, value in vars(ae_model).items()
+        if name not in RUNTIME_SETTINGS
+        and isinstance(value, (str, int, float, bool, tuple, list, type(None)))
+    }
+    generator = ae_model
+    while getattr(generator, "provider", None) == "parent_prompt_model":
+        generator = generator.parent_prompt_model
+    if generator is not ae_model:
+        config["generator"] = {
+            name: getattr(generator, name, None) for name in GENERATION_SETTINGS
+        }
+    return make_cache_key(type(ae_model).__name__, config)
+
+
 class KeyPhraseScorer(DocScorer):
     def __init__(
         self,
         ae_model: BaseAEModel,
         comparator: str = "jaccard",
         num_answers: int | None = None,
+        cache_path: str | None = None,
+        cache_max_size_mb: float = 1024,
     ):
         self.ae_model = ae_model
         self.comparator = comparator
         self.num_answers = num_answers
+        # keyphrases are cached by (AE model configuration, text), so they are
+        # shared between references and hypotheses, systems and runs
+        self.ae_config_id = ae_config_id(ae_model)
+        self.cache = (
+            ResponseCache(cache_path, max_size_mb=cache_max_size_mb)
+            if cache_path is not None
+            else None
+        )
+
+    def extract_keyphrases(
+        self, texts: list[str], langs: list[str] | None = None
+    ) -> list[list[str]]:
+        """Extracts the keyphrases of every text, running the AE model only once per
+        unique (text, language) that is not cached."""
+        if langs is None:
+            langs = [None] * len(texts)
+        keys = [
+            make_cache_key(self.ae_config_id, self.num_answers, lang, text)
+            for text, lang in zip(texts, langs)
+        ]
+
+        keyphrases = {}
+        if self.cache is not None:
+            unique_keys = list(dict.fromkeys(keys))
+            for key, value in zip(unique_keys, self.cache.get_many(unique_keys)):
+                if value is not None:
+                    keyphrases[key] = json.loads(value)
+
+        missing = {}
+        for idx, key in enumerate(keys):
+            if key not in keyphrases and key not in missing:
+                missing[key] = idx
+        if missing:
+            missing_indices = list(missing.values())
+            extracted = self.ae_model.extract_answers(
+                [texts[i] for i in missing_indices],
+                self.num_answers,
+                langs=(
+                    [langs[i] for i in missing_indices]
+                    if any(lang is not None for lang in langs)
+                    else None
+                ),
+            )
+            for key, kps in zip(missing, extracted):
+                keyphrases[key] = list(kps)
+            if self.cache is not None:
+                self.cache.put_many(
+                    [(key, json.dumps(keyphrases[key])) for key in missing]
+                )
+                self.cache.report("keyphrase cache")
+
+        return [keyphrases[key] for key in keys]
 
     def get_scores(
         self,
         translations: list[str],
         sources: list[str] | None = None,
         references: list[str] | None = None,
+        langs: list[str] | None = None,
     ):
-        reference_keyphases = self.ae_model.extract_answers(
-            references, self.num_answers
-        )
-        translation_keyphases = self.ae_model.extract_answers(
-            translations, self.num_answers
+        return self.get_scores_multi(
+            [translations], sources=sources, references=references, langs=langs
+        )[0]
+
+    def get_scores_multi(
+        self,
+        translations_per_system: list[list[str]],
+        sources: list[str] | None = None,
+        references: list[str] | None = None,
+        langs: list[str] | None = None,
+    ):
+        # langs is the language (pair) of each line, for language-specific AE models
+        num_systems = len(translations_per_system)
+        all_keyphrases = self.extract_keyphrases(
+            references + flatten(translations_per_system),
+            langs=langs * (num_systems + 1) if langs is not None else None,
         )
+        reference_keyphrases = all_keyphrases[: len(references)]
 
-        scores = []
-        for ref_kps, hyp_kps in tqdm(zip(reference_keyphases, translation_keyphases)):
-            scores.append(compare_keyphrases(hyp_kps, ref_kps, self.comparator))
-        return scores
+        scores_per_system = []
+        for sys_idx in range(num_systems):
+            start = len(references) * (sys_idx + 1)
+            translation_keyphrases = all_keyphrases[start : start + len(references)]
+            scores_per_system.append(
+                compare_keyphrases(
+                    translation_keyphrases, reference_keyphrases, self.comparator
+                )
+            )
+        return scores_per_system
@@ -1,59 +1,67 @@
+import numpy as np
+import torch
 from metricx23 import models
 import transformers
-import datasets
-import pandas as pd
+from tqdm import tqdm
 
 from .doc_scorer import DocScorer
 
 
 class MetricXScorer(DocScorer):
-    def __init__(self, model_name="google/metricx-23-xl-v2p0", batch_size=1):
+    def __init__(
+        self,
+        model_name="google/metricx-23-xl-v2p0",
+        batch_size=8,
+        device: str | None = None,
+        dtype: str = "float32",
+        max_length: int = 1024,
+    ):
         self.maximum_val = 0.0
         self.minimum_val = -25.0
         self.batch_size = batch_size
+        self.max_length = max_length
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
+
         self.tokenizer = transformers.AutoTokenizer.from_pretrained("google/mt5-xl")
-        self.model = models.MT5ForRegression.from_pretrained(model_name)
-        self.model.cuda()
+        # e.g. dtype="bfloat16" halves the memory of the XL/XXL models
+        self.model = models.MT5ForRegression.from_pretrained(
+            model_name, torch_dtype=getattr(torch, dtype)
+        )
+        self.model.to(self.device)
         self.model.eval()
 
-    def _make_input(self, example):
-        example["input"] = (
-            "candidate: "
-            + example["hypothesis"]
-            + " reference: "
-            + example["reference"]
-        )
-        return example
+    def _make_inputs(self, sources, translations, references) -> list[str]:
+        assert references is not None, "References are required for MetricX"
+        return [
+            "candidate: " + y + " reference: " + z
+            for y, z in zip(translations, references)
+        ]
 
-    def _tokenize(self, example):
-        return self.tokenizer(
-            example["input"], max_length=1024, truncation=True, padding=False
-        )
+    def _tokenize(self, inputs: list[str]) -> list[list[int]]:
+        input_ids = self.tokenizer(
+            inputs, max_length=self.max_length, truncation=True, padding=False
+        )["input_ids"]
+        # MetricX is trained without the EOS token
+        return [ids[:-1] for ids in input_ids]
 
-    def _remove_eos(self, example):
-        example["input_ids"] = example["input_ids"][:-1]
-        example["attention_mask"] = example["attention_mask"][:-1]
-        return example
+    def _predict_batch(self, input_ids: list[list[int]]) -> np.ndarray:
+        max_len = max(len(ids) for ids in input_ids)
+        batch_ids = torch.full(
+            (len(input_ids), max_len), self.tokenizer.pad_token_id, dtype=torch.long
+        )
+        attention_mask = torch.zeros((len(input_ids), max_len), dtype=torch.long)
+        for i, ids in enumerate(input_ids):
+            batch_ids[i, : len(ids)] = torch.tensor(ids, dtype=torch.long)
+            attention_mask[i, : len(ids)] = 1
 
-    def _process_dataset(self, sources, translations, references):
-        ds = datasets.Dataset.from_pandas(
-            pd.DataFrame(
-                data=[
-                    {"hypothesis": y, "reference": x}
-                    for x, y in zip(references, translations)
-                ]
+        with torch.inference_mode():
+            outputs = self.model(
+                input_ids=batch_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
             )
-        )
-        ds = ds.map(self._make_input)
-        ds = ds.map(self._tokenize)
-        ds = ds.map(self._remove_eos)
-        ds.set_format(
-            type="torch",
-            columns=["input_ids", "attention_mask"],
-            device=0,
-            output_all_columns=True,
-        )
-        return ds
+        return outputs.predictions.float().cpu().numpy()
 
     def get_scores(
         self,
@@ -61,59 +69,39 @@ class MetricXScorer(DocScorer):
         sources: list[str] | None = None,
         references: list[str] | None = None,
     ):
-        assert references is not None, "References are required for CHRF"
-        ds = self._process_dataset(sources, translations, references)
-
-        training_args = transformers.TrainingArguments(
-            per_device_eval_batch_size=self.batch_size,
-            output_dir="./",
-            dataloader_pin_memory=False,
-        )
-        trainer = transformers.Trainer(
-            model=self.model,
-            args=training_args,
-        )
+        input_ids = self._tokenize(self._make_inputs(sources, translations, references))
 
-        predictions, _, _ = trainer.predict(test_dataset=ds)  # type: ignore
+        # batches of similar lengths need little padding; scores are written back in
+        # the original order as each batch finishes
+        order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]), reverse=True)
+        predictions = np.zeros(len(input_ids), dtype=np.float32)
+        for start in tqdm(range(0, len(order), self.batch_size)):
+            batch_indices = order[start : start + self.batch_size]
+            predictions[batch_indices] = self._predict_batch(
+                [input_ids[i] for i in batch_indices]
+            )
         return predictions
 
 
 class MetricXQEScorer(MetricXScorer):
-
-    def __init__(self, model_name="google/metricx-23-qe-xl-v2p0", batch_size=1):
-        self.maximum_val = 0.0
-        self.minimum_val = -25.0
-        self.batch_size = batch_size
-        self.tokenizer = transformers.AutoTokenizer.from_pretrained("google/mt5-xl")
-        self.model = models.MT5ForRegression.from_pretrained(model_name)
-        self.model.cuda()
-        self.model.eval()
-
-    def _make_input(self, example):
-        example["input"] = (
-            "candidate: "
-            + example["hypothesis"]
-            + " reference: "
-            + example["reference"]
+    def __init__(
+        self,
+        model_name="google/metricx-23-qe-xl-v2p0",
+        batch_size=8,
+        device: str | None = None,
+        dtype: str = "float32",
+        max_length: int = 1024,
+    ):
+        super().__init__(
+            model_name=model_name,
+            batch_size=batch_size,
+            device=device,
+            dtype=dtype,
+            max_length=max_length,
         )
-        return example
 
-    def _process_dataset(self, sources, translations, references):
-        ds = datasets.Dataset.from_pandas(
-            pd.DataFrame(
-                data=[
-                    {"hypothesis": y, "source": x}
-                    for x, y in zip(sources, translations)
-                ]
-            )
-        )
-        ds = ds.map(self._make_input)
-        ds = ds.map(self._tokenize)
-        ds = ds.map(self._remove_eos)
-        ds.set_format(
-            type="torch",
-            columns=["input_ids", "attention_mask"],
-            device=0,
-            output_all_columns=True,
-        )
-        return ds
+    def _make_inputs(self, sources, translations, references) -> list[str]:
+        assert sources is not None, "Sources are required for MetricX-QE"
+        return [
+            "candidate: " + y + " source: " + x for x, y in zip(sources, translations)
+        ]
@@ -10,9 +10,60 @@ from treqa.question_answering.qa_templates import template_dict
 from .doc_scorer import DocScorer, flatten
 
 
+def question_centrality(questions: list[str], backend: str = "exact") -> np.ndarray:
+    """Sums the similarity of every question to all the other questions.
+
+    "exact" sums pairwise `SequenceMatcher` ratios, which is quadratic in the number of
+    questions; "tfidf" sums the cosine similarities of character n-gram tf-idf vectors
+    in linear time, but is a different similarity and ranks questions differently.
+    """
+    if backend == "exact":
+        similarity_matrix = np.zeros((len(questions), len(questions)))
+        for i, q1 in enumerate(questions):
+            for j, q2 in enumerate(questions):
+                if i != j:
+                    # Return a measure of the sequences’ lexical similarity as a float in the range [0, 1].
+                    similarity_matrix[i, j] = SequenceMatcher(None, q1, q2).ratio()
+        return similarity_matrix.sum(axis=1)
+    elif backend == "tfidf":
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        if len(questions) < 2:
+            return np.zeros(len(questions))
+        # cosine similarity of (l2-normalized) character n-gram tf-idf vectors;
+        # the sum over all other questions is x_i . sum_j(x_j) - x_i . x_i, which
+        # avoids building the n x n similarity matrix
+        try:
+            vectors = TfidfVectorizer(
+                analyzer="char_wb", ngram_range=(2, 4)
+            ).fit_transform(questions)
+        except ValueError:
+            # empty vocabulary, e.g. only empty questions
+            return np.zeros(len(questions))
+        total = np.asarray(vectors.sum(axis=0)).ravel()
+        self_similarity = np.asarray(vectors.multiply(vectors).sum(axis=1)).ravel()
+        return vectors @ total - self_similarity
+    else:
+        raise ValueError(f"Unknown similarity backend: {backend}")
+
+
 def select_questions(
-    questions_list, N, K, num_questions=None, select_strategy="frequent"
+    questions_list,
+    N,
+    K,
+    num_questions=None,
+    select_strategy="frequent",
+    similarity_backend="exact",
 ):
+    """Selects the questions asked for each of the N sources, from the questions
+    generated for its K candidates (`questions_list` holds N * K lists).
+
+    With `select_strategy="similarity"`, the most "central" questions are kept, as
+    scored by `question_centrality` with `similarity_backend`. The default "exact"
+    backend keeps the original ranking; "tfidf" is much faster on large chunks but
+    selects different questions (see `benchmarks/question_centrality.py` for both
+    the speed and the agreement of the backends).
+    """
     if len(questions_list) != N * K:
         raise ValueError("The size of the list must be N x K.")
 
@@ -33,18 +84,8 @@ def select_questions(
                 ]
                 result.extend([most_common_values] * K)
             elif select_strategy == "similarity":
-                # Compute pairwise similarity scores
-                similarity_matrix = np.zeros((len(all_questions), len(all_questions)))
-                for i, q1 in enumerate(all_questions):
-                    for j, q2 in enumerate(all_questions):
-                        if i != j:
-                            # Return a measure of the sequences’ lexical similarity as a float in the range [0, 1].
-                            similarity_matrix[i, j] = SequenceMatcher(
-                                None, q1, q2
-                            ).ratio()
-
                 # Sum similarity scores to find the most "central" questions
-                scores = similarity_matrix.sum(axis=1)
+                scores = question_centrality(all_questions, backend=similarity_backend)
                 most_similar_indices = np.argsort(-scores)[:num_questions]
                 result.extend([[all_questions[i] for i in most_similar_indices]] * K)
             elif select_strategy == "random":
@@ -64,7 +105,44 @@ def select_questions(
     return result
 
 
+def group_scores_by_passage(
+    all_scores, qa_pairs, answer_comparator, fallback="no_error"
+):
+    """Averages the per-question scores of each passage, applying the fallback to passages without questions."""
+    qa_scores = []
+    per_q_scores = []
+    idx = 0
+    for ind, passage_qs in enumerate(qa_pairs):
+        if len(passage_qs) == 0:  # fallback for no questions
+            print(f"Using fallback for index: {ind}")
+            per_q_scores.append([])
+            if fallback == "no_error":
+                qa_scores.append(answer_comparator.maximum_val)
+                continue
+            elif fallback == "error":
+                qa_scores.append(answer_comparator.minimum_val)
+                continue
+            else:
+                raise ValueError(f"Unknown fallback method: {fallback}")
+        qs_scores = all_scores[idx : idx + len(passage_qs)]
+        qa_scores.append(np.mean(qs_scores))
+        per_q_scores.append(qs_scores)
+        idx += len(passage_qs)
+
+    assert idx == len(all_scores)
+    return qa_scores, per_q_scores
+
+
+def split_by_system(items, num_systems):
+    """Splits a list built by concatenating `num_systems` equally-sized lists."""
+    size = len(items) // num_systems
+    return [items[i * size : (i + 1) * size] for i in range(num_systems)]
+
+
 class TREQAScorer(DocScorer):
+    # where the answers recomputed from the original passages are dumped
+    ref_answer_file = "ref_answers.json"
+
     def __init__(
         self,
         qa_model: BaseQAModel,
@@ -89,69 +167,139 @@ class TREQAScorer(DocScorer):
         qa_pairs: list[list[dict]] | None = None,
         return_detailed_evaluation: bool = False,
     ):
-        assert qa_pairs is not None, "Must provide QA pairs"
-        assert references is not None, "References are required for TREQAScorer"
+        return self.get_scores_multi(
+            [translations],
+            sources=sources,
+            references=references,
+            qa_pairs=qa_pairs,
+            return_detailed_evaluation=return_detailed_evaluation,
+        )[0]
 
-        # Compute QA-based scores
+    def get_reference_answers(
+        self,
+        passages: list[str],
+        questions: list[list[str]],
+        qa_pairs: list[list[dict]],
+    ) -> list[list[str]]:
+        if not self.gen_ref_answers:
+            return [
+                [qa_pair["answer"] for qa_pair in doc_qa_pairs]
+                for doc_qa_pairs in qa_pairs
+            ]
+
+        pred_template = getattr(self.qa_model, "template", None)
+        if self.ref_template is not None:
+            self.qa_model.template = template_dict[self.ref_template]
+        reference_answers = self.qa_model.extract_answers(
+            passages, questions, answer_file=self.ref_answer_file
+        )
+        # restore the template so that later calls answer translations as before
+        if pred_template is not None:
+            self.qa_model.template = pred_template
+        return reference_answers
+
+    def answer_questions(
+        self,
+        translations_per_system: list[list[str]],
+        passages: list[str],
+        qa_pairs: list[list[dict]],
+    ):
+        """Answers the questions using each system's translations and the original passages.
+
+        The predicted answers of all systems are computed in a single call, and the
+        reference answers only once.
+        """
         questions = [
             [qa_pair["question"] for qa_pair in doc_qa_pairs]
             for doc_qa_pairs in qa_pairs
         ]
+        num_systems = len(translations_per_system)
 
-        predicted_answers = self.qa_model.extract_answers(
-            translations, questions, answer_file="pred_answers.json"
+        all_predicted_answers = self.qa_model.extract_answers(
+            flatten(translations_per_system),
+            questions * num_systems,
+            answer_file="pred_answers.json",
+        )
+        predicted_answers_per_system = split_by_system(
+            all_predicted_answers, num_systems
         )
+        reference_answers = self.get_reference_answers(passages, questions, qa_pairs)
+        return questions, predicted_answers_per_system, reference_answers
 
-        if self.gen_ref_answers:
-            if self.ref_template is not None:
-                self.qa_model.template = template_dict[self.ref_template]
-            reference_answers = self.qa_model.extract_answers(
-                references, questions, answer_file="ref_answers.json"
-            )
-        else:
-            reference_answers = [
-                [qa_pair["answer"] for qa_pair in doc_qa_pairs]
-                for doc_qa_pairs in qa_pairs
-            ]
+    def match_answers(
+        self,
+        questions: list[list[str]],
+        predicted_answers_per_system: list[list[list[str]]],
+        reference_answers: list[list[str]],
+        passages: list[str],
+        qa_pairs: list[list[dict]],
+        return_detailed_evaluation: bool = False,
+    ):
+        """Compares every system's answers against the reference answers in a single call."""
+        num_systems = len(predicted_answers_per_system)
+        contexts = flatten(
+            [[passages[i]] * len(qa_pairs[i]) for i in range(len(passages))]
+        )
 
         # free qa space  -> should be done for quip only
         # if isinstance(self.answer_comparator, QuipAM):
         #     self.qa_model.cleanup_model()
 
         all_scores = self.answer_comparator.evaluate_answers(
-            flatten(predicted_answers),
-            flatten(questions),
-            flatten(reference_answers),
-            flatten(
-                [[references[i]] * len(qa_pairs[i]) for i in range(len(references))]
-            ),
+            flatten(flatten(predicted_answers_per_system)),
+            flatten(questions) * num_systems,
+            flatten(reference_answers) * num_systems,
+            contexts * num_systems,
         )
 
-        assert len(all_scores) == len(flatten(predicted_answers))
-
-        # group scores by passage
-        qa_scores = []
-        per_q_scores = []
-        idx = 0
-        for ind, passage_qs in enumerate(qa_pairs):
-            if len(passage_qs) == 0:  # fallback for no questions
-                print(f"Using fallback for index: {ind}")
-                if self.fallback == "no_error":
-                    qa_scores.append(self.answer_comparator.maximum_val)
-                    continue
-                elif self.fallback == "error":
-                    qa_scores.append(self.answer_comparator.minimum_val)
-                    continue
-                else:
-                    raise ValueError(f"Unknown fallback method: {self.fallback}")
-            qs_scores = all_scores[idx : idx + len(passage_qs)]
-            qa_scores.append(np.mean(qs_scores))
-            per_q_scores.append(qs_scores)
-            idx += len(passage_qs)
-
-        assert idx == len(all_scores)
-
-        if return_detailed_evaluation:
-            return qa_scores, predicted_answers, reference_answers, per_q_scores
-        else:
-            return qa_scores
+        assert len(all_scores) == len(flatten(flatten(predicted_answers_per_system)))
+
+        outputs = []
+        for predicted_answers, system_scores in zip(
+            predicted_answers_per_system, split_by_system(all_scores, num_systems)
+        ):
+            qa_scores, per_q_scores = group_scores_by_passage(
+                system_scores, qa_pairs, self.answer_comparator, self.fallback
+            )
+            if return_detailed_evaluation:
+                outputs.append(
+                    (qa_scores, predicted_answers, reference_answers, per_q_scores)
+                )
+            else:
+                outputs.append(qa_scores)
+        return outputs
+
+    def get_passages(
+        self, sources: list[str] | None, references: list[str] | None
+    ) -> list[str]:
+        """Returns the original passages that the reference answers are computed from."""
+        assert references is not None, "References are required for TREQAScorer"
+        return references
+
+    def get_scores_multi(
+        self,
+        translations_per_system: list[list[str]],
+        sources: list[str] | None = None,
+        references: list[str] | None = None,
+        qa_pairs: list[list[dict]] | None = None,
+        return_detailed_evaluation: bool = False,
+    ):
+        assert qa_pairs is not None, "Must provide QA pairs"
+        passages = self.get_passages(sources, references)
+
+        # Compute QA-based scores
+        questions, predicted_answers_per_system, reference_answers = (
+            self.answer_questions(translations_per_system, passages, qa_pairs)
+        )
+        return self.match_answers(
+            questions,
+            predicted_answers_per_system,
+            reference_answers,
+            passages,
+            qa_pairs,
+            return_detailed_evaluation=return_detailed_evaluation,
+        )
+
+    def close(self):
+        if hasattr(self.answer_comparator, "close"):
+            self.answer_comparator.close()